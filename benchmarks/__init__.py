@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+"""
+Performance benchmarks for the :mod:`floodestimation` package.
+
+Benchmarks are run using `airspeed velocity <https://asv.readthedocs.io>`_ which stores the results as JSON files in the
+`.asv/results` folder so that runs can be compared, for example::
+
+    asv run
+    asv compare HEAD~1 HEAD
+
+Or, to quickly run the benchmarks against the current Python environment::
+
+    asv run --python=same --quick
+
+"""
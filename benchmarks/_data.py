@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fixed synthetic benchmark inputs generated using :mod:`floodestimation.synthetic`.
+"""
+
+import os
+from sqlalchemy.orm import sessionmaker
+from floodestimation import db
+from floodestimation import entities  # Registers tables with `db.Base.metadata`
+from floodestimation import loaders
+from floodestimation.synthetic import SyntheticArchive
+
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'floodestimation', 'tests', 'data')
+SEED = 20160101
+
+
+def write_station_files(folder, n_stations, **options):
+    """
+    Write `n_stations` sets of CD3, AM and PT files to `folder`. All stations have POT data. Any other
+    :class:`SyntheticArchive` options can be provided as keyword arguments.
+    """
+    options.setdefault('pot_fraction', 1)
+    SyntheticArchive(n_stations, seed=SEED, **options).to_folder(folder)
+
+
+def create_db(file_path):
+    """
+    Return a session for a new, empty database at `file_path`.
+    """
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    engine = db.create_sqlite_engine(file_path, journal_mode='wal', synchronous='normal')
+    db.Base.metadata.create_all(engine)
+    db.migrate_db(engine)
+    return sessionmaker(bind=engine)()
+
+
+def create_populated_db(file_path, n_stations):
+    """
+    Create a database file at `file_path` with `n_stations` synthetic stations.
+    """
+    SyntheticArchive(n_stations, seed=SEED).to_sqlite(file_path)
+
+
+def subject_catchment(station='37017'):
+    """
+    Return a gauged subject catchment loaded from the test data.
+    """
+    return loaders.from_file(os.path.join(TEMPLATE_FOLDER, station + '.CD3'))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+from floodestimation.collections import CatchmentCollections
+from floodestimation.analysis import QmedAnalysis, GrowthCurveAnalysis, GrowthCurve
+from .bench_collections import db_session, N_STATIONS
+from ._data import create_populated_db, subject_catchment
+
+
+class AnalysisSuite:
+    """
+    QMED and growth curve analyses using donor catchments from a database with synthetic stations.
+    """
+    timeout = 300
+
+    def setup_cache(self):
+        file_path = os.path.abspath('analysis.sqlite')
+        create_populated_db(file_path, N_STATIONS)
+        return file_path
+
+    def setup(self, file_path):
+        self.session = db_session(file_path)
+        self.collections = CatchmentCollections(self.session, load_data='manual')
+        self.subject = subject_catchment()
+        self.ungauged_subject = subject_catchment()
+        self.ungauged_subject.amax_records = []
+        self.ungauged_subject.pot_dataset = None
+        GrowthCurve('glo', 0.2, 0.1)  # Import `lmoments3` and `scipy` outside the timed code
+
+    def teardown(self, file_path):
+        self.session.close()
+
+    def time_qmed_amax_records(self, file_path):
+        QmedAnalysis(self.subject, year=2000).qmed(method='amax_records')
+
+    def time_qmed_descriptors_with_donors(self, file_path):
+        QmedAnalysis(self.ungauged_subject, self.collections, year=2000).qmed(method='descriptors')
+
+    def time_growth_curve_single_site(self, file_path):
+        GrowthCurveAnalysis(self.subject, year=2000).growth_curve(method='single_site')
+
+    def time_growth_curve_enhanced_single_site(self, file_path):
+        GrowthCurveAnalysis(self.subject, self.collections, year=2000).growth_curve(method='enhanced_single_site')
+
+    def time_growth_curve_pooling_group(self, file_path):
+        GrowthCurveAnalysis(self.ungauged_subject, self.collections, year=2000).growth_curve(method='pooling_group')
+
+
+class GrowthCurveSuite:
+    """
+    Growth curve construction and evaluation.
+    """
+    params = ['glo', 'gev']
+    param_names = ['distr']
+
+    def setup(self, distr):
+        self.growth_curve = GrowthCurve(distr, 0.2, 0.1)
+        self.aeps = np.linspace(0.001, 0.999, 1000)
+
+    def time_construct(self, distr):
+        GrowthCurve(distr, 0.2, 0.1)
+
+    def time_evaluate_single(self, distr):
+        self.growth_curve(0.01)
+
+    def time_evaluate_array(self, distr):
+        self.growth_curve(self.aeps)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import os
+from sqlalchemy.orm import sessionmaker
+from floodestimation import db
+from floodestimation.collections import CatchmentCollections
+from floodestimation.analysis import GrowthCurveAnalysis
+from ._data import create_populated_db, subject_catchment
+
+N_STATIONS = 1000  # Similar to the number of NRFA stations
+
+
+def db_session(file_path):
+    return sessionmaker(bind=db.create_sqlite_engine(file_path, read_only=True))()
+
+
+class CollectionsSuite:
+    """
+    Donor catchment queries against a database with synthetic stations.
+    """
+    timeout = 300
+
+    def setup_cache(self):
+        # Runs once; the database file is kept in the benchmark's working directory
+        file_path = os.path.abspath('collections.sqlite')
+        create_populated_db(file_path, N_STATIONS)
+        return file_path
+
+    def setup(self, file_path):
+        self.session = db_session(file_path)
+        self.collections = CatchmentCollections(self.session, load_data='manual')
+        self.subject = subject_catchment()
+        self.similarity_dist_function = GrowthCurveAnalysis(self.subject)._similarity_distance
+
+    def teardown(self, file_path):
+        self.session.close()
+
+    def time_nearest_qmed_catchments(self, file_path):
+        self.collections.nearest_qmed_catchments(self.subject, limit=6)
+
+    def time_nearest_qmed_catchments_all(self, file_path):
+        self.collections.nearest_qmed_catchments(self.subject)
+
+    def time_most_similar_catchments(self, file_path):
+        self.collections.most_similar_catchments(self.subject, self.similarity_dist_function)
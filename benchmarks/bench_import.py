@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+
+def timeraw_import_floodestimation():
+    """
+    Time to import the package in a fresh interpreter.
+    """
+    return "import floodestimation"
+
+
+def timeraw_import_floodestimation_analysis():
+    """
+    Time to import the analysis module (without lmoments3 and scipy which are imported when first used).
+    """
+    return "import floodestimation.analysis"
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import shutil
+from floodestimation import loaders
+from ._data import write_station_files, create_db
+
+
+class FolderToDbSuite:
+    """
+    Import a folder of station files into a new database.
+    """
+    params = [10, 50]
+    param_names = ['n_stations']
+    number = 1
+    repeat = 5
+    warmup_time = 0
+
+    def setup(self, n_stations):
+        self.folder = tempfile.mkdtemp()
+        write_station_files(os.path.join(self.folder, 'stations'), n_stations)
+        self.session = create_db(os.path.join(self.folder, 'bench.sqlite'))
+
+    def teardown(self, n_stations):
+        self.session.close()
+        self.session.get_bind().dispose()
+        shutil.rmtree(self.folder)
+
+    def time_folder_to_db(self, n_stations):
+        loaders.folder_to_db(os.path.join(self.folder, 'stations'), self.session, autocommit=True)
+
+    def time_folder_to_db_excl_pot(self, n_stations):
+        loaders.folder_to_db(os.path.join(self.folder, 'stations'), self.session, autocommit=True, incl_pot=False)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import shutil
+from floodestimation import parsers
+from ._data import write_station_files
+
+
+class ParserSuite:
+    """
+    Parse a single station's CD3, AM and PT files with short and long records.
+    """
+    params = [20, 200]
+    param_names = ['record_length']
+
+    def setup(self, record_length):
+        self.folder = tempfile.mkdtemp()
+        write_station_files(self.folder, 1, record_length=(record_length, record_length), pot_density=10)
+        self.file_path = os.path.join(self.folder, '1000001')
+
+    def teardown(self, record_length):
+        shutil.rmtree(self.folder)
+
+    def time_cd3_parser(self, record_length):
+        parsers.Cd3Parser().parse(self.file_path + '.CD3')
+
+    def time_amax_parser(self, record_length):
+        parsers.AmaxParser().parse(self.file_path + '.AM')
+
+    def time_pot_parser(self, record_length):
+        parsers.PotParser().parse(self.file_path + '.PT')
+
+    def time_amax_parser_arrays(self, record_length):
+        parsers.AmaxParser(output='arrays').parse(self.file_path + '.AM')
+
+    def time_pot_parser_arrays(self, record_length):
+        parsers.PotParser(output='arrays').parse(self.file_path + '.PT')
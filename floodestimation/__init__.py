@@ -21,8 +21,6 @@ del get_versions
 
 # Current package imports
 from . import db
-# Need to import all entities to create corresponding database tables
+# Need to import all entities to create corresponding database tables. Tables are only created when the database is
+# first used, see :func:`floodestimation.db.get_engine`.
 from .entities import Catchment, AmaxRecord, PotDataset, PotDataGap, PotRecord, Comment, Descriptors
-
-# Create database tables if they don't exist yet
-db.create_db_tables()
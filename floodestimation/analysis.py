@@ -17,15 +17,27 @@
 
 """
 Module containing flood estimation analysis methods, including QMED, growth curves etc.
+
+Analyses do not modify the catchment objects provided to them. Intermediate results are stored in each analysis
+object's :attr:`Analysis.results_log` instead, for example donor catchments are recorded as immutable
+:class:`.QmedDonor` and :class:`.GrowthCurveDonor` records. Analyses sharing the same (donor) catchments can therefore
+run concurrently, provided each thread uses its own database session (see :mod:`floodestimation.collections`).
 """
 from math import log, exp, sqrt, floor, atan
 from datetime import date
+from collections import namedtuple
+from contextlib import contextmanager
 import copy
-import lmoments3 as lm
-import lmoments3.distr as lm_distr
 import numpy as np
 from numpy import linalg
-from scipy import optimize
+# `lmoments3` and `scipy` are slow to import and therefore only imported when first required, i.e. when fitting growth
+# curves. This keeps `import floodestimation` fast.
+# Current package imports
+from .entities import Catchment, CatchmentRecord, CatchmentAnnotation, plain_catchment, distance_matrix
+from .instrumentation import Instrumentation, NULL_INSTRUMENTATION, instrumented
+from .cache import cached
+from .collections import NearbyCatchment
+from . import correlation
 
 
 def valid_flows_array(catchment):
@@ -40,17 +52,169 @@ def valid_flows_array(catchment):
     return np.array([record.flow for record in catchment.amax_records if record.flag == 0])
 
 
+def qmed_from_pot_datasets(pot_datasets):
+    """
+    Return QMED estimates based on peaks-over-threshold (POT) records for multiple POT datasets at once. The
+    complete-year selection and the QMED interpolation are carried out for all datasets together using array
+    operations. This is equivalent to :meth:`QmedAnalysis.qmed` with `method='pot_records'` for each dataset.
+
+    For example, to estimate QMED for every station with a POT dataset:
+
+    >>> from sqlalchemy.orm import subqueryload
+    >>> pot_datasets = db_session.query(PotDataset).options(subqueryload(PotDataset.pot_records),
+    ...                                                     subqueryload(PotDataset.pot_data_gaps)).all()
+    >>> qmeds = qmed_from_pot_datasets(pot_datasets)
+
+    Methodology source: FEH, Vol. 3, pp. 77-78
+
+    :param pot_datasets: POT datasets (records and meta data)
+    :type pot_datasets: list of :class:`floodestimation.entities.PotDataset`
+    :return: QMED in m³/s for each dataset, `nan` where there are insufficient POT records
+    :rtype: :class:`numpy.ndarray`
+    """
+    selection = _PotSelection(pot_datasets)
+    n_datasets = len(selection.n_years)
+
+    # Records from complete years only, sorted by dataset and then by flow in descending order
+    flows = selection.record_flows[selection.record_mask]
+    datasets = selection.record_datasets[selection.record_mask]
+    order = np.lexsort((-flows, datasets))
+    flows = flows[order]
+    n_records = np.bincount(datasets, minlength=n_datasets)
+    first_record = np.cumsum(n_records) - n_records
+
+    position = 0.790715789 * selection.n_years + 0.539684211
+    i = np.floor(position).astype(int)
+    w = 1 + i - position  # This is equivalent to table 12.1!
+
+    result = np.full(n_datasets, np.nan)
+    valid = (selection.n_years >= 1) & (i < n_records)
+    index = first_record[valid] + i[valid]
+    result[valid] = w[valid] * flows[index - 1] + (1 - w[valid]) * flows[index]
+    return result
+
+
+class _PotSelection(object):
+    """
+    Selection of POT records in complete years for one or more POT datasets.
+
+    Months are represented as integers (months since January 1970, i.e. `datetime64[M]`). A calendar month is covered
+    by the record if there is at least a single day of the month in any continuous period. Only the most recent
+    years are used such that each calendar month is covered an equal number of times; "leftover" months at the
+    beginning of the record are excluded.
+    """
+
+    def __init__(self, pot_datasets):
+        period_starts, period_ends, period_datasets = [], [], []
+        record_dates, record_flows, record_datasets = [np.empty(0, dtype='datetime64[D]')], [np.empty(0)], []
+        n_datasets = 0
+        for i, pot_dataset in enumerate(pot_datasets):
+            n_datasets += 1
+            if pot_dataset.start_date is None or pot_dataset.end_date is None:
+                continue
+            for period in pot_dataset.continuous_periods():
+                period_starts.append(period.start_date)
+                period_ends.append(period.end_date)
+                period_datasets.append(i)
+            dates, flows, stages = pot_dataset.record_arrays()
+            record_dates.append(dates)
+            record_flows.append(flows)
+            record_datasets.append(np.full(len(flows), i))
+
+        #: Number of times each calendar month is covered for each dataset (2D array with 12 columns)
+        self.month_counts = np.zeros((n_datasets, 12), dtype=int)
+        #: Number of complete years for each dataset
+        self.n_years = np.zeros(n_datasets, dtype=int)
+        #: POT record flows of all datasets
+        self.record_flows = np.concatenate(record_flows)
+        #: Index of dataset for each POT record
+        self.record_datasets = np.concatenate(record_datasets or [np.empty(0, dtype=int)])
+        #: Whether each POT record is within the complete years
+        self.record_mask = np.zeros(len(self.record_flows), dtype=bool)
+        if not period_starts:
+            return
+
+        # Expand each continuous period into the months it covers
+        starts = _months(period_starts)
+        lengths = np.clip(_months(period_ends) - starts + 1, 0, None)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        months = np.repeat(starts, lengths) + offsets
+        record_months = np.concatenate(record_dates).astype('datetime64[M]').astype(np.int64)
+
+        # Unique key for each combination of dataset and month, sorted by dataset and then by month
+        first_month = min(months.min(), record_months.min(initial=months.min()))
+        n_months = max(months.max(), record_months.max(initial=months.max())) - first_month + 1
+        covered = np.sort(np.repeat(period_datasets, lengths) * n_months + months - first_month)
+        covered = covered[np.diff(covered, prepend=-1) != 0]  # Periods can share a month at either end of a gap
+        covered_datasets = covered // n_months
+        groups = covered_datasets * 12 + (covered % n_months + first_month) % 12  # Dataset and calendar month
+
+        # Month coverage histogram and number of complete years
+        group_counts = np.bincount(groups, minlength=n_datasets * 12)
+        self.month_counts = group_counts.reshape((n_datasets, 12))
+        self.n_years = self.month_counts.min(axis=1)
+
+        # Within each dataset and calendar month, keep the last `n_years` covered months only
+        order = np.argsort(groups, kind='stable')
+        groups = groups[order]
+        rank = np.arange(len(groups)) - (np.cumsum(group_counts) - group_counts)[groups]
+        from_end = group_counts[groups] - rank
+        use = from_end <= self.n_years[covered_datasets[order]]
+        selected = covered[order][use]
+
+        record_keys = self.record_datasets * n_months + record_months - first_month
+        self.record_mask = np.isin(record_keys, selected)
+
+
+def _months(dates):
+    """
+    Return array of months since January 1970 for a list of dates.
+    """
+    return np.array(dates, dtype='datetime64[M]').astype(np.int64)
+
+
+class QmedDonor(CatchmentAnnotation, namedtuple('QmedDonor', ['catchment', 'dist', 'weight', 'factor'])):
+    """
+    Donor catchment used in a QMED analysis, including distance (`dist`) to the subject catchment in km, the donor
+    weighting (`weight`) and the donor's adjustment `factor`.
+    """
+    __slots__ = ()
+
+
+class GrowthCurveDonor(CatchmentAnnotation, namedtuple('GrowthCurveDonor', ['catchment', 'similarity_dist',
+                                                                            'l_cv', 'l_cv_weight',
+                                                                            'l_skew', 'l_skew_weight'])):
+    """
+    Donor catchment used in a growth curve analysis, including similarity distance (`similarity_dist`), the donor's
+    L-CV and L-SKEW and their weightings.
+    """
+    __slots__ = ()
+
+
+def _subject_catchment(catchment):
+    # Catchment object from a catchment or catchment record
+    if isinstance(catchment, CatchmentRecord):
+        return Catchment.from_record(catchment, pot_output='arrays')
+    return catchment
+
+
 class Analysis(object):
     """
     Generic analysis object
     """
 
-    def __init__(self, year=None, results_log=None):
+    def __init__(self, year=None, results_log=None, instrument=False, cache=None):
         """
         :param year: Year to base analysis on. Default: current year.
         :type year: float
         :param results_log: Dict to store intermediate results
         :type results_log: dict
+        :param instrument: Whether to record timings, SQL statement counts etc. in `results_log['instrumentation']`, see
+                           :mod:`floodestimation.instrumentation`. Default: `False`.
+        :type instrument: bool
+        :param cache: Cache to return results from instead of repeating the analysis, see
+                      :mod:`floodestimation.cache`. Default: `None` (no caching).
+        :type cache: :class:`floodestimation.cache.ResultCache`
         """
 
         self.year = year or date.today().year
@@ -60,6 +224,28 @@ class Analysis(object):
         else:
             self.results_log = {}
 
+        if instrument:
+            self.instrumentation = Instrumentation()
+            self.results_log['instrumentation'] = self.instrumentation
+        else:
+            self.instrumentation = NULL_INSTRUMENTATION
+
+        #: Cache of analysis results, if any
+        self.cache = cache
+
+    @contextmanager
+    def _years(self, years):
+        """
+        Context manager temporarily setting :attr:`year` to an array of years such that urban adjustments are
+        calculated for all years at once.
+        """
+        year = self.year
+        self.year = years
+        try:
+            yield
+        finally:
+            self.year = year
+
 
 class QmedAnalysis(Analysis):
     """
@@ -79,19 +265,21 @@ class QmedAnalysis(Analysis):
     # : Methods available to estimate QMED, in order of best/preferred method
     methods = ('amax_records', 'pot_records', 'descriptors', 'descriptors_1999', 'area', 'channel_width')
 
-    def __init__(self, catchment, gauged_catchments=None, year=None, results_log=None):
+    def __init__(self, catchment, gauged_catchments=None, year=None, results_log=None, instrument=False, cache=None):
         """
-        :param catchment: subject catchment
-        :type catchment: :class:`.entities.Catchment`
+        :param catchment: subject catchment, or its data as returned by :meth:`.entities.Catchment.to_record`
+        :type catchment: :class:`.entities.Catchment` or :class:`.entities.CatchmentRecord`
         :param gauged_catchments: catchment collections objects for retrieval of gauged data for donor analyses
         :type gauged_catchments: :class:`.collections.CatchmentCollections`
         """
-        Analysis.__init__(self, year, results_log)
+        Analysis.__init__(self, year, results_log, instrument, cache)
 
-        self.catchment = catchment
+        self.catchment = _subject_catchment(catchment)
         self.gauged_catchments = gauged_catchments
 
-    def qmed(self, method='best', **method_options):
+    @instrumented('qmed')
+    @cached('qmed', donor_methods=('best', 'descriptors', 'descriptors_2008'))
+    def qmed(self, method='best', years=None, **method_options):
         """
         Return QMED estimate using best available methodology depending on what catchment attributes are available.
 
@@ -117,14 +305,32 @@ class QmedAnalysis(Analysis):
         `channel_width`   n/a                     Emperical regression method using the river channel width only.
         ================= ======================= ======================================================================
 
+        To estimate QMED for many years at once, e.g. to evaluate the effect of urbanisation, provide an array of
+        `years` instead of setting :attr:`year`. The rural estimate and any donor adjustment are calculated once and
+        the urban adjustment is applied for each year. Intermediate results in :attr:`results_log` which depend on the
+        year are then arrays as well.
+
         :param method: methodology to use to estimate QMED. Default: automatically choose best method.
         :type method: str
+        :param years: Array of years to estimate QMED for. Default: `None` (estimate for :attr:`year` only).
+        :type years: list or :class:`numpy.ndarray`
         :param method_options: any optional parameters for the QMED method function, e.g. `as_rural=True`
         :type method_options: kwargs
 
-        :return: QMED in m³/s
-        :rtype: float
+        :return: QMED in m³/s (array with a value for each year if `years` is provided)
+        :rtype: float or :class:`numpy.ndarray`
         """
+        if years is None:
+            return self._qmed(method, **method_options)
+
+        years = np.asarray(years, dtype=float)
+        with self._years(years):
+            result = self._qmed(method, **method_options)
+        if result is None:
+            return None
+        return np.broadcast_to(result, years.shape).astype(float)  # Some methods do not depend on the year
+
+    def _qmed(self, method='best', **method_options):
         if method == 'best':
             # Rules for gauged catchments
             if self.catchment.pot_dataset:
@@ -212,44 +418,22 @@ class QmedAnalysis(Analysis):
             raise InsufficientDataError("POT dataset must be set for catchment {} to estimate QMED from POT data."
                                         .format(self.catchment.id))
 
-        complete_year_records, length = self._complete_pot_years(pot_dataset)
-        if length < 1:
+        qmed = qmed_from_pot_datasets([pot_dataset])[0]
+        if np.isnan(qmed):
             raise InsufficientDataError("Insufficient POT flow records available for catchment {}."
                                         .format(self.catchment.id))
-
-        position = 0.790715789 * length + 0.539684211
-        i = floor(position)
-        w = 1 + i - position  # This is equivalent to table 12.1!
-
-        flows = [record.flow for record in complete_year_records]
-        flows.sort(reverse=True)
-
-        return w * flows[i - 1] + (1 - w) * flows[i]
+        return qmed
 
     def _pot_month_counts(self, pot_dataset):
         """
-        Return a list of 12 sets. Each sets contains the years included in the POT record period.
+        Return an array of 12 integers: the number of times each calendar month (January to December) is covered by
+        the POT record period.
 
         :param pot_dataset: POT dataset (records and meta data)
         :type pot_dataset: :class:`floodestimation.entities.PotDataset`
+        :rtype: :class:`numpy.ndarray`
         """
-        periods = pot_dataset.continuous_periods()
-        result = [set() for x in range(12)]
-        for period in periods:
-            year = period.start_date.year
-            month = period.start_date.month
-            while True:
-                # Month by month, add the year
-                result[month - 1].add(year)
-                # If at end of period, break loop
-                if year == period.end_date.year and month == period.end_date.month:
-                    break
-                # Next month (and year if needed)
-                month += 1
-                if month == 13:
-                    month = 1
-                    year += 1
-        return result
+        return _PotSelection([pot_dataset]).month_counts[0]
 
     def _complete_pot_years(self, pot_dataset):
         """
@@ -266,18 +450,9 @@ class QmedAnalysis(Analysis):
         :return: list of POT records
         :rtype: list of :class:`floodestimation.entities.PotRecord`
         """
-        # Create a list of 12 sets, one for each month. Each set represents the years for which the POT record includes
-        # a particular month.
-        month_counts = self._pot_month_counts(pot_dataset)
-        # Number of complete years
-        n = min([len(month) for month in month_counts])
-        # Use the last available years only such that there are equal numbers of each month; i.e. part years are
-        # excluded at the beginning of the record
-        years_to_use = [sorted(month)[-n:] for month in month_counts]
-        return (
-            [record for record in pot_dataset.pot_records if record.date.year in years_to_use[record.date.month - 1]],
-            n
-        )
+        selection = _PotSelection([pot_dataset])
+        records = [record for record, use in zip(pot_dataset.pot_records, selection.record_mask) if use]
+        return records, int(selection.n_years[0])
 
     def _area_exponent(self):
         """
@@ -356,6 +531,7 @@ class QmedAnalysis(Analysis):
         """
         return self._qmed_from_descriptors_2008(**method_options)
 
+    @instrumented('descriptors_2008')
     def _qmed_from_descriptors_2008(self, as_rural=False, donor_catchments=None):
         """
         Return QMED estimation based on FEH catchment descriptors, 2008 methodology.
@@ -396,10 +572,9 @@ class QmedAnalysis(Analysis):
                 qmed_rural = exp(lnqmed_rural)
 
                 # Log intermediate results
-                self.results_log['donors'] = donor_catchments
-                for i, donor in enumerate(self.results_log['donors']):
-                    donor.weight = weights[i]
-                    donor.factor = exp(errors[i])
+                self.results_log['donors'] = [QmedDonor(plain_catchment(donor), self._donor_dist(donor),
+                                                        weights[i], exp(errors[i]))
+                                              for i, donor in enumerate(donor_catchments)]
                 self.results_log['donor_adj_factor'] = exp(correction)
                 self.results_log['qmed_adj_rural'] = qmed_rural
 
@@ -424,6 +599,7 @@ class QmedAnalysis(Analysis):
         return 1 + 0.47 * self.catchment.descriptors.urbext(self.year) \
                    * self.catchment.descriptors.bfihost / (1 - self.catchment.descriptors.bfihost)
 
+    @instrumented('urban_adjustment')
     def urban_adj_factor(self):
         """
         Return urban adjustment factor (UAF) used to adjust QMED and growth curves.
@@ -471,7 +647,7 @@ class QmedAnalysis(Analysis):
         :rtype: float
         """
         dist = catchment1.distance_to(catchment2)
-        return self._dist_corr(dist, 0.3998, 0.0283, 0.9494)
+        return self._dist_corr(dist, *correlation.MODEL_ERROR_PHI)
 
     def _lnqmed_corr(self, catchment1, catchment2):
         """
@@ -487,7 +663,7 @@ class QmedAnalysis(Analysis):
         :rtype: float
         """
         dist = catchment1.distance_to(catchment2)
-        return self._dist_corr(dist, 0.2791, 0.0039, 0.0632)
+        return self._dist_corr(dist, *correlation.LNQMED_PHI)
 
     def _vec_b(self, donor_catchments):
         """
@@ -524,7 +700,28 @@ class QmedAnalysis(Analysis):
                  + 0.1065 * log(catchment.descriptors.bfihost)
         return exp(lnbeta)
 
-    def _matrix_sigma_eta(self, donor_catchments):
+    def _donor_correlation(self, donor_catchments):
+        """
+        Return precomputed model error and ln(QMED) correlation matrices between donor catchments or `None` if not
+        available, see :mod:`floodestimation.correlation`.
+
+        :param donor_catchments: Catchments to use as donors
+        :type donor_catchments: list of :class:`Catchment`
+        :return: model error and ln(QMED) correlation matrices
+        :rtype: tuple of :class:`numpy.ndarray`
+        """
+        if self.gauged_catchments is None:
+            return None
+        matrices = self.gauged_catchments.donor_correlation()
+        if matrices is None:
+            return None
+        indices = matrices.indices(donor_catchments)
+        if indices is None:
+            return None  # Not all donors included, e.g. manually set donors
+        subset = np.ix_(indices, indices)
+        return matrices.model_error_corr[subset], matrices.lnqmed_corr[subset]
+
+    def _matrix_sigma_eta(self, donor_catchments, corr=None):
         """
         Return model error coveriance matrix Sigma eta
 
@@ -532,18 +729,24 @@ class QmedAnalysis(Analysis):
 
         :param donor_catchments: Catchments to use as donors
         :type donor_catchments: list of :class:`Catchment`
+        :param corr: Precomputed model error correlation matrix. Default: `None` (calculated).
+        :type corr: :class:`numpy.ndarray`
         :return: 2-Dimensional, symmetric covariance matrix
         :rtype: :class:`numpy.ndarray`
         """
         p = len(donor_catchments)
         sigma = 0.1175 * np.ones((p, p))
+        if corr is not None:
+            sigma *= corr
+            np.fill_diagonal(sigma, 0.1175)
+            return sigma
         for i in range(p):
             for j in range(p):
                 if i != j:
                     sigma[i, j] *= self._model_error_corr(donor_catchments[i], donor_catchments[j])
         return sigma
 
-    def _matrix_sigma_eps(self, donor_catchments):
+    def _matrix_sigma_eps(self, donor_catchments, corr=None):
         """
         Return sampling error coveriance matrix Sigma eta
 
@@ -551,6 +754,8 @@ class QmedAnalysis(Analysis):
 
         :param donor_catchments: Catchments to use as donors
         :type donor_catchments: list of :class:`Catchment`
+        :param corr: Precomputed ln(QMED) correlation matrix. Default: `None` (calculated).
+        :type corr: :class:`numpy.ndarray`
         :return: 2-Dimensional, symmetric covariance matrix
         :rtype: :class:`numpy.ndarray`
         """
@@ -562,15 +767,27 @@ class QmedAnalysis(Analysis):
             for j in range(p):
                 beta_j = self._beta(donor_catchments[j])
                 n_j = donor_catchments[j].amax_records_end() - donor_catchments[j].amax_records_start() + 1
-                rho_ij = self._lnqmed_corr(donor_catchments[i], donor_catchments[j])
+                if corr is None:
+                    rho_ij = self._lnqmed_corr(donor_catchments[i], donor_catchments[j])
+                else:
+                    rho_ij = corr[i, j]
                 n_ij = min(donor_catchments[i].amax_records_end(), donor_catchments[j].amax_records_end()) - \
                        max(donor_catchments[i].amax_records_start(), donor_catchments[j].amax_records_start()) + 1
                 sigma[i, j] = 4 * beta_i * beta_j * n_ij / n_i / n_j * rho_ij
         return sigma
 
     def _matrix_omega(self, donor_catchments):
-        return self._matrix_sigma_eta(donor_catchments) + self._matrix_sigma_eps(donor_catchments)
-
+        corr = self._donor_correlation(donor_catchments)
+        if corr is None:
+            # Calculate correlations between all donors at once from the raw centroid coordinates
+            dist = distance_matrix(donor_catchments)
+            corr = correlation.dist_corr(dist, *correlation.MODEL_ERROR_PHI), \
+                correlation.dist_corr(dist, *correlation.LNQMED_PHI)
+        model_error_corr, lnqmed_corr = corr
+        return self._matrix_sigma_eta(donor_catchments, model_error_corr) + \
+            self._matrix_sigma_eps(donor_catchments, lnqmed_corr)
+
+    @instrumented('matrix_solve')
     def _vec_alpha(self, donor_catchments):
         """
         Return vector alpha which is the weights for donor model errors
@@ -599,6 +816,7 @@ class QmedAnalysis(Analysis):
         logmedian_descr = log(analysis.qmed(method='descriptors'))
         return logmedian_amax - logmedian_descr
 
+    @instrumented('residuals')
     def _vec_lnqmed_residuals(self, catchments):
         """
         Return ln(QMED) model errors for a list of catchments
@@ -613,6 +831,13 @@ class QmedAnalysis(Analysis):
             result[index] = self._lnqmed_residual(donor)
         return result
 
+    def _donor_dist(self, donor):
+        # Distance in km between subject and donor catchment, as returned by the donor catchment query if available
+        if isinstance(donor, NearbyCatchment):
+            return donor.dist
+        return self.catchment.distance_to(donor)
+
+    @instrumented('donors')
     def find_donor_catchments(self, limit=6, dist_limit=500):
         """
         Return a suitable donor catchment to improve a QMED estimate based on catchment descriptors alone.
@@ -642,23 +867,30 @@ class GrowthCurveAnalysis(Analysis):
     #: Available distribution functions for growth curves
     distributions = ('glo', 'gev')
 
-    def __init__(self, catchment, gauged_catchments=None, year=None, results_log=None):
+    def __init__(self, catchment, gauged_catchments=None, year=None, results_log=None, instrument=False, cache=None):
         """
-        :param catchment: subject catchment
-        :type catchment: :class:`.entities.Catchment`
+        :param catchment: subject catchment, or its data as returned by :meth:`.entities.Catchment.to_record`
+        :type catchment: :class:`.entities.Catchment` or :class:`.entities.CatchmentRecord`
         :param gauged_catchments: catchment collections objects for retrieval of gauged data for donor analyses
         :type gauged_catchments: :class:`.collections.CatchmentCollections`
         """
-        Analysis.__init__(self, year, results_log)
+        Analysis.__init__(self, year, results_log, instrument, cache)
 
-        self.catchment = catchment
-        self.gauged_cachments = gauged_catchments
+        self.catchment = _subject_catchment(catchment)
+        self.gauged_catchments = gauged_catchments
 
         #: List of donor catchments. Either set manually or by calling
         #: :meth:`.GrowthCurveAnalysis.find_donor_catchments` or implicitly when calling :meth:`.growth_curve()`.
         self.donor_catchments = []
 
-    def growth_curve(self, method='best', **method_options):
+    @property
+    def gauged_cachments(self):
+        # Misspelt attribute name used by earlier versions
+        return self.gauged_catchments
+
+    @instrumented('growth_curve')
+    @cached('growth_curve', donor_methods=('best', 'enhanced_single_site', 'pooling_group'))
+    def growth_curve(self, method='best', years=None, **method_options):
         """
         Return QMED estimate using best available methodology depending on what catchment attributes are available.
 
@@ -673,14 +905,30 @@ class GrowthCurveAnalysis(Analysis):
                                `as_rural=False`
         ====================== ====================== ==================================================================
 
+        To estimate growth curves for many years at once, provide an array of `years` instead of setting :attr:`year`.
+        Donor catchments and rural L-moments are calculated once and the urban adjustment is applied for each year.
+
         :param method: methodology to use to estimate the growth curve. Default: automatically choose best method.
         :type method: str
+        :param years: Array of years to estimate growth curves for. Default: `None` (estimate for :attr:`year` only).
+        :type years: list or :class:`numpy.ndarray`
         :param method_options: any optional parameters for the growth curve method function
         :type method_options: kwargs
         :return: Inverse cumulative distribution function, callable class with one parameter `aep` (annual exceedance
-                 probability)
-        :type: :class:`.GrowthCurve`
+                 probability). A list with a growth curve for each year if `years` is provided.
+        :type: :class:`.GrowthCurve` or list of :class:`.GrowthCurve`
         """
+        if years is None:
+            return self._growth_curve(method, **method_options)
+
+        years = np.asarray(years, dtype=float)
+        with self._years(years):
+            result = self._growth_curve(method, **method_options)
+        if isinstance(result, GrowthCurve):
+            return [result] * len(years)  # Growth curve does not depend on the year
+        return result
+
+    def _growth_curve(self, method='best', **method_options):
         if method == 'best':
             if self.catchment.amax_records:
                 # Gauged catchment, use enhanced single site
@@ -710,6 +958,7 @@ class GrowthCurveAnalysis(Analysis):
         flows = valid_flows_array(catchment)
         return flows / np.median(flows)
 
+    @instrumented('l_moments')
     def _var_and_skew(self, catchments, as_rural=False):
         """
         Calculate L-CV and L-SKEW from a single catchment or a pooled group of catchments.
@@ -754,15 +1003,12 @@ class GrowthCurveAnalysis(Analysis):
                 l_skew = (l_skew_rural + 1) * 1.1545 ** self.catchment.descriptors.urbext(self.year) - 1
 
             # Record intermediate results (donors)
-            self.results_log['donors'] = catchments
-            total_record_length = 0
-            for index, donor in enumerate(self.results_log['donors']):
-                donor.l_cv = l_cvs[index]
-                donor.l_cv_weight = l_cv_weights[index]
-                donor.l_skew = l_skews[index]
-                donor.l_skew_weight = l_skew_weights[index]
-                total_record_length += donor.record_length
-            self.results_log['donors_record_length'] = total_record_length
+            self.results_log['donors'] = [GrowthCurveDonor(plain_catchment(donor),
+                                                           self._donor_similarity_dist(donor),
+                                                           l_cvs[index], l_cv_weights[index],
+                                                           l_skews[index], l_skew_weights[index])
+                                          for index, donor in enumerate(catchments)]
+            self.results_log['donors_record_length'] = sum(donor.record_length for donor in catchments)
 
         # Record intermediate results
         self.results_log['l_cv'] = l_cv
@@ -775,6 +1021,8 @@ class GrowthCurveAnalysis(Analysis):
 
         Methodology source: Science Report SC050050, para. 6.7.5
         """
+        import lmoments3 as lm
+
         z = self._dimensionless_flows(catchment)
         l1, l2, t3 = lm.lmom_ratios(z, nmom=3)
         return l2 / l1, t3
@@ -785,14 +1033,21 @@ class GrowthCurveAnalysis(Analysis):
 
         Methodology source: Science Report SC050050, eqn. 6.18 and 6.22a
         """
-        try:
-            dist = donor_catchment.similarity_dist
-        except AttributeError:
-            dist = self._similarity_distance(self.catchment, donor_catchment)
+        dist = self._donor_similarity_dist(donor_catchment)
         b = 0.0047 * sqrt(dist) + 0.0023 / 2
         c = 0.02609 / (donor_catchment.record_length - 1)
         return 1 / (b + c)
 
+    def _donor_similarity_dist(self, donor_catchment):
+        """
+        Return similarity distance between subject catchment and donor catchment, using the distance already calculated
+        when selecting the donors if available.
+        """
+        try:
+            return donor_catchment.similarity_dist
+        except AttributeError:
+            return self._similarity_distance(self.catchment, donor_catchment)
+
     def _l_cv_weight_factor(self):
         """
         Return multiplier for L-CV weightings in case of enhanced single site analysis.
@@ -809,10 +1064,7 @@ class GrowthCurveAnalysis(Analysis):
 
         Methodology source: Science Report SC050050, eqn. 6.19 and 6.22b
         """
-        try:
-            dist = donor_catchment.similarity_dist
-        except AttributeError:
-            dist = self._similarity_distance(self.catchment, donor_catchment)
+        dist = self._donor_similarity_dist(donor_catchment)
         b = 0.0219 * (1 - exp(-dist / 0.2360))
         c = 0.2743 / (donor_catchment.record_length - 2)
         return 1 / (b + c)
@@ -826,7 +1078,8 @@ class GrowthCurveAnalysis(Analysis):
         """
         if self.catchment.amax_records:
             self.donor_catchments = []
-            return GrowthCurve(distr, *self._var_and_skew(self.catchment))
+            var, skew = self._var_and_skew(self.catchment)
+            return self._fit_growth_curve(distr, var, skew)
         else:
             raise InsufficientDataError("Catchment's `amax_records` must be set for a single site analysis.")
 
@@ -841,12 +1094,8 @@ class GrowthCurveAnalysis(Analysis):
         """
         if not self.donor_catchments:
             self.find_donor_catchments()
-        gc = GrowthCurve(distr, *self._var_and_skew(self.donor_catchments))
-
-        # Record intermediate results
-        self.results_log['distr_name'] = distr.upper()
-        self.results_log['distr_params'] = gc.params
-        return gc
+        var, skew = self._var_and_skew(self.donor_catchments)
+        return self._fit_growth_curve(distr, var, skew)
 
     def _growth_curve_enhanced_single_site(self, distr='glo', as_rural=False):
         """
@@ -859,12 +1108,33 @@ class GrowthCurveAnalysis(Analysis):
         """
         if not self.donor_catchments:
             self.find_donor_catchments(include_subject_catchment='force')
-        gc =  GrowthCurve(distr, *self._var_and_skew(self.donor_catchments))
+        var, skew = self._var_and_skew(self.donor_catchments)
+        return self._fit_growth_curve(distr, var, skew)
+
+    @instrumented('distribution_fit')
+    def _fit_growth_curve(self, distr, var, skew):
+        """
+        Return growth curve fitted to L-CV and L-SKEW. If these are arrays (one value for each year), return a list of
+        growth curves. Identical L-moments are fitted once only.
+        """
+        if np.ndim(var) == 0 and np.ndim(skew) == 0:
+            gc = GrowthCurve(distr, var, skew)
+            result = gc
+            params = gc.params
+        else:
+            fitted = {}
+            result = []
+            for var_i, skew_i in zip(*np.broadcast_arrays(var, skew)):
+                key = (float(var_i), float(skew_i))
+                if key not in fitted:
+                    fitted[key] = GrowthCurve(distr, *key)
+                result.append(fitted[key])
+            params = [gc.params for gc in result]
 
         # Record intermediate results
         self.results_log['distr_name'] = distr.upper()
-        self.results_log['distr_params'] = gc.params
-        return gc
+        self.results_log['distr_params'] = params
+        return result
 
     #: Dict of weighting factors and standard deviation for catchment descriptors to use in calculating the similarity
     #: distance measure between the subject catchment and each donor catchment. The dict is structured like this:
@@ -894,14 +1164,16 @@ class GrowthCurveAnalysis(Analysis):
                 dist_sq += float('inf')
         return sqrt(dist_sq)
 
+    @instrumented('donors')
     def find_donor_catchments(self, include_subject_catchment='auto'):
         """
         Find list of suitable donor cachments, ranked by hydrological similarity distance measure. This method is
         implicitly called when calling the :meth:`.growth_curve` method unless the attribute :attr:`.donor_catchments`
         is set manually.
 
-        The results are stored in :attr:`.donor_catchments`. The (list of)
-        :class:`floodestimation.entities.Catchment` will have an additional attribute :attr:`similarity_dist`.
+        The results are stored in :attr:`.donor_catchments` as a list of
+        :class:`floodestimation.collections.SimilarCatchment` records with attributes :attr:`catchment` and
+        :attr:`similarity_dist`.
 
         :param include_subject_catchment: - `auto`: include subject catchment if suitable for pooling and if urbext2000
                                             < 0.03
@@ -911,8 +1183,8 @@ class GrowthCurveAnalysis(Analysis):
         """
 
         # Only if we have access to db with gauged catchment data
-        if self.gauged_cachments:
-            self.donor_catchments = self.gauged_cachments. \
+        if self.gauged_catchments:
+            self.donor_catchments = self.gauged_catchments. \
                 most_similar_catchments(subject_catchment=self.catchment,
                                         similarity_dist_function=lambda c1, c2: self._similarity_distance(c1, c2),
                                         include_subject_catchment=include_subject_catchment)
@@ -945,6 +1217,8 @@ class GrowthCurve():
 
     """
     def __init__(self, distr, var, skew, kurtosis=None):
+        import lmoments3.distr as lm_distr
+
         #: Statistical distribution function abbreviation, e.g. 'glo', 'gev'. Any supported by the :mod:`lmoments3`
         #: package can be used.
         self.distr = distr
@@ -970,10 +1244,23 @@ class GrowthCurve():
     def __call__(self, aep):
         return self.distr_f.ppf(1 - np.array(aep), **self.params)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['distr_f']  # Restored using the distribution's name
+        return state
+
+    def __setstate__(self, state):
+        import lmoments3.distr as lm_distr
+
+        self.__dict__.update(state)
+        self.distr_f = getattr(lm_distr, self.distr)
+
     def _solve_location_param(self):
         """
         We're lazy here and simply iterate to find the location parameter such that growth_curve(0.5)=1.
         """
+        from scipy import optimize
+
         params = copy.copy(self.params)
         del params['loc']
 
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2015  Florenz A.P. Hollebrandse <f.a.p.hollebrandse@protonmail.ch>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module runs full flood estimation analyses (QMED, growth curve and flood frequency curve) for a batch of subject
+catchments using a pool of worker processes.
+
+Subject catchments are read from either a folder of ``.CD3`` or ``.xml`` files (any ``.AM`` and ``.PT`` files are
+loaded as well, see :func:`floodestimation.loaders.from_file`) or a ``.csv`` file with one catchment per row. Column
+names in the csv file are catchment attributes (`id`, `location`, `watercourse`, `country`, `area`, `channel_width`)
+or catchment descriptors (e.g. `dtm_area`, `saar`, `centroid_ngr_x`, `centroid_ngr_y`).
+
+Each worker process opens the gauged catchments database in read-only mode or, optionally, uses an in-memory copy
+(snapshot) of the database. Results are written as soon as each analysis has completed, either as csv or as JSON lines.
+Analyses that fail are reported in the `error` field of the results without stopping the batch.
+
+The batch can be run from the command line, for example::
+
+    floodestimation-batch subject_catchments/ --output results.csv --workers 4
+
+or from Python::
+
+    from floodestimation import batch
+
+    with open('results.csv', 'w', newline='') as f:
+        batch.run('subject_catchments/', f, workers=4)
+
+Catchment objects already in memory, e.g. from a database, can be analysed as well. These are passed to the workers as
+compact, detached records (see :meth:`floodestimation.entities.Catchment.to_record`)::
+
+    with open('results.csv', 'w', newline='') as f:
+        batch.run(batch.catchment_sources(catchments), f, workers=4)
+
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import traceback
+from urllib.request import pathname2url
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+# Current package imports
+from . import db
+from . import loaders
+from . import correlation
+from .settings import config
+from .entities import Catchment, CatchmentRecord, Descriptors, Point
+from .collections import CatchmentCollections
+from .analysis import QmedAnalysis, GrowthCurveAnalysis, InsufficientDataError
+
+#: Annual exceedance probabilities for which flood flows are reported by default
+STANDARD_AEPS = (0.5, 0.2, 0.1, 0.04, 0.02, 0.01, 0.005, 0.001)
+
+#: Supported output formats
+OUTPUT_FORMATS = ('csv', 'jsonl')
+
+# Catchment file extensions supported by :func:`floodestimation.loaders.from_file`
+_CATCHMENT_FILE_EXTS = ('.cd3', '.xml')
+
+# Catchment attributes which can be set from a csv input file
+_CATCHMENT_ATTRS = ('id', 'location', 'watercourse', 'country', 'area', 'channel_width')
+
+# Point attributes which can be set from a csv input file using the columns `<name>_x` and `<name>_y`
+_POINT_ATTRS = {'point': Catchment, 'centroid_ngr': Descriptors, 'ihdtm_ngr': Descriptors}
+
+# Database session used by the analyses in a worker process, see :func:`_init_worker`
+_worker_session = None
+_worker_donor_correlation = None
+
+
+def subject_sources(path):
+    """
+    Return a list of subject catchment sources from a folder or csv file.
+
+    Each source is a tuple of `(site, source)` where `site` is a label identifying the subject catchment and `source`
+    is either a file path or a `dict` of csv values. Sources are simple Python objects and can therefore be passed to
+    worker processes.
+
+    :param path: Folder with ``.CD3`` or ``.xml`` files or a ``.csv`` file
+    :type path: str
+    :return: List of `(site, source)` tuples
+    :rtype: list
+    """
+    if os.path.isdir(path):
+        file_paths = sorted(os.path.join(dp, f) for dp, dn, filenames in os.walk(path)
+                            for f in filenames if os.path.splitext(f)[1].lower() in _CATCHMENT_FILE_EXTS)
+        return [(os.path.splitext(os.path.relpath(file_path, path))[0], file_path) for file_path in file_paths]
+    elif os.path.splitext(path)[1].lower() == '.csv':
+        with open(path, newline='') as csv_file:
+            return [(row.get('id') or str(i), row) for i, row in enumerate(csv.DictReader(csv_file), start=1)]
+    else:
+        raise ValueError("Input `{}` must be a folder or a .csv file.".format(path))
+
+
+def catchment_sources(catchments):
+    """
+    Return a list of subject catchment sources from catchment objects, see :func:`subject_sources`. Each catchment is
+    converted into a plain data record (:meth:`floodestimation.entities.Catchment.to_record`) such that it can be
+    passed to worker processes efficiently.
+
+    :param catchments: Subject catchments
+    :type catchments: iterable of :class:`floodestimation.entities.Catchment`
+    :return: List of `(site, source)` tuples, using the catchment id (or position if not set) as `site`
+    :rtype: list
+    """
+    return [(str(catchment.id or i), catchment.to_record()) for i, catchment in enumerate(catchments, start=1)]
+
+
+def catchment_from_row(row):
+    """
+    Return a subject catchment from a row of csv values.
+
+    :param row: Column name and value pairs. Empty values are ignored.
+    :type row: dict
+    :return: Catchment object
+    :rtype: :class:`floodestimation.entities.Catchment`
+    """
+    catchment = Catchment()
+    catchment.country = 'gb'
+    catchment.descriptors = Descriptors()
+    values = {name.strip().lower(): value.strip() for name, value in row.items() if name and value and value.strip()}
+
+    for name, entity in _POINT_ATTRS.items():
+        x, y = values.pop(name + '_x', None), values.pop(name + '_y', None)
+        if x is not None and y is not None:
+            target = catchment if entity is Catchment else catchment.descriptors
+            setattr(target, name, Point(int(float(x)), int(float(y))))
+
+    for name, value in values.items():
+        if name in _CATCHMENT_ATTRS:
+            entity, target = Catchment, catchment
+        elif name in Descriptors.__table__.c and name != 'catchment_id':
+            entity, target = Descriptors, catchment.descriptors
+        else:
+            raise ValueError("Column `{}` is not a catchment attribute or descriptor.".format(name))
+        python_type = entity.__table__.c[name].type.python_type
+        if python_type is int:
+            value = int(float(value))
+        elif python_type is float:
+            value = float(value)
+        setattr(target, name, value)
+    return catchment
+
+
+def analyse(catchment, gauged_catchments=None, aeps=STANDARD_AEPS, year=None):
+    """
+    Return QMED, growth curve and flood flows for a subject catchment.
+
+    :param catchment: Subject catchment
+    :type catchment: :class:`floodestimation.entities.Catchment`
+    :param gauged_catchments: Gauged catchments collection to select donor catchments from
+    :type gauged_catchments: :class:`floodestimation.collections.CatchmentCollections`
+    :param aeps: Annual exceedance probabilities to report flood flows for. Default: :attr:`STANDARD_AEPS`.
+    :type aeps: list of float
+    :param year: Year of analysis (for urban adjustments). Default: current year.
+    :type year: int
+    :return: Analysis results as a flat `dict` with simple values only. The growth curve distribution parameters
+             (`gc_params`) are a JSON object, e.g. `{"loc": 1.0, "scale": 0.2, "k": -0.1}`.
+    :rtype: dict
+    """
+    result = {'id': catchment.id, 'location': catchment.location, 'watercourse': catchment.watercourse}
+
+    qmed_analysis = QmedAnalysis(catchment, gauged_catchments, year=year)
+    qmed = qmed_analysis.qmed()
+    if qmed is None:
+        raise InsufficientDataError("QMED cannot be estimated using any method.")
+    result['qmed'] = float(qmed)
+    result['qmed_method'] = qmed_analysis.results_log['method']
+
+    gc_analysis = GrowthCurveAnalysis(catchment, gauged_catchments, year=year)
+    growth_curve = gc_analysis.growth_curve()
+    result['gc_method'] = gc_analysis.results_log['method']
+    result['gc_distr'] = growth_curve.distr
+    # Parameter names depend on the distribution, so stored as a single JSON object
+    result['gc_params'] = json.dumps({param: float(value) for param, value in growth_curve.params.items()})
+
+    for aep, flow in zip(aeps, qmed * growth_curve(aeps)):
+        result['flow_{:g}'.format(aep)] = float(flow)
+    return result
+
+
+def result_fields(aeps=STANDARD_AEPS):
+    """
+    Return the field names of the results in the order used for csv output.
+
+    :param aeps: Annual exceedance probabilities to report flood flows for
+    :type aeps: list of float
+    :rtype: list of str
+    """
+    return ['site', 'id', 'location', 'watercourse', 'qmed', 'qmed_method',
+            'gc_method', 'gc_distr', 'gc_params'] + \
+           ['flow_{:g}'.format(aep) for aep in aeps] + ['error']
+
+
+def _init_worker(db_file_path, snapshot=False):
+    """
+    Create a database session for the analyses in the current (worker) process.
+
+    :param db_file_path: Location of the gauged catchments database file
+    :type db_file_path: str
+    :param snapshot: Whether to copy the database into memory first
+    :type snapshot: bool
+    """
+    global _worker_session, _worker_donor_correlation
+    if snapshot:
+        memory_conn = sqlite3.connect(':memory:', check_same_thread=False)
+        file_conn = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(db_file_path)), uri=True)
+        try:
+            file_conn.backup(memory_conn)
+        finally:
+            file_conn.close()
+        engine = create_engine('sqlite://', creator=lambda: memory_conn, poolclass=StaticPool)
+    else:
+        options = db._engine_options_from_config()
+        options['read_only'] = True
+        engine = db.create_sqlite_engine(db_file_path, **options)
+    _worker_session = sessionmaker(bind=engine)()
+    # Donor correlation matrices are retrieved once for each worker, from the file next to the database
+    correlation_file_path = correlation.file_path_for_database(db_file_path)
+    _worker_donor_correlation = correlation.donor_correlation(_worker_session, file_path=correlation_file_path)
+    _worker_session.rollback()
+
+
+def _run_task(site, source, aeps, year):
+    """
+    Run an analysis for a single subject catchment in a worker process. Any errors are returned as part of the result.
+    """
+    result = {'site': site}
+    try:
+        if isinstance(source, dict):
+            catchment = catchment_from_row(source)
+        elif isinstance(source, CatchmentRecord):
+            catchment = Catchment.from_record(source, pot_output='arrays')
+        else:
+            catchment = loaders.from_file(source, pot_output='arrays')  # No POT record objects needed
+        gauged_catchments = CatchmentCollections(_worker_session, load_data='manual', loading_profile='pooling',
+                                                 donor_correlation=_worker_donor_correlation)
+        result.update(analyse(catchment, gauged_catchments, aeps, year))
+    except (Exception, InsufficientDataError) as e:
+        result['error'] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+    finally:
+        _worker_session.rollback()  # End read transaction
+    return result
+
+
+class ResultWriter(object):
+    """
+    Write results to a file object as csv or JSON lines, flushing after each result.
+    """
+
+    def __init__(self, file, output_format='csv', aeps=STANDARD_AEPS):
+        """
+        :param file: Writable text file object
+        :param output_format: `csv` or `jsonl`
+        :type output_format: str
+        :param aeps: Annual exceedance probabilities to report flood flows for
+        :type aeps: list of float
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("Output format `{}` invalid. Must be one of {}.".format(output_format, OUTPUT_FORMATS))
+        self.file = file
+        self.output_format = output_format
+        if output_format == 'csv':
+            self._csv_writer = csv.DictWriter(file, result_fields(aeps))
+            self._csv_writer.writeheader()
+
+    def write(self, result):
+        if self.output_format == 'csv':
+            self._csv_writer.writerow(result)
+        else:
+            self.file.write(json.dumps(result) + '\n')
+        self.file.flush()
+
+
+def run(input_path, output_file, output_format='csv', workers=None, snapshot=False, aeps=STANDARD_AEPS, year=None):
+    """
+    Run analyses for all subject catchments in a folder or csv file and write the results to a file object.
+
+    Results are written in order of completion, not in input order. If the gauged catchments database is empty, data
+    are downloaded first.
+
+    :param input_path: Folder with ``.CD3`` or ``.xml`` files or a ``.csv`` file, see :func:`subject_sources`, or a list
+                       of `(site, source)` tuples, e.g. from :func:`catchment_sources`
+    :type input_path: str or list
+    :param output_file: Writable text file object
+    :param output_format: `csv` (default) or `jsonl` (one JSON object per line)
+    :type output_format: str
+    :param workers: Number of worker processes. Default: number of CPUs. Use `1` to run in the current process.
+    :type workers: int
+    :param snapshot: Whether each worker should use an in-memory copy of the database. Default: `False`.
+    :type snapshot: bool
+    :param aeps: Annual exceedance probabilities to report flood flows for. Default: :attr:`STANDARD_AEPS`.
+    :type aeps: list of float
+    :param year: Year of analysis (for urban adjustments). Default: current year.
+    :type year: int
+    :return: Number of successful and failed analyses
+    :rtype: tuple
+    """
+    sources = subject_sources(input_path) if isinstance(input_path, str) else list(input_path)
+    writer = ResultWriter(output_file, output_format, aeps)
+
+    # Make sure gauged catchment data are available before starting read-only workers
+    session = db.Session()
+    try:
+        CatchmentCollections(session)
+        correlation.donor_correlation(session)  # Calculate donor correlation matrices once, if required
+    finally:
+        session.close()
+    db.get_engine().dispose()  # Don't share open connections with worker processes
+    db_file_path = os.path.abspath(os.path.join(config['db']['folder'], config['db']['filename']))
+
+    counts = [0, 0]
+
+    def write(result):
+        writer.write(result)
+        counts['error' in result] += 1
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(db_file_path, snapshot)
+        for site, source in sources:
+            write(_run_task(site, source, aeps, year))
+        return tuple(counts)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(db_file_path, snapshot)) as executor:
+        # Limit the number of pending tasks so results are written while remaining sources are submitted
+        max_pending = 4 * workers
+        pending = set()
+        for site, source in sources:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+            pending.add(executor.submit(_run_task, site, source, aeps, year))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                write(future.result())
+    return tuple(counts)
+
+
+def main(argv=None):
+    """
+    Command line entry point (`floodestimation-batch`).
+    """
+    parser = argparse.ArgumentParser(prog='floodestimation-batch',
+                                     description="Run flood estimation analyses for a batch of subject catchments.")
+    parser.add_argument('input', help="folder with .CD3/.xml files or .csv file with catchment descriptors")
+    parser.add_argument('-o', '--output', help="output file (default: standard output)")
+    parser.add_argument('-f', '--format', choices=OUTPUT_FORMATS,
+                        help="output format (default: from output file extension or csv)")
+    parser.add_argument('-w', '--workers', type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--snapshot', action='store_true', help="copy the database into memory in each worker")
+    parser.add_argument('--aep', type=float, nargs='+', default=STANDARD_AEPS, dest='aeps',
+                        help="annual exceedance probabilities (default: {})".format(
+                            ' '.join('{:g}'.format(aep) for aep in STANDARD_AEPS)))
+    parser.add_argument('--year', type=int, help="year of analysis (default: current year)")
+    args = parser.parse_args(argv)
+
+    output_format = args.format
+    if not output_format:
+        output_format = 'jsonl' if args.output and args.output.lower().endswith(('.jsonl', '.json')) else 'csv'
+
+    if args.output:
+        output_file = open(args.output, 'w', newline='')
+    else:
+        output_file = sys.stdout
+    try:
+        succeeded, failed = run(args.input, output_file, output_format, args.workers, args.snapshot, args.aeps,
+                                args.year)
+    finally:
+        if args.output:
+            output_file.close()
+    print("{} catchments analysed, {} failed.".format(succeeded + failed, failed), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2015  Florenz A.P. Hollebrandse <f.a.p.hollebrandse@protonmail.ch>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides an optional cache of analysis results such that repeated analyses of the same subject catchment
+are returned without searching donor catchments, solving matrices or fitting distributions again.
+
+The cache is enabled per analysis object by passing a :class:`ResultCache`, for example:
+
+>>> from floodestimation.analysis import QmedAnalysis
+>>> from floodestimation.cache import ResultCache
+>>> cache = ResultCache(maxsize=1000, file_path='results.sqlite')  # File is optional
+>>> QmedAnalysis(catchment, gauged_catchments, cache=cache).qmed()  # Calculated
+>>> QmedAnalysis(catchment, gauged_catchments, cache=cache).qmed()  # Returned from cache
+
+Results are keyed by a hash of the subject catchment's content (attributes, descriptors, AMAX and POT records), the
+method and method options, the analysis year, the NRFA data version (see :func:`floodestimation.fehdata.nrfa_metadata`)
+and the package version. For methods which may use donor catchments, e.g. `pooling_group`, the key also includes the
+version of the gauged catchment data (see :meth:`floodestimation.collections.CatchmentCollections.data_key`), which is
+retrieved using a single, trivial SQL statement. Analyses with manually set donor catchments, method options which
+cannot be hashed or gauged catchment data without a recorded version are not cached.
+
+A cache hit sets `results_log['cached']` to `True` and restores all intermediate results in the results log except the
+list of donor catchments (`results_log['donors']`).
+
+The on-disk store uses :mod:`pickle`. Only use cache files created by yourself.
+"""
+
+import functools
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+# Current package imports
+from . import fehdata
+from . import instrumentation
+
+# Results log entries not stored in the cache
+_EXCLUDED_LOG_ENTRIES = ('donors', 'instrumentation', 'cached')
+
+_MISSING = object()
+
+
+class ResultCache(object):
+    """
+    Least-recently used (LRU) cache of analysis results in memory with an optional sqlite store on disk. A single cache
+    object can be shared between threads.
+    """
+
+    def __init__(self, maxsize=256, file_path=None):
+        """
+        :param maxsize: Maximum number of results kept in memory
+        :type maxsize: int
+        :param file_path: Location of sqlite database file to store all results on disk. Default: `None` (memory only).
+        :type file_path: str
+        """
+        #: Maximum number of results kept in memory
+        self.maxsize = maxsize
+        #: Location of sqlite database file, if any
+        self.file_path = file_path
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if file_path:
+            self._conn = sqlite3.connect(file_path, check_same_thread=False)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+            self._conn.commit()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for `key` or `default` if not cached.
+
+        :param key: Cache key, see :func:`result_key`
+        :type key: str
+        """
+        with self._lock:
+            try:
+                self._results.move_to_end(key)
+                return self._results[key]
+            except KeyError:
+                pass
+            if self._conn is None:
+                return default
+            row = self._conn.execute('SELECT value FROM results WHERE key = ?', (key, )).fetchone()
+            if row is None:
+                return default
+            value = pickle.loads(row[0])
+            self._remember(key, value)
+            return value
+
+    def put(self, key, value):
+        """
+        Store `value` in the cache.
+
+        :param key: Cache key, see :func:`result_key`
+        :type key: str
+        :param value: Any picklable object
+        """
+        with self._lock:
+            self._remember(key, value)
+            if self._conn is not None:
+                self._conn.execute('INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)',
+                                   (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+                self._conn.commit()
+
+    def _remember(self, key, value):
+        self._results[key] = value
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all results from memory and disk.
+        """
+        with self._lock:
+            self._results.clear()
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM results')
+                self._conn.commit()
+
+    def close(self):
+        """
+        Close the on-disk store, if any.
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        # Number of results in memory
+        return len(self._results)
+
+    def __repr__(self):
+        return "<ResultCache: {} results in memory, file: {}>".format(len(self._results), self.file_path)
+
+
+def _is_plain(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_plain(item) for item in value)
+    return False
+
+
+def _catchment_content(catchment):
+    """
+    Return a JSON-serialisable representation of all catchment data used in analyses and a list of POT record arrays.
+    """
+    from sqlalchemy import inspect
+    from .entities import Descriptors
+
+    content = {
+        'id': catchment.id,
+        'country': catchment.country,
+        'area': catchment.area,
+        'channel_width': catchment.channel_width,
+        'point': [catchment.point.x, catchment.point.y] if catchment.point else None,
+        'is_suitable_for_qmed': catchment.is_suitable_for_qmed,
+        'is_suitable_for_pooling': catchment.is_suitable_for_pooling,
+        'descriptors': None,
+        'amax_records': [[record.water_year, record.flow, record.flag] for record in catchment.amax_records],
+        'pot_dataset': None
+    }
+    if catchment.descriptors:
+        content['descriptors'] = {attr.key: getattr(catchment.descriptors, attr.key)
+                                  for attr in inspect(Descriptors).column_attrs if attr.key != 'catchment_id'}
+    arrays = []
+    pot_dataset = catchment.pot_dataset
+    if pot_dataset:
+        content['pot_dataset'] = {
+            'start_date': pot_dataset.start_date,
+            'end_date': pot_dataset.end_date,
+            'threshold': pot_dataset.threshold,
+            'gaps': [[gap.start_date, gap.end_date] for gap in pot_dataset.pot_data_gaps]
+        }
+        arrays = list(pot_dataset.record_arrays())
+    return content, arrays
+
+
+def result_key(kind, analysis, method, method_options, donor_methods=()):
+    """
+    Return cache key for an analysis result or `None` if the result cannot be cached.
+
+    :param kind: Type of result, e.g. `qmed`
+    :type kind: str
+    :param analysis: Analysis object
+    :type analysis: :class:`floodestimation.analysis.Analysis`
+    :param method: Analysis method, e.g. `best`
+    :type method: str
+    :param method_options: Any method options
+    :type method_options: dict
+    :param donor_methods: Analysis methods which may use donor catchments from :attr:`analysis.gauged_catchments`
+    :type donor_methods: tuple
+    :return: SHA-256 hash
+    :rtype: str
+    """
+    from . import __version__
+
+    if getattr(analysis, 'donor_catchments', None) or not _is_plain(list(method_options.values())):
+        return None  # Donor catchments set manually
+    donors = None
+    if analysis.gauged_catchments is not None and method in donor_methods:
+        donors = getattr(analysis.gauged_catchments, 'data_key', lambda: None)()
+        if donors is None:
+            return None  # Donor data cannot be identified
+    nrfa = fehdata.nrfa_metadata()
+    content, arrays = _catchment_content(analysis.catchment)
+    data = {
+        'kind': kind,
+        'method': method,
+        'method_options': method_options,
+        'year': analysis.year,
+        'donors': donors,
+        'catchment': content,
+        'nrfa': [nrfa['version'], nrfa['published_on'], nrfa['downloaded_on']],
+        'package': __version__
+    }
+    h = hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8'))
+    for array in arrays:
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+
+def cached(kind, donor_methods=()):
+    """
+    Decorator for analysis methods with signature `(method='best', **method_options)` to return results from the
+    analysis object's :attr:`cache` attribute, if set.
+
+    :param kind: Type of result, e.g. `qmed`
+    :type kind: str
+    :param donor_methods: Analysis methods which may use donor catchments, see :func:`result_key`
+    :type donor_methods: tuple
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, method='best', **method_options):
+            cache = self.cache
+            key = result_key(kind, self, method, method_options, donor_methods) if cache is not None else None
+            if key is None:
+                return f(self, method, **method_options)
+
+            entry = cache.get(key)
+            if entry is not None:
+                instrumentation.count('cache.results.hit')
+                result, log = entry
+                self.results_log.update(log)
+                self.results_log['cached'] = True
+                return result
+
+            instrumentation.count('cache.results.miss')
+            result = f(self, method, **method_options)
+            log = {name: value for name, value in self.results_log.items() if name not in _EXCLUDED_LOG_ENTRIES}
+            cache.put(key, (result, log))
+            self.results_log['cached'] = False
+            return result
+        return wrapper
+    return decorator
@@ -18,15 +18,112 @@
 """
 This module contains collections for easy retrieval of standard lists or scalars from the database with gauged catchment
 data.
+
+Collection methods never modify the catchment objects retrieved from the database. Values such as distances are instead
+returned as immutable records (named tuples) wrapping each catchment. Attributes of the catchment itself can be accessed
+directly from the record, e.g. `record.id`.
+
+A collection object must only be used within a single thread as its database session is not thread-safe. To run
+analyses using a pool of threads, create a collection in each thread using a thread-local session::
+
+    from floodestimation import db
+    from floodestimation.collections import CatchmentCollections
+
+    def worker(...):
+        gauged_catchments = CatchmentCollections(db.ScopedSession())
+        ...
+        db.ScopedSession.remove()
+
+The related data loaded with each catchment is set by a loading profile (see :attr:`LOADING_PROFILES`), for example::
+
+    gauged_catchments = CatchmentCollections(db.Session(), loading_profile='pooling')
+
+================= ============================================================================================
+Loading profile   Related data loaded
+================= ============================================================================================
+`lazy` (default)  Descriptors, AMAX records, POT dataset and comments are each loaded when first accessed.
+`analysis`        Descriptors, AMAX records and the POT dataset (incl. records and gaps) are loaded with the
+                  catchments. Comments are not loaded (empty list).
+`pooling`         Descriptors and AMAX records are loaded with the catchments. Comments are not loaded (empty list)
+                  and the POT dataset is loaded when first accessed. Suitable for QMED donor catchments and pooling
+                  groups.
+`full`            All related data is loaded with the catchments.
+================= ============================================================================================
+
+Except for `lazy`, related data is loaded using a fixed number of SQL statements, regardless of the number of
+catchments. A loading profile applies to catchments when first loaded by a database session.
+
 """
+import logging
 from math import sqrt
 from operator import attrgetter
-from sqlalchemy import or_, between, text
+from collections import namedtuple
+from sqlalchemy import or_, and_, between, text, select
 from sqlalchemy.sql.functions import func
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import contains_eager, joinedload, selectinload, noload, lazyload
 # Current package imports
-from .entities import Catchment, Descriptors, AmaxRecord
+from .entities import Catchment, Descriptors, AmaxRecord, PotDataset, CatchmentAnnotation, plain_catchment
 from . import loaders
 from . import db
+from . import correlation
+
+logger = logging.getLogger(__name__)
+
+#: Valid loading profiles, see module documentation
+LOADING_PROFILES = ('lazy', 'analysis', 'pooling', 'full')
+
+
+def loader_options(loading_profile, descriptors_joined=False):
+    """
+    Return SQLAlchemy loader options for querying :class:`floodestimation.entities.Catchment` objects using a loading
+    profile.
+
+    Example:
+
+    >>> session.query(Catchment).options(*loader_options('pooling')).all()
+
+    :param loading_profile: Loading profile, one of :attr:`LOADING_PROFILES`
+    :type loading_profile: str
+    :param descriptors_joined: Whether the query already joins :attr:`Catchment.descriptors`. Default: `False`.
+    :type descriptors_joined: bool
+    :return: Loader options
+    :rtype: list
+    """
+    if loading_profile not in LOADING_PROFILES:
+        raise ValueError("Loading profile `{}` invalid. Must be one of {}.".format(loading_profile, LOADING_PROFILES))
+    if loading_profile == 'lazy':
+        return []
+
+    options = [contains_eager(Catchment.descriptors) if descriptors_joined else joinedload(Catchment.descriptors),
+               selectinload(Catchment.amax_records)]
+    if loading_profile in ('analysis', 'full'):
+        pot_dataset = selectinload(Catchment.pot_dataset)
+        options += [pot_dataset.selectinload(PotDataset.pot_records),
+                    pot_dataset.selectinload(PotDataset.pot_data_gaps)]
+    else:
+        options.append(lazyload(Catchment.pot_dataset))
+    if loading_profile == 'full':
+        options.append(selectinload(Catchment.comments))
+    else:
+        options.append(noload(Catchment.comments))
+    return options
+
+
+class NearbyCatchment(CatchmentAnnotation, namedtuple('NearbyCatchment', ['catchment', 'dist'])):
+    """
+    Catchment with distance (`dist`) in km to a subject catchment as returned by
+    :meth:`.CatchmentCollections.nearest_qmed_catchments`.
+    """
+    __slots__ = ()
+
+
+class SimilarCatchment(CatchmentAnnotation, namedtuple('SimilarCatchment', ['catchment', 'similarity_dist'])):
+    """
+    Catchment with hydrological similarity distance (`similarity_dist`) to a subject catchment as returned by
+    :meth:`.CatchmentCollections.most_similar_catchments`.
+    """
+    __slots__ = ()
 
 
 class CatchmentCollections(object):
@@ -37,7 +134,7 @@ class CatchmentCollections(object):
     :meth:`floodestimation.db.Session()`
     """
 
-    def __init__(self, db_session, load_data='auto'):
+    def __init__(self, db_session, load_data='auto', loading_profile='lazy', donor_correlation=False):
         """
         :param db_session: SQLAlchemy database session
         :type db_session: :class:`sqlalchemy.orm.session.Session`
@@ -45,10 +142,25 @@ class CatchmentCollections(object):
                           - `force`: delete all exsting data first
                           - `manual`: manually retrieve data
         :type load_data: str
+        :param loading_profile: Related data to load with catchments, one of :attr:`LOADING_PROFILES`. Default: `lazy`.
+        :type loading_profile: str
+        :param donor_correlation: Use precomputed correlation matrices between all QMED donor catchments, see
+                                  :mod:`floodestimation.correlation`. Default: `False`. Matrices already retrieved
+                                  can be shared between collections by providing a
+                                  :class:`floodestimation.correlation.DonorCorrelation` object.
+        :type donor_correlation: bool or :class:`floodestimation.correlation.DonorCorrelation`
         :return: a catchment collection object
         :rtype: :class:`.CatchmentCollections`
         """
         self.db_session = db_session
+        loader_options(loading_profile)  # Validate
+        #: Loading profile for catchments retrieved by this collection, see :attr:`LOADING_PROFILES`
+        self.loading_profile = loading_profile
+        #: Whether analyses use precomputed correlation matrices between QMED donor catchments
+        self.use_donor_correlation = bool(donor_correlation)
+        self._donor_correlation = None
+        if isinstance(donor_correlation, correlation.DonorCorrelation):
+            self._donor_correlation = donor_correlation
 
         # If the database does not contain any catchmetnts yet, retrieve them from NRFA website and save to db
         if load_data == 'force':
@@ -59,16 +171,44 @@ class CatchmentCollections(object):
     def _db_empty(self):
         return bool(self.db_session.query(Catchment).count() == 0)
 
-    def catchment_by_number(self, number):
+    def catchment_by_number(self, number, loading_profile=None):
         """
         Return a single catchment by NRFA station number
 
         :param number: NRFA gauging station number
         :type number: int
+        :param loading_profile: Related data to load with the catchment, one of :attr:`LOADING_PROFILES`. Default: the
+                                collection's :attr:`loading_profile`.
+        :type loading_profile: str
         :return: relevant catchment if exist or `None` otherwise
         :rtype: :class:`floodestimation.entities.Catchment`
         """
-        return self.db_session.query(Catchment).get(number)
+        options = loader_options(loading_profile or self.loading_profile)
+        return self.db_session.query(Catchment).options(*options).get(number)
+
+    def donor_correlation(self):
+        """
+        Return precomputed correlation matrices between all catchments suitable for QMED estimation or `None` if not
+        enabled for this collection. The matrices are retrieved once for each collection object.
+
+        :rtype: :class:`floodestimation.correlation.DonorCorrelation`
+        """
+        if not self.use_donor_correlation:
+            return None
+        if self._donor_correlation is None:
+            self._donor_correlation = correlation.donor_correlation(self.db_session)
+        return self._donor_correlation
+
+    def data_key(self):
+        """
+        Return a key identifying the current gauged catchment data in the database (catchments, descriptors and AMAX
+        records), for example to identify analysis results using donor catchments from this collection. The key changes
+        whenever the data is changed, see :func:`floodestimation.db.data_version`.
+
+        :return: Data key or `None` if the database does not record the data version
+        :rtype: str
+        """
+        return db.data_version(self.db_session)
 
     def nearest_qmed_catchments(self, subject_catchment, limit=None, dist_limit=500):
         """
@@ -83,37 +223,56 @@ class CatchmentCollections(object):
                            maximum distance will increase computation time!
         :type dist_limit: float or int
         :return: list of catchments sorted by distance
-        :rtype: list of :class:`floodestimation.entities.Catchment`
+        :rtype: list of :class:`.NearbyCatchment`
         """
 
+        try:
+            rows = self._nearest_qmed_rows(subject_catchment, limit, dist_limit)
+        except DatabaseError as e:
+            if not db.is_corruption_error(e):
+                raise
+            # Damaged spatial index, query again without using the index
+            logger.warning("Spatial index of catchment centroids damaged, use `floodestimation.db."
+                           "rebuild_centroid_index()` to repair.")
+            db.disable_centroid_index(self.db_session.get_bind())
+            rows = self._nearest_qmed_rows(subject_catchment, limit, dist_limit)
+
+        # Real distance using previously calculated SQL dist squared
+        return [NearbyCatchment(catchment, sqrt(dist_sq)) for catchment, dist_sq in rows]
+
+    def _nearest_qmed_rows(self, subject_catchment, limit, dist_limit):
+        query = self._nearest_qmed_query(subject_catchment, dist_limit)
+        if limit:
+            return query[0:limit]  # Each row is tuple of (catchment, distance squared)
+        return query.all()
+
+    def _nearest_qmed_query(self, subject_catchment, dist_limit):
+        # Query returning tuples of (catchment, distance squared) sorted by distance. The query is optimised for the
+        # composite index on catchments (country, is_suitable_for_qmed) and the covering index on amax records.
         dist_sq = Catchment.distance_to(subject_catchment).label('dist_sq')  # Distance squared, calculated using SQL
         query = self.db_session.query(Catchment, dist_sq). \
-            join(Catchment.amax_records). \
             join(Catchment.descriptors). \
             filter(Catchment.id != subject_catchment.id,  # Exclude subject catchment itself
                    Catchment.is_suitable_for_qmed,  # Only catchments suitable for QMED estimation
                    Catchment.country == subject_catchment.country,  # SQL dist method does not cover cross-boundary dist
                    # Within the distance limit
-                   dist_sq <= dist_limit ** 2). \
-            group_by(Catchment,
-                     Descriptors.centroid_ngr_x,
-                     Descriptors.centroid_ngr_y). \
-            order_by(dist_sq). \
-            having(func.count(AmaxRecord.catchment_id) >= 10)  # At least 10 AMAX records
-
-        if limit:
-            rows = query[0:limit]  # Each row is tuple of (catchment, distance squared)
-        else:
-            rows = query.all()
+                   dist_sq <= dist_limit ** 2,
+                   # At least 10 AMAX records
+                   _amax_records_count() >= 10). \
+            options(*loader_options(self.loading_profile, descriptors_joined=True)). \
+            order_by(dist_sq)
 
-        # Add real `dist` attribute to catchment list using previously calculated SQL dist squared
-        catchments = []
-        for row in rows:
-            catchment = row[0]
-            catchment.dist = sqrt(row[1])
-            catchments.append(catchment)
-
-        return catchments
+        # Pre-select candidate catchments within a square around the subject catchment using the spatial index (if
+        # available) such that distances are only calculated for nearby catchments.
+        x = subject_catchment.descriptors.centroid_ngr_x
+        y = subject_catchment.descriptors.centroid_ngr_y
+        if x is not None and y is not None and db.has_centroid_index(self.db_session.get_bind()):
+            d = 1000 * dist_limit + 1  # In m, add 1 m to allow for rounding of R-tree coordinates
+            index = db.centroid_index
+            candidates = select([index.c.id]).where(and_(index.c.min_x <= x + d, index.c.max_x >= x - d,
+                                                         index.c.min_y <= y + d, index.c.max_y >= y - d))
+            query = query.filter(Catchment.id.in_(candidates))
+        return query
 
     def most_similar_catchments(self, subject_catchment, similarity_dist_function, records_limit=500,
                                 include_subject_catchment='auto'):
@@ -129,24 +288,17 @@ class CatchmentCollections(object):
                                           - `exclude`: do not include the subject catchment
         :type include_subject_catchment: str
         :return: list of catchments sorted by similarity
-        :type: list of :class:`floodestimation.entities.Catchment`
+        :type: list of :class:`.SimilarCatchment`
         """
         if include_subject_catchment not in ['auto', 'force', 'exclude']:
             raise ValueError("Parameter `include_subject_catchment={}` invalid.".format(include_subject_catchment) +
                              "Must be one of `auto`, `force` or `exclude`.")
 
-        query = (self.db_session.query(Catchment).
-                 join(Catchment.descriptors).
-                 join(Catchment.amax_records).
-                 filter(Catchment.id != subject_catchment.id,
-                        Catchment.is_suitable_for_pooling,
-                        or_(Descriptors.urbext2000 < 0.03, Descriptors.urbext2000 == None),
-                        AmaxRecord.flag == 0).
-                 group_by(Catchment).
-                 having(func.count(AmaxRecord.catchment_id) >= 10))  # At least 10 AMAX records
+        query = self._most_similar_query(subject_catchment)
         catchments = query.all()
 
         # Add subject catchment if required (may not exist in database, so add after querying db
+        subject_catchment = plain_catchment(subject_catchment)
         if include_subject_catchment == 'force':
             if len(subject_catchment.amax_records) >= 10:  # Never include short-record catchments
                 catchments.append(subject_catchment)
@@ -155,9 +307,9 @@ class CatchmentCollections(object):
                (subject_catchment.descriptors.urbext2000 < 0.03 or subject_catchment.descriptors.urbext2000 is None):
                 catchments.append(subject_catchment)
 
-        # Store the similarity distance as an additional attribute for each catchment
-        for catchment in catchments:
-            catchment.similarity_dist = similarity_dist_function(subject_catchment, catchment)
+        # Calculate the similarity distance for each catchment
+        catchments = [SimilarCatchment(catchment, similarity_dist_function(subject_catchment, catchment))
+                      for catchment in catchments]
         # Then simply sort by this attribute
         catchments.sort(key=attrgetter('similarity_dist'))
 
@@ -171,3 +323,28 @@ class CatchmentCollections(object):
                 break
 
         return catchments_limited
+
+    def _most_similar_query(self, subject_catchment):
+        # Query returning rural catchments suitable for pooling. The query is optimised for the index on catchments
+        # (is_suitable_for_pooling) and the covering index on amax records.
+        return self.db_session.query(Catchment). \
+            join(Catchment.descriptors). \
+            filter(Catchment.id != subject_catchment.id,
+                   Catchment.is_suitable_for_pooling,
+                   or_(Descriptors.urbext2000 < 0.03, Descriptors.urbext2000 == None),
+                   # At least 10 AMAX records
+                   _amax_records_count(valid_only=True) >= 10). \
+            options(*loader_options(self.loading_profile, descriptors_joined=True))
+
+
+def _amax_records_count(valid_only=False):
+    """
+    Return correlated subquery counting the number of AMAX records for each catchment in the enclosing query.
+
+    :param valid_only: Whether to count valid records only, i.e. excluding rejected records
+    :type valid_only: bool
+    """
+    criterion = AmaxRecord.catchment_id == Catchment.id
+    if valid_only:
+        criterion = and_(criterion, AmaxRecord.flag == 0)
+    return select([func.count()]).where(criterion).as_scalar()
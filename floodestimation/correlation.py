@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2015  Florenz A.P. Hollebrandse <f.a.p.hollebrandse@protonmail.ch>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides precomputed correlation matrices between all catchments suitable for QMED estimation. The model
+error and ln(QMED) correlations used to weight QMED donor catchments depend only on the distance between catchment
+centroids. Instead of calculating these for each pair of donors in each analysis, the correlations between all donor
+catchments in the database are calculated once and the matrices for a set of donors are taken as submatrices.
+
+Precomputed correlations are used when enabled for a catchment collection, for example:
+
+>>> from floodestimation.collections import CatchmentCollections
+>>> gauged_catchments = CatchmentCollections(db.Session(), donor_correlation=True)
+>>> QmedAnalysis(catchment, gauged_catchments).qmed()
+
+The matrices are stored in a file next to the sqlite database file (e.g. `fehdata.sqlite.correlation.npz`) such that
+other processes, e.g. batch workers, can re-use them. The file is identified by a hash of the catchment ids, countries
+and centroids it was calculated from and is recalculated automatically when the gauged catchment data changes, e.g.
+after downloading a new NRFA data release.
+"""
+
+import os
+import hashlib
+import numpy as np
+# Current package imports
+from .entities import Catchment, Descriptors
+from . import instrumentation
+
+#: File format version, incremented when the stored matrices change
+FORMAT_VERSION = 1
+
+#: Parameters of the distance-decaying model error correlation (Kjeldsen & Jones, 2009, table 3)
+MODEL_ERROR_PHI = (0.3998, 0.0283, 0.9494)
+#: Parameters of the distance-decaying ln(QMED) correlation (Kjeldsen & Jones, 2009, fig 3)
+LNQMED_PHI = (0.2791, 0.0039, 0.0632)
+
+
+def dist_corr(dist, phi1, phi2, phi3):
+    """
+    Generic distance-decaying correlation function for an array of distances.
+
+    :param dist: Distances between catchment centroids in km
+    :type dist: :class:`numpy.ndarray`
+    :param phi1: Decay function parameters 1
+    :type phi1: float
+    :param phi2: Decay function parameters 2
+    :type phi2: float
+    :param phi3: Decay function parameters 3
+    :type phi3: float
+    :return: Correlation coefficients
+    :rtype: :class:`numpy.ndarray`
+    """
+    return phi1 * np.exp(-phi2 * dist) + (1 - phi1) * np.exp(-phi3 * dist)
+
+
+def distance_matrix(countries, x, y):
+    """
+    Return the distances in km between all catchment centroids. Consistent with
+    :meth:`floodestimation.entities.Catchment.distance_to`, the distance between catchments in different countries or
+    without centroid is infinite.
+
+    :param countries: Catchment countries, e.g. `gb`
+    :type countries: :class:`numpy.ndarray`
+    :param x: Centroid x-coordinates in m, NaN if not available
+    :type x: :class:`numpy.ndarray`
+    :param y: Centroid y-coordinates in m, NaN if not available
+    :type y: :class:`numpy.ndarray`
+    :return: 2-dimensional, symmetric distance matrix
+    :rtype: :class:`numpy.ndarray`
+    """
+    return cross_distance_matrix(countries, x, y, countries, x, y)
+
+
+def cross_distance_matrix(countries_a, x_a, y_a, countries_b, x_b, y_b):
+    """
+    Return the distances in km between two sets of catchment centroids, see :func:`distance_matrix`.
+
+    :param countries_a: Countries of the first set of catchments
+    :type countries_a: :class:`numpy.ndarray`
+    :param x_a: Centroid x-coordinates in m of the first set of catchments, NaN if not available
+    :type x_a: :class:`numpy.ndarray`
+    :param y_a: Centroid y-coordinates in m of the first set of catchments, NaN if not available
+    :type y_a: :class:`numpy.ndarray`
+    :param countries_b: Countries of the second set of catchments
+    :type countries_b: :class:`numpy.ndarray`
+    :param x_b: Centroid x-coordinates in m of the second set of catchments, NaN if not available
+    :type x_b: :class:`numpy.ndarray`
+    :param y_b: Centroid y-coordinates in m of the second set of catchments, NaN if not available
+    :type y_b: :class:`numpy.ndarray`
+    :return: 2-dimensional distance matrix with a row for each catchment in the first set and a column for each
+             catchment in the second set
+    :rtype: :class:`numpy.ndarray`
+    """
+    dist = 0.001 * np.hypot(x_a[:, None] - x_b[None, :], y_a[:, None] - y_b[None, :])
+    dist[countries_a[:, None] != countries_b[None, :]] = np.inf
+    dist[np.isnan(dist)] = np.inf
+    return dist
+
+
+def centroid_arrays(catchments):
+    """
+    Return the countries and centroid coordinates of catchments as arrays, read from the raw
+    :attr:`floodestimation.entities.Descriptors.centroid_ngr_x` and `centroid_ngr_y` attributes.
+
+    :param catchments: Catchments
+    :type catchments: list of :class:`floodestimation.entities.Catchment`
+    :return: Arrays of countries, centroid x-coordinates and centroid y-coordinates (NaN if not available), see
+             :func:`distance_matrix`.
+    :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`, :class:`numpy.ndarray`)
+    """
+    descriptors = [catchment.descriptors for catchment in catchments]
+    countries = np.array([catchment.country or '' for catchment in catchments], dtype=str)
+    x = np.array([getattr(descr, 'centroid_ngr_x', None) for descr in descriptors], dtype=float)  # `None` becomes NaN
+    y = np.array([getattr(descr, 'centroid_ngr_y', None) for descr in descriptors], dtype=float)
+    return countries, x, y
+
+
+class DonorCorrelation(object):
+    """
+    Model error and ln(QMED) correlation matrices between catchments.
+    """
+
+    def __init__(self, ids, model_error_corr, lnqmed_corr, key=None):
+        """
+        :param ids: Catchment ids (NRFA station numbers)
+        :type ids: :class:`numpy.ndarray`
+        :param model_error_corr: Model error correlation matrix, in the same order as `ids`
+        :type model_error_corr: :class:`numpy.ndarray`
+        :param lnqmed_corr: ln(QMED) correlation matrix, in the same order as `ids`
+        :type lnqmed_corr: :class:`numpy.ndarray`
+        :param key: Hash of the catchment data the matrices were calculated from
+        :type key: str
+        """
+        #: Catchment ids
+        self.ids = np.asarray(ids, dtype=np.int64)
+        #: Model error correlation matrix
+        self.model_error_corr = model_error_corr
+        #: ln(QMED) correlation matrix
+        self.lnqmed_corr = lnqmed_corr
+        #: Hash of the catchment data the matrices were calculated from
+        self.key = key
+        self._positions = {catchment_id: i for i, catchment_id in enumerate(self.ids.tolist())}
+
+    @classmethod
+    def from_coordinates(cls, ids, countries, x, y, key=None):
+        """
+        Calculate correlation matrices from catchment centroids.
+
+        :param ids: Catchment ids
+        :type ids: :class:`numpy.ndarray`
+        :param countries: Catchment countries
+        :type countries: :class:`numpy.ndarray`
+        :param x: Centroid x-coordinates in m, NaN if not available
+        :type x: :class:`numpy.ndarray`
+        :param y: Centroid y-coordinates in m, NaN if not available
+        :type y: :class:`numpy.ndarray`
+        :param key: Hash of the catchment data
+        :type key: str
+        :rtype: :class:`DonorCorrelation`
+        """
+        dist = distance_matrix(countries, x, y)
+        return cls(ids, dist_corr(dist, *MODEL_ERROR_PHI), dist_corr(dist, *LNQMED_PHI), key)
+
+    def indices(self, catchments):
+        """
+        Return the positions of catchments in the matrices or `None` if any of the catchments is not included.
+
+        :param catchments: Catchments
+        :type catchments: list of :class:`floodestimation.entities.Catchment`
+        :rtype: :class:`numpy.ndarray` or `None`
+        """
+        try:
+            return np.array([self._positions[catchment.id] for catchment in catchments], dtype=np.intp)
+        except KeyError:
+            return None
+
+    def save(self, file_path):
+        """
+        Save the matrices to an `.npz` file. The file is replaced atomically.
+
+        :param file_path: File path
+        :type file_path: str
+        """
+        temp_path = '{}.{}.tmp'.format(file_path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            np.savez(f, format_version=FORMAT_VERSION, key=self.key, ids=self.ids,
+                     model_error_corr=self.model_error_corr, lnqmed_corr=self.lnqmed_corr)
+        os.replace(temp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path, key=None):
+        """
+        Load matrices from an `.npz` file. Returns `None` if the file does not exist, cannot be read, has a different
+        format version or, if provided, a different `key`.
+
+        :param file_path: File path
+        :type file_path: str
+        :param key: Expected hash of the catchment data
+        :type key: str
+        :rtype: :class:`DonorCorrelation` or `None`
+        """
+        try:
+            with np.load(file_path, allow_pickle=False) as data:
+                if int(data['format_version']) != FORMAT_VERSION:
+                    return None
+                if key is not None and str(data['key']) != key:
+                    return None
+                return cls(data['ids'], data['model_error_corr'], data['lnqmed_corr'], str(data['key']))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return "<DonorCorrelation: {} catchments>".format(len(self.ids))
+
+
+def _donor_coordinates(db_session):
+    # Ids, countries and centroids of all catchments suitable for QMED estimation, as arrays
+    rows = db_session.query(Catchment.id, Catchment.country, Descriptors.centroid_ngr_x, Descriptors.centroid_ngr_y). \
+        join(Catchment.descriptors). \
+        filter(Catchment.is_suitable_for_qmed). \
+        order_by(Catchment.id).all()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    countries = np.array([row[1] or '' for row in rows], dtype=str)
+    x = np.array([row[2] for row in rows], dtype=float)  # `None` becomes NaN
+    y = np.array([row[3] for row in rows], dtype=float)
+    return ids, countries, x, y
+
+
+def _data_key(ids, countries, x, y):
+    h = hashlib.sha256(str(FORMAT_VERSION).encode('ascii'))
+    for array in (ids, x, y):
+        h.update(array.tobytes())
+    h.update('\0'.join(countries.tolist()).encode('utf-8'))
+    return h.hexdigest()
+
+
+def file_path_for_database(database):
+    """
+    Return the location of the correlation matrices file for a database file.
+
+    :param database: Location of the sqlite database file
+    :type database: str
+    :rtype: str
+    """
+    return database + '.correlation.npz'
+
+
+def file_path_for(db_session):
+    """
+    Return the location of the correlation matrices file for the database used by `db_session` or `None` for an
+    in-memory database.
+
+    :param db_session: SQLAlchemy database session
+    :type db_session: :class:`sqlalchemy.orm.session.Session`
+    :rtype: str
+    """
+    database = db_session.get_bind().url.database
+    if not database or database == ':memory:':
+        return None
+    return file_path_for_database(database)
+
+
+def donor_correlation(db_session, file_path='auto'):
+    """
+    Return correlation matrices for all catchments suitable for QMED estimation in the database. The matrices are
+    loaded from file if calculated previously from the same data or calculated and saved otherwise.
+
+    :param db_session: SQLAlchemy database session
+    :type db_session: :class:`sqlalchemy.orm.session.Session`
+    :param file_path: Location of the matrices file. Default: `auto`, next to the database file, see
+                      :func:`file_path_for`. Use `None` to keep the matrices in memory only.
+    :type file_path: str
+    :rtype: :class:`DonorCorrelation`
+    """
+    ids, countries, x, y = _donor_coordinates(db_session)
+    key = _data_key(ids, countries, x, y)
+    if file_path == 'auto':
+        file_path = file_path_for(db_session)
+    if file_path:
+        result = DonorCorrelation.load(file_path, key)
+        if result is not None:
+            instrumentation.count('cache.donor_correlation.hit')
+            return result
+    instrumentation.count('cache.donor_correlation.miss')
+    result = DonorCorrelation.from_coordinates(ids, countries, x, y, key)
+    if file_path:
+        try:
+            result.save(file_path)
+        except OSError:
+            pass  # E.g. read-only database folder: use matrices in memory only
+    return result
@@ -26,7 +26,9 @@ This enables straightforward retrieving and saving of data in relevant tables.
 The sqlite database is saved in the user's application data folder. On Windows, this is folder is located
 at `C:\\\\Users\\\\{Username}\\\\AppData\\\\Local\\\\Open Hydrology\\\\fehdata\\\\fehdata.sqlite`.
 
-The database is automatically created (if it does not exist yet) when importing the :mod:`floodestimation` package.
+The database engine is only created when it is first needed, typically when calling `Session()` or accessing
+:attr:`engine`. At that point the database file and any missing tables are created automatically. Importing the
+:mod:`floodestimation` package itself therefore has no side effects on the file system.
 
 Interaction with the database is typically as follows::
 
@@ -43,15 +45,67 @@ Interaction with the database is typically as follows::
 
 Typically a single session instance can be used throughout a program with commits (or rollbacks) as and when required.
 
+Sessions (and the catchment objects retrieved using a session) must not be shared between threads. Multi-threaded
+programs should use :attr:`ScopedSession` instead which returns a separate session for each thread::
+
+    session = db.ScopedSession()  # Same session object when called again in the same thread
+    ...
+    db.ScopedSession.remove()     # Close the thread's session when the thread's work is done
+
+The sqlite connection can be tuned in the `[db]` section of the ``config.ini`` file, for example::
+
+    [db]
+    journal_mode = wal
+    synchronous = normal
+    cache_size = -20000
+    mmap_size = 268435456
+    read_only = no
+
+These settings are applied as `PRAGMA` statements to each new connection. With `journal_mode = wal`, many processes can
+read the database while another process writes to it. Setting `read_only = yes` opens the database file in read-only
+mode which is useful when many analysis processes share a single database file. In read-only mode, the database file
+must exist already and tables are not created or upgraded.
+
+Peaks-over-threshold records can be stored as compact binary arrays instead of a row for each record by setting
+`pot_storage = packed` in the `[db]` section, see :class:`floodestimation.entities.PotDataset`.
+
+The database schema version is stored in the database file itself (`PRAGMA user_version`). Database files created by
+earlier versions of this package are upgraded automatically when first used, see :func:`migrate_db`.
+
+To find out which SQL statements are issued by a piece of code, including any lazy loading of related objects, use
+:func:`count_queries`::
+
+    with db.count_queries() as queries:
+        analysis.qmed()
+    print(queries.total)
+    print(queries.summary())  # Number of statements by statement template
+
+In tests, :func:`assert_max_queries` can be used to fail if a piece of code issues more SQL statements than expected.
+
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, Table, Column, Integer, Float, String
+from sqlalchemy.exc import DatabaseError, OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.schema import MetaData
-import os.path
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.reflection import Inspector
+from collections import Counter
+from contextlib import contextmanager
+import os
+import re
+import logging
+import sqlite3
+import threading
+import uuid
+import weakref
+from urllib.request import pathname2url
 # Current package imports
 from .settings import config
+from . import instrumentation
+
+logger = logging.getLogger(__name__)
 
 #: Base class all entities that should be stored as a table in the database should be inheriting from. For example:
 #:
@@ -65,26 +119,419 @@ from .settings import config
 #:
 Base = declarative_base()
 
-# Set up database engine and session class
-engine = create_engine('sqlite:///' + os.path.join(config['db']['folder'], config['db']['filename']))
-metadata = MetaData(bind=engine, reflect=True)
+# The engine and reflected metadata are created on first use only, see :func:`get_engine`. They are available as module
+# attributes `engine` and `metadata` through the module-level `__getattr__` below.
+_engine = None
+_metadata = None
+
+#: Current version of the database schema. Increment when adding migration steps to :func:`migrate_db`.
+SCHEMA_VERSION = 5
+
+#: Spatial index of catchment centroids using the sqlite R-tree module. Each centroid is stored as a bounding box with
+#: zero width and height. The index is kept up-to-date by triggers on the `descriptors` table and is not part of
+#: :attr:`Base.metadata` as it is a virtual table.
+centroid_index = Table('catchment_centroids', MetaData(),
+                       Column('id', Integer, primary_key=True),
+                       Column('min_x', Float), Column('max_x', Float),
+                       Column('min_y', Float), Column('max_y', Float))
+
+_CENTROID_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS catchment_centroids USING rtree(id, min_x, max_x, min_y, max_y)""",
+    """CREATE TRIGGER IF NOT EXISTS catchment_centroids_insert AFTER INSERT ON descriptors
+       WHEN new.centroid_ngr_x IS NOT NULL AND new.centroid_ngr_y IS NOT NULL
+       BEGIN
+           DELETE FROM catchment_centroids WHERE id = new.catchment_id;
+           INSERT INTO catchment_centroids
+           VALUES (new.catchment_id, new.centroid_ngr_x, new.centroid_ngr_x, new.centroid_ngr_y, new.centroid_ngr_y);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS catchment_centroids_update
+       AFTER UPDATE OF catchment_id, centroid_ngr_x, centroid_ngr_y ON descriptors
+       BEGIN
+           DELETE FROM catchment_centroids WHERE id = old.catchment_id;
+           INSERT INTO catchment_centroids
+           SELECT new.catchment_id, new.centroid_ngr_x, new.centroid_ngr_x, new.centroid_ngr_y, new.centroid_ngr_y
+           WHERE new.centroid_ngr_x IS NOT NULL AND new.centroid_ngr_y IS NOT NULL;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS catchment_centroids_delete AFTER DELETE ON descriptors
+       BEGIN
+           DELETE FROM catchment_centroids WHERE id = old.catchment_id;
+       END""",
+    """DELETE FROM catchment_centroids""",
+    """INSERT INTO catchment_centroids
+       SELECT catchment_id, centroid_ngr_x, centroid_ngr_x, centroid_ngr_y, centroid_ngr_y FROM descriptors
+       WHERE centroid_ngr_x IS NOT NULL AND centroid_ngr_y IS NOT NULL"""
+]
+
+#: Version of the gauged catchment data (catchments, descriptors and AMAX records) in the database, see
+#: :func:`data_version`. The table has a single row with a random token, set when the table is created, and a counter
+#: which is incremented by triggers on each inserted, updated or deleted row. The table is not part of
+#: :attr:`Base.metadata`.
+data_version_table = Table('data_version', MetaData(),
+                           Column('id', Integer, primary_key=True),
+                           Column('token', String),
+                           Column('counter', Integer))
+
+# Tables included in the data version
+_DATA_VERSION_TABLES = ('catchments', 'descriptors', 'amaxrecords')
+
+_DATA_VERSION_DDL = [
+    """CREATE TABLE IF NOT EXISTS data_version
+       (id INTEGER PRIMARY KEY CHECK (id = 1), token TEXT NOT NULL, counter INTEGER NOT NULL)""",
+    """INSERT OR IGNORE INTO data_version VALUES (1, ?, 0)"""
+] + [
+    """CREATE TRIGGER IF NOT EXISTS {table}_{event}_data_version AFTER {event} ON {table}
+       BEGIN
+           UPDATE data_version SET counter = counter + 1;
+       END""".format(table=table, event=event)
+    for table in _DATA_VERSION_TABLES for event in ('insert', 'update', 'delete')
+]
+
+# Cache of :func:`has_centroid_index` results by engine
+_has_centroid_index = weakref.WeakKeyDictionary()
+
+
+class _LazySessionmaker(sessionmaker):
+    """
+    Session factory which creates the database engine when the first session is created.
+    """
+    def __call__(self, **local_kw):
+        get_engine()
+        return sessionmaker.__call__(self, **local_kw)
+
 
 # When interaction with the database, modules should start a new `session` instance by simply calling `Session()`.
-Session = sessionmaker(bind=engine)
+Session = _LazySessionmaker()
+
+#: Thread-local session registry. Calling `ScopedSession()` returns the same session within a thread but a different
+#: session in each thread.
+ScopedSession = scoped_session(Session)
+
+
+def get_engine():
+    """
+    Return the database engine. The engine is created when this function is first called and any missing database
+    tables are created at the same time.
+
+    :return: Database engine
+    :rtype: :class:`sqlalchemy.engine.Engine`
+    """
+    global _engine
+    if _engine is None:
+        folder = config['db']['folder']
+        file_path = os.path.join(folder, config['db']['filename'])
+        options = _engine_options_from_config()
+        if options['read_only']:
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError("Database file `{}` does not exist and cannot be created in read-only mode "
+                                        "(`[db]` `read_only` setting).".format(file_path))
+        else:
+            os.makedirs(folder, exist_ok=True)
+        _engine = create_sqlite_engine(file_path, **options)
+        Session.configure(bind=_engine)
+        create_db_tables()
+    return _engine
+
+
+#: Valid values for the `journal_mode` setting
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+#: Valid values for the `synchronous` setting
+SYNCHRONOUS_MODES = ('off', 'normal', 'full', 'extra')
+
+
+def create_sqlite_engine(file_path, journal_mode=None, synchronous=None, cache_size=None, mmap_size=None,
+                         read_only=False):
+    """
+    Return a database engine for an sqlite database file. Any settings not provided (`None`) are left at the sqlite
+    default.
+
+    :param file_path: Location of the sqlite database file
+    :type file_path: str
+    :param journal_mode: sqlite journal mode, one of :attr:`JOURNAL_MODES`, e.g. `wal`
+    :type journal_mode: str
+    :param synchronous: sqlite synchronous mode, one of :attr:`SYNCHRONOUS_MODES`, e.g. `normal`
+    :type synchronous: str
+    :param cache_size: Page cache size in pages or, if negative, in KiB
+    :type cache_size: int
+    :param mmap_size: Maximum number of bytes to access using memory-mapped I/O
+    :type mmap_size: int
+    :param read_only: Whether to open the database file in read-only mode. Default: `False`.
+    :type read_only: bool
+    :return: Database engine
+    :rtype: :class:`sqlalchemy.engine.Engine`
+    """
+    pragmas = []
+    if journal_mode:
+        if journal_mode.lower() not in JOURNAL_MODES:
+            raise ValueError("Journal mode `{}` invalid. Must be one of {}.".format(journal_mode, JOURNAL_MODES))
+        if not read_only:  # Journal mode is stored in the database file, so cannot be changed in read-only mode
+            pragmas.append('PRAGMA journal_mode={}'.format(journal_mode.lower()))
+    if synchronous:
+        if synchronous.lower() not in SYNCHRONOUS_MODES:
+            raise ValueError("Synchronous mode `{}` invalid. Must be one of {}.".format(synchronous, SYNCHRONOUS_MODES))
+        pragmas.append('PRAGMA synchronous={}'.format(synchronous.lower()))
+    if cache_size is not None:
+        pragmas.append('PRAGMA cache_size={:d}'.format(int(cache_size)))
+    if mmap_size is not None:
+        pragmas.append('PRAGMA mmap_size={:d}'.format(int(mmap_size)))
+
+    if read_only:
+        # sqlite URI filename, see https://www.sqlite.org/uri.html
+        url = 'sqlite:///file:{}?mode=ro&uri=true'.format(pathname2url(os.path.abspath(file_path)))
+    else:
+        url = 'sqlite:///' + file_path
+    engine = create_engine(url)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+def _engine_options_from_config():
+    """
+    Return keyword arguments for :func:`create_sqlite_engine` from the `[db]` section in the config file.
+    """
+    def int_or_none(option):
+        value = config.get('db', option, fallback=None)
+        return int(value) if value else None
+
+    return {
+        'journal_mode': config.get('db', 'journal_mode', fallback=None) or None,
+        'synchronous': config.get('db', 'synchronous', fallback=None) or None,
+        'cache_size': int_or_none('cache_size'),
+        'mmap_size': int_or_none('mmap_size'),
+        'read_only': config.getboolean('db', 'read_only', fallback=False)
+    }
+
+
+def __getattr__(name):
+    # Module attributes `engine` and `metadata` are created lazily (PEP 562)
+    if name == 'engine':
+        return get_engine()
+    elif name == 'metadata':
+        get_engine()
+        return _metadata
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
 
 
 def create_db_tables():
-    # Create database tables if they don't exist yet. All entities must be imported first.
-    # This method is called from `floodestimation.__init__.py` to ensure that the database exist with valid tables when
-    # importing and calling `Session()`.
-    Base.metadata.create_all(engine)
-    # Update db.metadata
-    global metadata
-    metadata = MetaData(bind=engine, reflect=True)
+    # Create database tables if they don't exist yet. This method is called when the engine is first created to ensure
+    # that the database exist with valid tables when calling `Session()`.
+    from . import entities  # All entities must be imported first to register their tables
+    engine = get_engine()
+    if not _engine_options_from_config()['read_only']:
+        Base.metadata.create_all(engine)  # Only issues `CREATE` statements if required
+        migrate_db(engine)
+    # Update db.metadata, excluding the spatial index which is maintained by sqlite itself
+    global _metadata
+    _metadata = MetaData(bind=engine)
+    _metadata.reflect(only=lambda name, meta: not name.startswith(centroid_index.name) and
+                      name != data_version_table.name)
+
+
+def migrate_db(engine=None):
+    """
+    Upgrade an existing database to the current schema version (:attr:`SCHEMA_VERSION`).
+
+    This is done automatically when the database is first used (unless opened in read-only mode). Each migration step is
+    idempotent.
+
+    :param engine: Database engine. Default: the package's engine.
+    :type engine: :class:`sqlalchemy.engine.Engine`
+    """
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        version = conn.execute('PRAGMA user_version').scalar()
+        if version < 1:
+            # Version 1: composite indexes for donor catchment queries
+            _create_missing_indexes(conn)
+        if version < 2:
+            # Version 2: spatial index of catchment centroids
+            _create_centroid_index(conn)
+        if version < 3:
+            # Version 3: packed POT record columns
+            _add_missing_columns(conn)
+        if version < 4:
+            # Version 4: repair spatial index of catchment centroids if damaged by earlier package versions
+            if _centroid_index_exists(conn) and not _centroid_index_ok(conn):
+                logger.warning("Rebuilding damaged spatial index of catchment centroids.")
+                _rebuild_centroid_index(conn)
+        if version < 5:
+            # Version 5: data version updated by triggers
+            _create_data_version(conn)
+        if version < SCHEMA_VERSION:
+            conn.execute('PRAGMA user_version={:d}'.format(SCHEMA_VERSION))
+    _has_centroid_index.pop(engine, None)
+
+
+def _create_missing_indexes(conn):
+    # Create indexes defined in the entities but not (yet) in the database
+    inspector = Inspector.from_engine(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+
+def _add_missing_columns(conn):
+    # Add (nullable) columns defined in the entities but not (yet) in the database
+    inspector = Inspector.from_engine(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                conn.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(table.name, column.name,
+                                                                     column.type.compile(dialect=conn.dialect)))
+
+
+def _create_centroid_index(conn):
+    try:
+        conn.execute(_CENTROID_INDEX_DDL[0])
+    except OperationalError:
+        return  # sqlite library compiled without R-tree module, queries will work without the spatial index
+    for statement in _CENTROID_INDEX_DDL[1:]:
+        conn.execute(statement)
+
+
+def _create_data_version(conn):
+    conn.execute(_DATA_VERSION_DDL[0])
+    conn.execute(_DATA_VERSION_DDL[1], (uuid.uuid4().hex, ))
+    for statement in _DATA_VERSION_DDL[2:]:
+        conn.execute(statement)
+
+
+def data_version(bind):
+    """
+    Return a key identifying the current gauged catchment data (catchments, descriptors and AMAX records) in the
+    database. The key changes whenever any of these tables is changed and is unique for each database file. Retrieving
+    the key requires a single, trivial SQL statement.
+
+    :param bind: Database engine, connection or session
+    :type bind: :class:`sqlalchemy.engine.Engine` or :class:`sqlalchemy.engine.Connection` or
+                :class:`sqlalchemy.orm.session.Session`
+    :return: Data version or `None` if not recorded in the database, e.g. a database file created by an earlier version
+             of this package opened in read-only mode
+    :rtype: str
+    """
+    try:
+        row = bind.execute(data_version_table.select()).first()
+    except OperationalError:
+        return None  # Table does not exist
+    if row is None:
+        return None
+    return '{}-{}'.format(row.token, row.counter)
+
+
+def _rebuild_centroid_index(conn):
+    try:
+        conn.execute('DROP TABLE IF EXISTS ' + centroid_index.name)
+    except DatabaseError as e:
+        if not is_corruption_error(e):
+            raise
+        # sqlite cannot open, and therefore not drop, an R-tree without a root node in its internal `_node` table.
+        # Insert an empty root node of the minimum size accepted by sqlite to allow the R-tree to be dropped.
+        conn.execute('DELETE FROM {}_node'.format(centroid_index.name))
+        conn.execute('INSERT INTO {}_node VALUES (1, zeroblob(448))'.format(centroid_index.name))
+        conn.execute('DROP TABLE ' + centroid_index.name)
+    _create_centroid_index(conn)
+
+
+def _centroid_index_exists(bind):
+    # Not using `has_table()` which fails if the R-tree is damaged
+    return bind.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        (centroid_index.name, )).scalar() > 0
+
+
+def _centroid_index_ok(bind):
+    # Whether the spatial index is intact and contains all centroids in the descriptors table
+    try:
+        if bind.dialect.dbapi.sqlite_version_info >= (3, 24, 0):  # `rtreecheck()` function available
+            if bind.execute("SELECT rtreecheck('{}')".format(centroid_index.name)).scalar() != 'ok':
+                return False
+        count = bind.execute('SELECT COUNT(*) FROM ' + centroid_index.name).scalar()
+    except DatabaseError as e:
+        if not is_corruption_error(e):
+            raise
+        return False
+    return count == bind.execute('SELECT COUNT(*) FROM descriptors '
+                                 'WHERE centroid_ngr_x IS NOT NULL AND centroid_ngr_y IS NOT NULL').scalar()
+
+
+def has_centroid_index(bind):
+    """
+    Return whether the database contains the spatial index of catchment centroids (:attr:`centroid_index`).
+
+    :param bind: Database engine or connection, e.g. `session.get_bind()`
+    :type bind: :class:`sqlalchemy.engine.Engine` or :class:`sqlalchemy.engine.Connection`
+    :rtype: bool
+    """
+    engine = bind.engine
+    try:
+        result = _has_centroid_index[engine]
+        instrumentation.count('cache.centroid_index.hit')
+        return result
+    except KeyError:
+        instrumentation.count('cache.centroid_index.miss')
+        result = engine.dialect.name == 'sqlite' and _centroid_index_exists(engine)
+        _has_centroid_index[engine] = result
+        return result
+
+
+def rebuild_centroid_index(engine=None):
+    """
+    Rebuild the spatial index of catchment centroids (:attr:`centroid_index`) from the `descriptors` table, for example
+    if damaged by earlier package versions which empty all tables in the database file, incl. the index's internal
+    tables. Damaged indexes are also rebuilt by :func:`migrate_db` when upgrading to schema version 4.
+
+    :param engine: Database engine. Default: the package's engine.
+    :type engine: :class:`sqlalchemy.engine.Engine`
+    """
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        _rebuild_centroid_index(conn)
+    _has_centroid_index.pop(engine, None)
+
+
+def is_corruption_error(error):
+    """
+    Return whether a database error is caused by a corrupt database file or a damaged spatial index, as opposed to, for
+    example, a locked database.
+
+    :param error: Database error
+    :type error: :class:`sqlalchemy.exc.DatabaseError`
+    :rtype: bool
+    """
+    orig = getattr(error, 'orig', error)
+    code = getattr(orig, 'sqlite_errorcode', None)  # Python 3.11+
+    if code is not None:
+        return code & 0xff == sqlite3.SQLITE_CORRUPT  # Incl. extended codes, e.g. `SQLITE_CORRUPT_VTAB`
+    # sqlite3 raises corruption errors as `DatabaseError` itself and other errors as subclasses, e.g. `OperationalError`
+    return type(orig) is sqlite3.DatabaseError
+
+
+def disable_centroid_index(bind):
+    """
+    Stop using the spatial index of catchment centroids for a database engine, for example after a query failed because
+    the index is damaged, see :func:`rebuild_centroid_index`.
+
+    :param bind: Database engine or connection, e.g. `session.get_bind()`
+    :type bind: :class:`sqlalchemy.engine.Engine` or :class:`sqlalchemy.engine.Connection`
+    """
+    _has_centroid_index[bind.engine] = False
 
 
 def reset_db_tables():
+    engine = get_engine()
     Base.metadata.drop_all(engine)
+    engine.execute('DROP TABLE IF EXISTS ' + centroid_index.name)
+    engine.execute('DROP TABLE IF EXISTS ' + data_version_table.name)  # New token
+    engine.execute('PRAGMA user_version=0')  # Re-run all migrations, incl. creating the spatial index
+    _has_centroid_index.pop(engine, None)
     create_db_tables()
 
 
@@ -92,5 +539,121 @@ def empty_db_tables():
     """
     Empty all database tables.
     """
-    for table in reversed(metadata.sorted_tables):
+    engine = get_engine()
+    for table in reversed(_metadata.sorted_tables):
         engine.execute(table.delete())
+
+
+# Expanded lists of bound parameters, e.g. `IN (?, ?, ?)`
+_PARAM_LIST = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_template(statement):
+    """
+    Return SQL statement with normalised whitespace and lists of bound parameters collapsed, e.g. `IN (?, ?)` becomes
+    `IN (?, ...)`. Statements that differ only by the number of values in a list therefore have the same template.
+
+    :param statement: SQL statement
+    :type statement: str
+    :rtype: str
+    """
+    return _PARAM_LIST.sub('(?, ...)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class QueryCounter(object):
+    """
+    Counter of SQL statements executed in the current thread, grouped by statement template. Counting is done between
+    calls to :meth:`start` and :meth:`stop`, or inside a :func:`count_queries` block.
+    """
+
+    def __init__(self, bind=None):
+        """
+        :param bind: Count statements on this engine only. Default: all engines.
+        :type bind: :class:`sqlalchemy.engine.Engine` or :class:`sqlalchemy.engine.Connection`
+        """
+        #: Number of statements by statement template
+        self.statements = Counter()
+        self._engine = bind.engine if bind is not None else None
+
+    @property
+    def total(self):
+        """
+        Total number of statements executed.
+        """
+        return sum(self.statements.values())
+
+    def start(self):
+        _local.query_counters = _active_query_counters() + (self, )
+
+    def stop(self):
+        _local.query_counters = tuple(c for c in _active_query_counters() if c is not self)
+
+    def summary(self):
+        """
+        Return a text summary with the number of statements by template, most frequent first.
+
+        :rtype: str
+        """
+        lines = ['{} SQL statements'.format(self.total)]
+        lines += ['{:6d} x {}'.format(n, template) for template, n in self.statements.most_common()]
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return "<QueryCounter: {} statements>".format(self.total)
+
+
+# Query counters started in the current thread
+_local = threading.local()
+
+
+def _active_query_counters():
+    return getattr(_local, 'query_counters', ())
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    # Single listener for all engines, registered once as adding and removing listeners is not thread-safe
+    for counter in _active_query_counters():
+        if counter._engine is None or counter._engine is conn.engine:
+            counter.statements[statement_template(statement)] += 1
+
+
+@contextmanager
+def count_queries(bind=None):
+    """
+    Context manager counting the SQL statements issued in the current thread inside the block. The statement summary is
+    logged at `DEBUG` level when the block exits.
+
+    :param bind: Count statements on this engine only. Default: all engines.
+    :type bind: :class:`sqlalchemy.engine.Engine` or :class:`sqlalchemy.engine.Connection`
+    :return: Query counter
+    :rtype: :class:`QueryCounter`
+    """
+    counter = QueryCounter(bind)
+    counter.start()
+    try:
+        yield counter
+    finally:
+        counter.stop()
+        logger.debug(counter.summary())
+
+
+@contextmanager
+def assert_max_queries(limit, bind=None):
+    """
+    Context manager for tests which raises an :class:`AssertionError` if more than `limit` SQL statements are issued
+    inside the block, for example to detect unintended lazy loading in a loop (N+1 queries).
+
+    :param limit: Maximum number of SQL statements
+    :type limit: int
+    :param bind: Count statements on this engine only. Default: all engines.
+    :type bind: :class:`sqlalchemy.engine.Engine` or :class:`sqlalchemy.engine.Connection`
+    :return: Query counter
+    :rtype: :class:`QueryCounter`
+    """
+    with count_queries(bind) as counter:
+        yield counter
+    if counter.total > limit:
+        raise AssertionError("Expected at most {} SQL statements, got {}.\n{}".format(limit, counter.total,
+                                                                                    counter.summary()))
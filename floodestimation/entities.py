@@ -25,20 +25,66 @@ saving to a (sqlite) database. All class attributes therefore are :class:`sqlalc
 
 """
 
-from math import hypot, atan
-from datetime import timedelta
-from sqlalchemy import Column, Integer, String, Float, Boolean, Date, ForeignKey, SmallInteger, type_coerce, cast
-from sqlalchemy.orm import relationship, composite
+import json
+from collections import namedtuple
+from math import hypot, atan, isnan
+from datetime import date, timedelta
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, ForeignKey, SmallInteger, Index, LargeBinary, \
+    Text, type_coerce, cast, inspect
+from sqlalchemy.orm import relationship, composite, synonym
 from sqlalchemy.ext.mutable import MutableComposite
 from sqlalchemy.ext.hybrid import hybrid_method
 # Current package imports
-from .analysis import QmedAnalysis, InsufficientDataError
 from . import db
+# Note that `floodestimation.analysis` is imported only when required as it imports numpy etc.
+
+
+class Coordinates(namedtuple('Coordinates', ['x', 'y'])):
+    """
+    Immutable point coordinates, for read-only use in analyses. Unlike :class:`.Point` objects, coordinates are not
+    tracked for changes by the database session and are therefore cheap to create.
+
+    Example:
+
+    >>> from floodestimation.entities import Coordinates
+    >>> coordinates = Coordinates(123000, 456000)
+    >>> coordinates.x
+    123000
+
+    Coordinates compare equal to a :class:`.Point` with the same `x` and `y` values.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_values(cls, x, y):
+        """
+        Return coordinates or `None` if `x` or `y` is not available.
+
+        :param x: x-coordinate
+        :type x: int
+        :param y: y-coordinate
+        :type y: int
+        :rtype: :class:`.Coordinates` or `None`
+        """
+        if x is None or y is None:
+            return None
+        return cls(x, y)
+
+    def distance_to(self, other):
+        """
+        Return the distance to other coordinates in the same units, e.g. m.
+
+        :param other: Other coordinates
+        :type other: :class:`.Coordinates`
+        :rtype: float
+        """
+        return hypot(self.x - other.x, self.y - other.y)
 
 
 class Point(MutableComposite):
     """
-    Point coordinate object
+    Point coordinate object, used to store coordinates in the database. For read-only use, e.g. in analyses, use
+    :class:`.Coordinates` instead, for example :attr:`.Descriptors.centroid_coordinates`.
 
     Example:
 
@@ -49,8 +95,9 @@ class Point(MutableComposite):
 
     """
     def __init__(self, x, y):
-        self.x = x
-        self.y = y
+        # Not yet associated with any parent objects, so no need to alert them
+        object.__setattr__(self, 'x', x)
+        object.__setattr__(self, 'y', y)
 
     def __setattr__(self, key, value):
         object.__setattr__(self, key, value)
@@ -60,14 +107,29 @@ class Point(MutableComposite):
     def __composite_values__(self):
         return self.x, self.y
 
+    def __getstate__(self):
+        # Exclude references to parent objects when pickling
+        return self.x, self.y
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
     def __eq__(self, other):
-        return isinstance(other, Point) and \
+        return isinstance(other, (Point, Coordinates)) and \
             other.x == self.x and \
             other.y == self.y
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def coordinates(self):
+        """
+        Return immutable coordinates, see :class:`.Coordinates`.
+
+        :rtype: :class:`.Coordinates`
+        """
+        return Coordinates(self.x, self.y)
+
 
 class Catchment(db.Base):
     """
@@ -84,6 +146,10 @@ class Catchment(db.Base):
 
     """
     __tablename__ = 'catchments'
+    __table_args__ = (
+        # Composite index for selecting QMED donor catchments, see :meth:`.CatchmentCollections.nearest_qmed_catchments`
+        Index('ix_catchments_country_qmed', 'country', 'is_suitable_for_qmed'),
+    )
 
     #: Gauging station number
     id = Column(Integer, primary_key=True)
@@ -114,6 +180,8 @@ class Catchment(db.Base):
     pot_dataset = relationship("PotDataset", uselist=False, cascade="all, delete-orphan", backref="catchment")
     #: List of comments
     comments = relationship("Comment", order_by="Comment.title", cascade="all, delete-orphan", backref="catchment")
+    #: Full peak flow series (one-to-one relationship), if loaded, see :class:`.PeakFlowSeries`
+    peak_flow_series = relationship("PeakFlowSeries", uselist=False, cascade="all, delete-orphan", backref="catchment")
     #: FEH catchment descriptors (one-to-one relationship)
     descriptors = relationship("Descriptors", uselist=False, cascade="all, delete-orphan", backref="catchment")
 
@@ -131,12 +199,14 @@ class Catchment(db.Base):
         :return: QMED in m³/s
         :rtype: float
         """
+        from .analysis import QmedAnalysis
         return QmedAnalysis(self).qmed()
 
     @hybrid_method
     def distance_to(self, other_catchment):
         """
-        Returns the distance between the centroids of two catchments in kilometers.
+        Returns the distance between the centroids of two catchments in kilometers. To calculate the distances between
+        many catchments, use :func:`.distance_matrix`.
 
         :param other_catchment: Catchment to calculate distance to
         :type other_catchment: :class:`.Catchment`
@@ -145,16 +215,19 @@ class Catchment(db.Base):
         """
         try:
             if self.country == other_catchment.country:
+                # Raw centroid columns, avoiding the creation of `Point` objects
+                descr, other_descr = self.descriptors, other_catchment.descriptors
                 try:
-                    return 0.001 * hypot(self.descriptors.centroid_ngr.x - other_catchment.descriptors.centroid_ngr.x,
-                                         self.descriptors.centroid_ngr.y - other_catchment.descriptors.centroid_ngr.y)
+                    return 0.001 * hypot(descr.centroid_ngr_x - other_descr.centroid_ngr_x,
+                                         descr.centroid_ngr_y - other_descr.centroid_ngr_y)
                 except TypeError:
                     # In case no centroid available, just return infinity which is helpful in most cases
                     return float('+inf')
             else:
                 # If the catchments are in a different country (e.g. `ni` versus `gb`) then set distance to infinity.
                 return float('+inf')
-        except (TypeError, KeyError):
+        except (AttributeError, KeyError):
+            from .analysis import InsufficientDataError
             raise InsufficientDataError("Catchment `descriptors` attribute must be set first.")
 
     @distance_to.expression
@@ -185,10 +258,177 @@ class Catchment(db.Base):
         """
         return len([amax_record for amax_record in self.amax_records if amax_record.flag == 0])
 
+    def to_record(self):
+        """
+        Return all catchment data (attributes, descriptors, comments, AMAX records, POT dataset and peak flow series)
+        as a compact, picklable record of plain data, detached from any database session. Any related data not yet
+        loaded from the database are loaded first.
+
+        The catchment itself is not modified. Use :meth:`from_record` to create a catchment from the record.
+
+        :rtype: :class:`.CatchmentRecord`
+        """
+        pot = None
+        pot_dataset = self.pot_dataset
+        if pot_dataset:
+            pot_values = _column_values(pot_dataset, PotDataset, exclude=('catchment_id', ))
+            if not pot_dataset.is_packed:
+                pot_values.update(zip(('packed_dates', 'packed_flows', 'packed_stages'),
+                                      _pack_pot_arrays(*pot_dataset.record_arrays())))
+            pot = (pot_values, [(gap.start_date, gap.end_date) for gap in pot_dataset.pot_data_gaps])
+        series = None
+        if self.peak_flow_series:
+            series = _column_values(self.peak_flow_series, PeakFlowSeries, exclude=('catchment_id', ))
+        return CatchmentRecord(_column_values(self, Catchment),
+                               _column_values(self.descriptors, Descriptors, exclude=('catchment_id', ))
+                               if self.descriptors else None,
+                               [(comment.title, comment.content) for comment in self.comments],
+                               [(r.date.toordinal(), r.flow, r.stage, r.flag) for r in self.amax_records],
+                               pot,
+                               series)
+
+    @classmethod
+    def from_record(cls, record, incl_pot=True, pot_output='records'):
+        """
+        Return a new catchment object from a record created by :meth:`to_record`. The catchment is not associated with
+        any database session.
+
+        :param record: Catchment data
+        :type record: :class:`.CatchmentRecord`
+        :param incl_pot: Whether to include the POT (peaks-over-threshold) dataset. Default: ``True``.
+        :type incl_pot: bool
+        :param pot_output: ``records`` (default) or ``arrays`` to keep the POT records as packed arrays, see
+                           :meth:`.PotDataset.pack`.
+        :type pot_output: str
+        :rtype: :class:`.Catchment`
+        """
+        record = CatchmentRecord(*record)
+        catchment = cls()
+        for key, value in record.attributes.items():
+            setattr(catchment, key, value)
+        if record.descriptors is None:
+            catchment.descriptors = None
+        else:
+            for key, value in record.descriptors.items():
+                setattr(catchment.descriptors, key, value)
+        catchment.comments = [Comment(title, content) for title, content in record.comments]
+        catchment.amax_records = [AmaxRecord(date.fromordinal(d), flow, stage, flag)
+                                  for d, flow, stage, flag in record.amax_records]
+        if incl_pot and record.pot_dataset is not None:
+            pot_values, gaps = record.pot_dataset
+            pot_dataset = PotDataset(pot_data_gaps=[PotDataGap(start_date=start, end_date=end) for start, end in gaps])
+            for key, value in pot_values.items():
+                setattr(pot_dataset, key, value)
+            if pot_output == 'records':
+                pot_dataset.pot_records = list(pot_dataset.pot_records)  # Unpack
+            catchment.pot_dataset = pot_dataset
+        if record.peak_flow_series is not None:
+            catchment.peak_flow_series = PeakFlowSeries(**record.peak_flow_series)
+        return catchment
+
     def __repr__(self):
         return "{} at {} ({})".format(self.watercourse, self.location, self.id)
 
 
+def distance_matrix(catchments_a, catchments_b=None):
+    """
+    Return the distances between the centroids of all pairs of catchments in km, using NumPy arrays. Consistent with
+    :meth:`.Catchment.distance_to`, the distance between catchments in different countries or without centroid is
+    infinite.
+
+    Example:
+
+    >>> from floodestimation.entities import distance_matrix
+    >>> distance_matrix([catchment_1, catchment_2], [catchment_3])
+    array([[ 5.],
+           [inf]])
+
+    :param catchments_a: Catchments, one for each row
+    :type catchments_a: list of :class:`.Catchment`
+    :param catchments_b: Catchments, one for each column. Default: `None` (`catchments_a`, a symmetric matrix).
+    :type catchments_b: list of :class:`.Catchment`
+    :return: 2-dimensional array of distances in km
+    :rtype: :class:`numpy.ndarray`
+    """
+    from . import correlation
+
+    arrays_a = correlation.centroid_arrays(catchments_a)
+    arrays_b = arrays_a if catchments_b is None else correlation.centroid_arrays(catchments_b)
+    return correlation.cross_distance_matrix(*arrays_a, *arrays_b)
+
+
+class CatchmentRecord(namedtuple('CatchmentRecord', ['attributes', 'descriptors', 'comments', 'amax_records',
+                                                     'pot_dataset', 'peak_flow_series'], defaults=(None, ))):
+    """
+    All data of a catchment as plain Python objects, returned by :meth:`.Catchment.to_record`. Records are compact when
+    pickled and can therefore be passed to other processes efficiently. Analysis classes such as
+    :class:`floodestimation.analysis.QmedAnalysis` accept a record instead of a catchment object.
+
+    - `attributes`: :class:`.Catchment` column values (`dict`)
+    - `descriptors`: :class:`.Descriptors` column values (`dict`) or `None`
+    - `comments`: list of `(title, content)` tuples
+    - `amax_records`: list of `(day number, flow, stage, flag)` tuples, day numbers as returned by `date.toordinal()`
+    - `pot_dataset`: `None` or tuple of :class:`.PotDataset` column values (`dict`, with packed records, see
+      :meth:`.PotDataset.pack`) and list of `(start_date, end_date)` gaps
+    - `peak_flow_series`: :class:`.PeakFlowSeries` column values (`dict`) or `None`
+    """
+    __slots__ = ()
+
+
+def _column_values(obj, cls, exclude=()):
+    # Column attribute values of a mapped object as `dict`
+    return {key: getattr(obj, key) for key in _column_keys(cls) if key not in exclude}
+
+
+_COLUMN_KEYS = {}
+
+
+def _column_keys(cls):
+    try:
+        return _COLUMN_KEYS[cls]
+    except KeyError:
+        keys = _COLUMN_KEYS[cls] = [attr.key for attr in inspect(cls).column_attrs]
+        return keys
+
+
+def _pack_pot_arrays(dates, flows, stages):
+    # Packed POT record columns (dates, flows, stages) sorted by date, see :meth:`PotDataset.pack`
+    import numpy as np
+
+    order = np.argsort(dates, kind='stable')
+    return (dates[order].astype(np.int64).astype('<i4').tobytes(),
+            flows[order].astype('<f8').tobytes(),
+            stages[order].astype('<f8').tobytes())
+
+
+class CatchmentAnnotation(object):
+    """
+    Mixin for immutable records (named tuples) which annotate a :class:`.Catchment` with additional values, for example
+    a distance or a donor weighting. The first field of the record must be `catchment`.
+
+    Any attribute which is not a field of the record is looked up from the catchment itself, e.g. `record.id`. This
+    allows analysis results to be stored without setting attributes on (shared) catchment objects.
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        return getattr(self.catchment, name)
+
+
+def plain_catchment(catchment):
+    """
+    Return the plain catchment object, i.e. the catchment itself if an annotated catchment
+    (:class:`.CatchmentAnnotation`) is provided.
+
+    :param catchment: Catchment or annotated catchment
+    :type catchment: :class:`.Catchment` or :class:`.CatchmentAnnotation`
+    :rtype: :class:`.Catchment`
+    """
+    if isinstance(catchment, CatchmentAnnotation):
+        return catchment.catchment
+    return catchment
+
+
 class Descriptors(db.Base):
     """
     Set of FEH catchment descriptors.
@@ -223,6 +463,14 @@ class Descriptors(db.Base):
     #: coordinate system.
     centroid_ngr = composite(Point, centroid_ngr_x, centroid_ngr_y)
 
+    @property
+    def centroid_coordinates(self):
+        """
+        Catchment centre national grid reference as immutable :class:`.Coordinates` or `None` if not available. Unlike
+        :attr:`centroid_ngr`, this does not create a :class:`.Point` object tracked by the database session.
+        """
+        return Coordinates.from_values(self.centroid_ngr_x, self.centroid_ngr_y)
+
     #: Surface area in km² based on digital terrain model data
     dtm_area = Column(Float)
     #: Mean elevation in m
@@ -276,19 +524,23 @@ class Descriptors(db.Base):
 
         Methodology source: eqn 5.5, report FD1919/TR
 
-        :param year: Year to provide estimate for
-        :type year: float
-        :return: Urban extent parameter
-        :rtype: float
+        :param year: Year to provide estimate for, or an array of years
+        :type year: float or :class:`numpy.ndarray`
+        :return: Urban extent parameter (array if `year` is an array)
+        :rtype: float or :class:`numpy.ndarray`
         """
 
         # Decimal places increased to ensure year 2000 corresponds with 1
-        urban_expansion = 0.7851 + 0.2124 * atan((year - 1967.5) / 20.331792998)
+        if hasattr(year, '__len__'):
+            import numpy as np
+            urban_expansion = 0.7851 + 0.2124 * np.arctan((np.asarray(year, dtype=float) - 1967.5) / 20.331792998)
+        else:
+            urban_expansion = 0.7851 + 0.2124 * atan((year - 1967.5) / 20.331792998)
         try:
             return self.catchment.descriptors.urbext2000 * urban_expansion
         except TypeError:
             # Sometimes urbext2000 is not set, assume zero
-            return 0
+            return 0 * urban_expansion
 
 
 class AmaxRecord(db.Base):
@@ -305,6 +557,10 @@ class AmaxRecord(db.Base):
 
     """
     __tablename__ = 'amaxrecords'
+    __table_args__ = (
+        # Covering index for counting (valid) records per catchment when selecting donor catchments
+        Index('ix_amaxrecords_catchment_flag', 'catchment_id', 'flag'),
+    )
     #: Many-to-one reference to corresponding :class:`.Catchment` object
     catchment_id = Column(Integer, ForeignKey('catchments.id'), primary_key=True, nullable=False)
     #: Water year or hydrological year (starts 1 October)
@@ -363,6 +619,11 @@ class PotDataset(db.Base):
     """
     A peaks-over-threshold (POT) dataset including a list of :class:`.PotRecord` objects and some metadata such as start
     and end of record.
+
+    POT records are stored in the database either as a separate row for each record (the default) or as packed binary
+    arrays of dates, flows and stages in the dataset's own row. Packed arrays are much more compact and faster to load.
+    Use :meth:`pack` to convert the records or set the `[db]` `pot_storage` option to `packed` to pack all datasets
+    when loading them into the database. :attr:`pot_records` is available either way.
     """
     __tablename__ = 'potdatasets'
     #: One-to-one reference to corresponding :class:`.Catchment` object
@@ -373,17 +634,93 @@ class PotDataset(db.Base):
     end_date = Column(Date)
     #: Flow threshold in m³/s
     threshold = Column(Float)
-    #: List of peaks-over-threshold records as :class:`.PotRecord` objects
-    pot_records = relationship('PotRecord', order_by='PotRecord.date', cascade="all, delete-orphan",
-                               backref='catchment')
+    #: List of peaks-over-threshold records stored as separate database rows (:class:`.PotRecord` objects). Empty if the
+    #: records are packed, see :meth:`pack`.
+    pot_record_rows = relationship('PotRecord', order_by='PotRecord.date', cascade="all, delete-orphan",
+                                   backref='catchment')
+    #: Packed POT record dates: little-endian 32-bit integers, days since 1970-01-01
+    packed_dates = Column(LargeBinary)
+    #: Packed POT record flows in m³/s: little-endian 64-bit floats
+    packed_flows = Column(LargeBinary)
+    #: Packed POT record stages in m: little-endian 64-bit floats, `nan` if not available
+    packed_stages = Column(LargeBinary)
     #: List of peaks-over-threshold records as :class:`.PotDataGap` objects
     pot_data_gaps = relationship('PotDataGap', order_by='PotDataGap.start_date', cascade="all, delete-orphan",
                                  backref='catchment')
 
     def __init__(self, **kwargs):
+        kwargs.setdefault('pot_records', [])
+        kwargs.setdefault('pot_data_gaps', [])
         super().__init__(**kwargs)
-        self.pot_records = []
-        self.pot_data_gaps = []
+
+    @property
+    def is_packed(self):
+        """
+        Whether the POT records are stored as packed arrays.
+        """
+        return self.packed_flows is not None
+
+    def _get_pot_records(self):
+        if not self.is_packed:
+            return self.pot_record_rows
+        view = getattr(self, '_pot_records_view', None)
+        if view is None or view[0] is not self.packed_flows:
+            dates, flows, stages = self.record_arrays()
+            records = tuple(PotRecord(d, f, None if isnan(s) else s)
+                            for d, f, s in zip(dates.astype(object), flows.tolist(), stages.tolist()))
+            view = self._pot_records_view = (self.packed_flows, records)
+        return view[1]
+
+    def _set_pot_records(self, records):
+        self.packed_dates = self.packed_flows = self.packed_stages = None
+        self.pot_record_rows = list(records)
+
+    #: List of peaks-over-threshold records as :class:`.PotRecord` objects.
+    #:
+    #: If the records are packed, this is a tuple of :class:`.PotRecord` objects built from the packed arrays when
+    #: first accessed. The tuple cannot be modified; assign a new list of records instead (which also unpacks the
+    #: records). At class level this is a synonym for :attr:`pot_record_rows` and can be used in queries, joins and
+    #: loader options, e.g. `subqueryload(PotDataset.pot_records)`.
+    pot_records = synonym('pot_record_rows', descriptor=property(_get_pot_records, _set_pot_records))
+
+    def record_arrays(self):
+        """
+        Return the POT records as NumPy arrays. Packed arrays are decoded once and the result is cached; the arrays must
+        not be modified.
+
+        :return: Tuple of arrays of dates (`datetime64[D]`), flows in m³/s and stages in m (`nan` if not available)
+        :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`, :class:`numpy.ndarray`)
+        """
+        import numpy as np
+
+        if self.is_packed:
+            packed = (self.packed_dates, self.packed_flows, self.packed_stages)
+            cache = getattr(self, '_record_arrays', None)
+            if cache is None or any(a is not b for a, b in zip(cache[0], packed)):
+                arrays = (np.frombuffer(self.packed_dates, dtype='<i4').astype('datetime64[D]'),
+                          np.frombuffer(self.packed_flows, dtype='<f8'),
+                          np.frombuffer(self.packed_stages, dtype='<f8'))
+                cache = self._record_arrays = (packed, arrays)
+            return cache[1]
+
+        records = self.pot_record_rows
+        days = np.fromiter((record.date.toordinal() for record in records), dtype=np.int64, count=len(records))
+        flows = np.array([record.flow for record in records], dtype=float)
+        stages = np.array([record.stage for record in records], dtype=float)  # `None` becomes `nan`
+        return (days - _EPOCH_ORDINAL).astype('datetime64[D]'), flows, stages
+
+    def pack(self):
+        """
+        Store the POT records as packed arrays, sorted by date, instead of as separate database rows. Any
+        :class:`.PotRecord` rows are deleted from the database when the session is flushed.
+
+        To unpack the records again use `pot_dataset.pot_records = list(pot_dataset.pot_records)`.
+        """
+        if self.is_packed:
+            return
+        packed = _pack_pot_arrays(*self.record_arrays())
+        self.pot_record_rows = []
+        self.packed_dates, self.packed_flows, self.packed_stages = packed
 
     @property
     def record_length(self):
@@ -418,6 +755,9 @@ class PotDataset(db.Base):
         return result
 
 
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
 class PotDataGap(db.Base):
     """
     A gap (period) in the peaks-over-threshold (POT) records.
@@ -473,6 +813,92 @@ class PotRecord(db.Base):
         return "{}: {:.1f} m³/s".format(self.date, self.flow)
 
 
+class PeakFlowSeries(db.Base):
+    """
+    The full series of peak flows at a gauging station, as provided in NRFA peak flow (`.CSV`) files, from which both
+    the annual maximum flow and peaks-over-threshold series are derived. See
+    :class:`floodestimation.parsers.CsvSeriesParser`.
+
+    The series is stored as packed binary arrays in a single database row. Ratings, sources and comments are stored as
+    integer codes referring to a list of distinct values (:attr:`labels`).
+
+    Example:
+
+    >>> from floodestimation.entities import PeakFlowSeries
+    >>> from floodestimation.parsers import CsvSeriesParser
+    >>> series = PeakFlowSeries.from_arrays(CsvSeriesParser().parse("17002.CSV"))
+    >>> series.arrays().amax_arrays()
+    """
+    __tablename__ = 'peakflowseries'
+    #: One-to-one reference to corresponding :class:`.Catchment` object
+    catchment_id = Column(Integer, ForeignKey('catchments.id'), primary_key=True, nullable=False)
+    #: Packed dates and times of peaks: little-endian 64-bit integers, minutes since 1970-01-01 00:00
+    packed_dates = Column(LargeBinary, nullable=False)
+    #: Packed stages in m: little-endian 64-bit floats, `nan` if not available
+    packed_stages = Column(LargeBinary, nullable=False)
+    #: Packed flows in m³/s: little-endian 64-bit floats, `nan` if not available
+    packed_flows = Column(LargeBinary, nullable=False)
+    #: Packed AMAX-only flags: 8-bit integers, 1 if the peak is only included as an annual maximum
+    packed_amax_only = Column(LargeBinary, nullable=False)
+    #: Packed rating, source and comment codes: little-endian 32-bit integers, 3 per peak, referring to :attr:`labels`
+    packed_label_codes = Column(LargeBinary, nullable=False)
+    #: Distinct ratings, sources and comments as JSON: `[[rating, ...], [source, ...], [comment, ...]]`
+    labels = Column(Text, nullable=False)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Return a new series from arrays.
+
+        :param arrays: Peak flow series as returned by :class:`floodestimation.parsers.CsvSeriesParser`
+        :type arrays: :class:`floodestimation.parsers.PeakFlowArrays`
+        :rtype: :class:`.PeakFlowSeries`
+        """
+        import numpy as np
+
+        labels = []
+        codes = []
+        for values in (arrays.ratings, arrays.sources, arrays.comments):
+            distinct, inverse = np.unique(values, return_inverse=True)
+            labels.append(distinct.tolist())
+            codes.append(inverse.reshape(-1))
+        return cls(packed_dates=arrays.dates.astype('datetime64[m]').astype('<i8').tobytes(),
+                   packed_stages=np.asarray(arrays.stages, dtype='<f8').tobytes(),
+                   packed_flows=np.asarray(arrays.flows, dtype='<f8').tobytes(),
+                   packed_amax_only=np.asarray(arrays.amax_only, dtype='u1').tobytes(),
+                   packed_label_codes=np.column_stack(codes).astype('<i4').tobytes(),
+                   labels=json.dumps(labels))
+
+    def arrays(self):
+        """
+        Return the series as NumPy arrays. The packed arrays are decoded once and the result is cached; the arrays must
+        not be modified.
+
+        :rtype: :class:`floodestimation.parsers.PeakFlowArrays`
+        """
+        import numpy as np
+        from .parsers import PeakFlowArrays
+
+        packed = (self.packed_dates, self.packed_flows, self.packed_label_codes)
+        cache = getattr(self, '_arrays', None)
+        if cache is None or any(a is not b for a, b in zip(cache[0], packed)):
+            codes = np.frombuffer(self.packed_label_codes, dtype='<i4').reshape(-1, 3)
+            labels = [np.array(values, dtype=str) for values in json.loads(self.labels)]
+            arrays = PeakFlowArrays(np.frombuffer(self.packed_dates, dtype='<i8').astype('datetime64[m]'),
+                                    np.frombuffer(self.packed_stages, dtype='<f8'),
+                                    np.frombuffer(self.packed_flows, dtype='<f8'),
+                                    *(values[codes[:, i]] for i, values in enumerate(labels)),
+                                    np.frombuffer(self.packed_amax_only, dtype='u1').astype(bool))
+            cache = self._arrays = (packed, arrays)
+        return cache[1]
+
+    def __len__(self):
+        return len(self.packed_flows) // 8
+
+    def __repr__(self):
+        return "PeakFlowSeries: {} peaks".format(len(self))
+
+
 class Comment(db.Base):
     """
     Comments on cachment contained in CD3 file. Each comment has a title (normally one of `station`, `catchment`,
@@ -114,6 +114,7 @@ def download_data():
     Downloads complete station dataset including catchment descriptors and amax records. And saves it into a cache
     folder.
     """
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
     with urlopen(_retrieve_download_url()) as f:
         with open(os.path.join(CACHE_FOLDER, CACHE_ZIP), "wb") as local_file:
             local_file.write(f.read())
@@ -169,7 +170,7 @@ def clear_cache():
     """
     Delete all files from cache folder.
     """
-    shutil.rmtree(CACHE_FOLDER)
+    shutil.rmtree(CACHE_FOLDER, ignore_errors=True)
     os.makedirs(CACHE_FOLDER)
 
 
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2015  Florenz A.P. Hollebrandse <f.a.p.hollebrandse@protonmail.ch>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides optional instrumentation of analyses: nested timing spans, the number of SQL statements executed
+and counters such as cache hits and misses.
+
+Instrumentation is enabled per analysis object, for example:
+
+>>> from floodestimation.analysis import QmedAnalysis
+>>> analysis = QmedAnalysis(catchment, gauged_catchments, instrument=True)
+>>> analysis.qmed()
+>>> analysis.results_log['instrumentation'].to_dict()
+{'qmed.calls': 1, 'qmed.time': 0.0213, 'qmed.sql': 3, 'qmed.descriptors_2008.calls': 1, ...,
+ 'sql.statements': 3, 'counters.cache.centroid_index.hit': 1}
+
+When disabled (the default), analyses use :data:`NULL_INSTRUMENTATION` which does nothing.
+"""
+
+import json
+import threading
+import functools
+from time import perf_counter
+from collections import OrderedDict, Counter
+# Current package imports
+from . import db
+
+# Instrumentation objects with an open span in the current thread
+_local = threading.local()
+
+
+def _active():
+    return getattr(_local, 'active', ())
+
+
+def count(name, n=1):
+    """
+    Increment a counter, e.g. `cache.abc.hit`, of all instrumentation objects with an open span in the current thread.
+
+    :param name: Counter name
+    :type name: str
+    :param n: Increment. Default: 1.
+    :type n: int
+    """
+    for instrumentation in _active():
+        instrumentation.counters[name] += n
+
+
+class Instrumentation(object):
+    """
+    Collection of timing spans, SQL statement counts and other counters.
+    """
+    enabled = True
+
+    def __init__(self):
+        #: Statistics by span path (e.g. `qmed.descriptors_2008.donors`): list of `[calls, time, sql statements]`
+        self.spans = OrderedDict()
+        #: Counters by name
+        self.counters = Counter()
+        #: SQL statements executed during any span, see :class:`floodestimation.db.QueryCounter`
+        self.queries = db.QueryCounter()
+        self._path = []
+
+    @property
+    def sql_statements(self):
+        """
+        Total number of SQL statements executed during any span
+        """
+        return self.queries.total
+
+    def span(self, name):
+        """
+        Return a context manager timing the code inside the block. Spans can be nested.
+
+        :param name: Span name
+        :type name: str
+        """
+        return _Span(self, name)
+
+    def to_dict(self):
+        """
+        Return all statistics as a flat dict. Span statistics use keys `<span path>.calls`, `<span path>.time` (in
+        seconds) and `<span path>.sql`. Counters use keys `counters.<name>`.
+
+        :rtype: dict
+        """
+        result = OrderedDict()
+        for path, (calls, time, sql) in self.spans.items():
+            result[path + '.calls'] = calls
+            result[path + '.time'] = time
+            result[path + '.sql'] = sql
+        result['sql.statements'] = self.sql_statements
+        for name, value in sorted(self.counters.items()):
+            result['counters.' + name] = value
+        return result
+
+    def to_json(self, **kwargs):
+        """
+        Return all statistics as a JSON string. See :meth:`to_dict`.
+
+        :param kwargs: Any keyword arguments for :func:`json.dumps`, e.g. `indent=2`.
+        :rtype: str
+        """
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def __repr__(self):
+        return "<Instrumentation: {} spans, {} SQL statements>".format(len(self.spans), self.sql_statements)
+
+
+class _Span(object):
+    __slots__ = ('instrumentation', 'name', 'start', 'sql_start')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        instr = self.instrumentation
+        if not instr._path:
+            # Outermost span: start counting SQL statements etc. in this thread
+            _local.active = _active() + (instr, )
+            instr.queries.start()
+        instr._path.append(self.name)
+        self.sql_start = instr.sql_statements
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = perf_counter() - self.start
+        instr = self.instrumentation
+        stats = instr.spans.setdefault('.'.join(instr._path), [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] += instr.sql_statements - self.sql_start
+        instr._path.pop()
+        if not instr._path:
+            instr.queries.stop()
+            _local.active = tuple(i for i in _active() if i is not instr)
+        return False
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class NullInstrumentation(object):
+    """
+    Instrumentation which does nothing, used when instrumentation is disabled.
+    """
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, name):
+        return self._span
+
+    def to_dict(self):
+        return {}
+
+    def to_json(self, **kwargs):
+        return '{}'
+
+
+#: Shared instance of :class:`NullInstrumentation`
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+def instrumented(name):
+    """
+    Decorator for analysis methods to time the method as a span named `name`. Uses the analysis object's
+    :attr:`instrumentation` attribute.
+
+    :param name: Span name
+    :type name: str
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.instrumentation.enabled:
+                return method(self, *args, **kwargs)
+            with self.instrumentation.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -21,18 +21,24 @@ CD3-files and to download all gauged catchments and save into a sqlite database.
 """
 
 import os.path
+from sqlalchemy import inspect
+from sqlalchemy.orm.util import identity_key
 # Current package imports
 from . import fehdata
 from . import parsers
 from .settings import config
+from .entities import Catchment, Descriptors, AmaxRecord, Comment, PotDataset, PotDataGap, PotRecord, PeakFlowSeries
 
+#: Valid values for the `[db]` `pot_storage` config option
+POT_STORAGE_OPTIONS = ('rows', 'packed')
 
-def from_file(file_path, incl_pot=True):
+def from_file(file_path, incl_pot=True, pot_output='records', incl_series=False):
     """
     Load catchment object from a ``.CD3`` or ``.xml`` file.
 
     If there is also a corresponding ``.AM`` file (annual maximum flow data) or
     a ``.PT`` file (peaks over threshold data) in the same folder as the CD3 file, these datasets will also be loaded.
+    Optionally, the full peak flow series is loaded from a corresponding ``.CSV`` file.
 
     :param file_path: Location of CD3 or xml file
     :type file_path: str
@@ -40,6 +46,12 @@ def from_file(file_path, incl_pot=True):
     :rtype: :class:`.entities.Catchment`
     :param incl_pot: Whether to load the POT (peaks-over-threshold) data. Default: ``True``.
     :type incl_pot: bool
+    :param pot_output: ``records`` (default) or ``arrays`` to load the POT records as packed arrays, see
+                       :class:`.parsers.PotParser`.
+    :type pot_output: str
+    :param incl_series: Whether to load the full peak flow series (:attr:`peak_flow_series`) as packed arrays, see
+                        :class:`.entities.PeakFlowSeries`. Default: ``False``.
+    :type incl_series: bool
     """
     filename, ext = os.path.splitext(file_path)
     am_file_path = filename + '.AM'
@@ -59,19 +71,38 @@ def from_file(file_path, incl_pot=True):
     # POT records
     if incl_pot:
         try:
-            catchment.pot_dataset = parsers.PotParser().parse(pot_file_path)
+            catchment.pot_dataset = parsers.PotParser(output=pot_output).parse(pot_file_path)
         except FileNotFoundError:
             pass
 
+    if incl_series:
+        _load_series(catchment, file_path)
+
     return catchment
 
 
+def _load_series(catchment, file_path):
+    # Set the catchment's full peak flow series from the `.CSV` file corresponding with the catchment file, if any
+    try:
+        arrays = parsers.CsvSeriesParser().parse(os.path.splitext(file_path)[0] + '.CSV')
+    except FileNotFoundError:
+        return
+    catchment.peak_flow_series = PeakFlowSeries.from_arrays(arrays)
+
+
 def to_db(catchment, session, method='create', autocommit=False):
     """
     Load catchment object into the database.
 
     A catchment/station number (:attr:`catchment.id`) must be provided. If :attr:`method` is set to `update`, any
-    existing catchment in the database with the same catchment number will be updated.
+    existing catchment in the database with the same catchment number will be replaced. This is done using set-based
+    SQL statements: the catchment row is upserted and all related rows (descriptors, AMAX records, POT data, comments
+    etc.) are deleted and inserted again in bulk, within the session's transaction. Any existing catchment object in the
+    session is removed from the session (see :meth:`sqlalchemy.orm.session.Session.expunge`); query the catchment again
+    to use the updated data.
+
+    POT records are packed (see :meth:`.entities.PotDataset.pack`) if the `[db]` `pot_storage` config option is set to
+    `packed`.
 
     :param catchment: New catchment object to replace any existing catchment in the database
     :type catchment: :class:`.entities.Catchment`
@@ -82,21 +113,90 @@ def to_db(catchment, session, method='create', autocommit=False):
     :type method: str
     :param autocommit: Whether to commit the database session immediately. Default: ``False``.
     :type autocommit: bool
+    :return: Number of rows loaded for the catchment by table name, e.g. `{'catchments': 1, 'amaxrecords': 40, ...}`
+    :rtype: dict
     """
 
     if not catchment.id:
         raise ValueError("Catchment/station number (`catchment.id`) must be set.")
+    if catchment.pot_dataset and _pot_storage() == 'packed':
+        catchment.pot_dataset.pack()
     if method == 'create':
         session.add(catchment)
+        counts = {entity.__tablename__: len(objs) for entity, objs in _catchment_objects(catchment).items()}
     elif method == 'update':
-        session.merge(catchment)
+        counts = _upsert(catchment, session)
     else:
         raise ValueError("Method `{}` invalid. Use either `create` or `update`.")
     if autocommit:
         session.commit()
+    return counts
+
+
+# Tables of related rows, in order of deletion
+_CHILD_ENTITIES = (PotRecord, PotDataGap, PotDataset, AmaxRecord, Comment, PeakFlowSeries, Descriptors)
+
+
+def _catchment_objects(catchment):
+    # Lists of the catchment object itself and all related objects by entity, in order of insertion
+    pot_dataset = catchment.pot_dataset
+    return {
+        Catchment: [catchment],
+        Descriptors: [catchment.descriptors] if catchment.descriptors else [],
+        AmaxRecord: catchment.amax_records,
+        Comment: catchment.comments,
+        PotDataset: [pot_dataset] if pot_dataset else [],
+        PotDataGap: pot_dataset.pot_data_gaps if pot_dataset else [],
+        PotRecord: pot_dataset.pot_record_rows if pot_dataset else [],
+        PeakFlowSeries: [catchment.peak_flow_series] if catchment.peak_flow_series else []
+    }
+
+
+def _column_values(obj, entity, catchment_id):
+    # Column values for inserting an object as a row. All rows must have the same columns for `executemany()`, so
+    # unset values are replaced by the column's (scalar) default, if any.
+    values = {}
+    for attr in inspect(entity).column_attrs:
+        column = attr.columns[0]
+        value = catchment_id if column.name == 'catchment_id' else getattr(obj, attr.key)
+        if value is None and column.default is not None and column.default.is_scalar:
+            value = column.default.arg
+        values[column.name] = value
+    return values
+
+
+def _upsert(catchment, session):
+    # Replace catchment and all related rows using bulk statements
+    session.flush()  # Any pending changes must be written first
+    rows = {entity: [_column_values(obj, entity, catchment.id) for obj in objs]
+            for entity, objs in _catchment_objects(catchment).items()}
+    existing = session.identity_map.get(identity_key(Catchment, catchment.id))
+    if existing is not None:
+        session.expunge(existing)  # Incl. related objects, these are replaced below
+    if catchment in session:
+        session.expunge(catchment)
+
+    conn = session.connection()
+    for entity in _CHILD_ENTITIES:
+        conn.execute(entity.__table__.delete().where(entity.__table__.c.catchment_id == catchment.id))
+    for entity, entity_rows in rows.items():
+        if entity_rows:
+            insert = entity.__table__.insert()
+            if entity is Catchment:
+                insert = insert.prefix_with('OR REPLACE')  # Upsert
+            conn.execute(insert, entity_rows)  # Using `executemany` for multiple rows
+    return {entity.__tablename__: len(entity_rows) for entity, entity_rows in rows.items()}
+
+
+def _pot_storage():
+    pot_storage = config.get('db', 'pot_storage', fallback='rows') or 'rows'
+    if pot_storage not in POT_STORAGE_OPTIONS:
+        raise ValueError("POT storage option `{}` invalid. Must be one of {}.".format(pot_storage, POT_STORAGE_OPTIONS))
+    return pot_storage
 
 
-def folder_to_db(path, session, method='create', autocommit=False, incl_pot=True):
+def folder_to_db(path, session, method='create', autocommit=False, incl_pot=True, station_cache=None,
+                 incl_series=False):
     """
     Import an entire folder (incl. sub-folders) into the database
 
@@ -111,17 +211,69 @@ def folder_to_db(path, session, method='create', autocommit=False, incl_pot=True
     :type autocommit: bool
     :param incl_pot: Whether to load the POT (peaks-over-threshold) data. Default: ``True``.
     :type incl_pot: bool
+    :param station_cache: Cache of parsed stations to load unchanged files from. Default: `None` (parse all files).
+    :type station_cache: :class:`.stationcache.StationCache`
+    :param incl_series: Whether to load the full peak flow series from ``.CSV`` files. Default: ``False``.
+    :type incl_series: bool
     """
     if not os.path.isdir(path):
         raise ValueError("Folder `{}` does not exist or is not accesible.".format(path))
 
     cd3_files = [os.path.join(dp, f) for dp, dn, filenames in os.walk(path)
                  for f in filenames if os.path.splitext(f)[1].lower() == '.cd3']
-    for cd3_file_path in cd3_files:
-        catchment = from_file(cd3_file_path, incl_pot)
+    # Parse POT records straight into arrays if they are stored packed anyway
+    pot_output = 'arrays' if _pot_storage() == 'packed' else 'records'
+    load = station_cache.from_file if station_cache is not None else from_file
+
+    def catchments():
+        for cd3_file_path in cd3_files:
+            catchment = load(cd3_file_path, incl_pot, pot_output)
+            if incl_series:
+                _load_series(catchment, cd3_file_path)
+            yield catchment
+
+    catchments_to_db(catchments(), session, method, autocommit)
+
+
+def catchments_to_db(catchments, session, method='create', autocommit=False, flush_every=100):
+    """
+    Load catchment objects from any iterable, e.g. a generator, into the database.
+
+    Catchments are flushed to the database in batches such that catchments already loaded are not kept in memory. This
+    allows catchments to be loaded incrementally from large files, for example using
+    :meth:`.parsers.XmlCatchmentParser.iterparse`. Catchments must have a station number (:attr:`catchment.id`); XML
+    exports do not include station numbers, so these must be set first::
+
+        def numbered(catchments, first_id):
+            for catchment_id, catchment in enumerate(catchments, first_id):
+                catchment.id = catchment_id
+                yield catchment
+
+        catchments = parsers.XmlCatchmentParser().iterparse('export.xml')
+        loaders.catchments_to_db(numbered(catchments, 900001), session, autocommit=True)
+
+    :param catchments: Catchment objects
+    :type catchments: iterable of :class:`.entities.Catchment`
+    :param session: database session to use, typically `floodestimation.db.Session()`
+    :type session: :class:`sqlalchemy.orm.session.Session`
+    :param method: - ``create``: only new catchments will be loaded, it must not already exist in the database.
+                   - ``update``: any existing catchment in the database will be updated. Otherwise it will be created.
+    :type method: str
+    :param autocommit: Whether to commit the database session at the end. Default: ``False``.
+    :type autocommit: bool
+    :param flush_every: Number of catchments to flush to the database at a time. Default: 100.
+    :type flush_every: int
+    :return: Number of catchments loaded
+    :rtype: int
+    """
+    n = 0
+    for n, catchment in enumerate(catchments, start=1):
         to_db(catchment, session, method)
+        if n % flush_every == 0:
+            session.flush()
     if autocommit:
         session.commit()
+    return n
 
 
 # Some specific import methods below:
@@ -159,6 +311,9 @@ def userdata_to_db(session, method='update', autocommit=False):
 
     If this configuration key does not exist this will be silently ignored.
 
+    Parsed stations are cached (see :mod:`.stationcache`) if enabled using ``station_cache = yes`` in the same config
+    section.
+
     :param session: database session to use, typically `floodestimation.db.Session()`
     :type session: :class:`sqlalchemy.orm.session.Session`
     :param method: - ``create``: only new catchments will be loaded, it must not already exist in the database.
@@ -173,4 +328,12 @@ def userdata_to_db(session, method='update', autocommit=False):
     except KeyError:
         return
     if folder:
-        folder_to_db(folder, session, method=method, autocommit=autocommit)
+        station_cache = None
+        if config.getboolean('import', 'station_cache', fallback=False):
+            from .stationcache import StationCache
+            station_cache = StationCache()
+        try:
+            folder_to_db(folder, session, method=method, autocommit=autocommit, station_cache=station_cache)
+        finally:
+            if station_cache is not None:
+                station_cache.close()
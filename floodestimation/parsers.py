@@ -40,8 +40,9 @@ Example:
 
 """
 
-import time
+import io
 import datetime
+from collections import namedtuple
 import xml.etree.ElementTree as ET
 import math
 # Current package imports
@@ -62,8 +63,14 @@ class FehFileParser(object):
     """
     #: Class of object to be returned by parser.
     parsed_class = object
-
-    def __init__(self):
+    #: Supported output modes, see :attr:`output`
+    output_options = ('records', )
+
+    def __init__(self, output='records'):
+        if output not in self.output_options:
+            raise ValueError("Output `{}` invalid. Must be one of {}.".format(output, self.output_options))
+        #: Output mode: `records` (entity objects) or, if supported by the parser, `arrays` (NumPy arrays)
+        self.output = output
         #: Object that will be returned at end of parsing.
         self.object = None
 
@@ -75,22 +82,7 @@ class FehFileParser(object):
         :type s: str
         :return: Parsed object
         """
-        self.object = self.parsed_class()
-        in_section = None  # Holds name of FEH file section while traversing through file.
-        for line in s.split('\n'):
-            if line.lower().startswith('[end]'):
-                # Leave section
-                in_section = None
-            elif line.startswith('['):
-                # Enter section, sanitise `[Section Name]` to `section_name`
-                in_section = line.strip().strip('[]').lower().replace(' ', '_')
-            elif in_section:
-                try:
-                    # Call method `_section_section_name(line)`
-                    getattr(self, '_section_' + in_section)(line.strip())
-                except AttributeError:
-                    pass  # Skip unsupported section
-        return self.object
+        return self._parse_lines(io.StringIO(s))
 
     def parse(self, file_name):
         """
@@ -100,11 +92,50 @@ class FehFileParser(object):
         :type file_name: str
         :return: Parsed object
         """
-        self.object = self.parsed_class()
         with open(file_name, encoding='utf-8') as f:
-            self.parse_str(f.read())
+            return self._parse_lines(f)
+
+    def _parse_lines(self, lines):
+        """
+        Parse lines from an iterable, e.g. a file object, and return relevant object.
+
+        The method handling the lines of a section, `_section_section_name(line)`, is looked up once when entering the
+        section. Lines in unsupported sections and empty lines are skipped.
+
+        :param lines: Iterable of lines
+        :return: Parsed object
+        """
+        self.object = self.parsed_class()
+        self._start()
+        handler = None  # Method handling lines of the FEH file section while traversing through file.
+        for line in lines:
+            if line.startswith('['):
+                if line[:5].lower() == '[end]':
+                    # Leave section
+                    handler = None
+                else:
+                    # Enter section, sanitise `[Section Name]` to `section_name`
+                    in_section = line.strip().strip('[]').lower().replace(' ', '_')
+                    handler = getattr(self, '_section_' + in_section, None)  # `None` for unsupported section
+            elif handler is not None:
+                line = line.strip()
+                if line:
+                    handler(line)
+        self._finish()
         return self.object
 
+    def _start(self):
+        """
+        Reset any parser state before parsing a file.
+        """
+        pass
+
+    def _finish(self):
+        """
+        Complete the parsed object after all lines have been parsed.
+        """
+        pass
+
     @staticmethod
     def parse_feh_date_format(s):
         """
@@ -115,27 +146,97 @@ class FehFileParser(object):
         :return: date object
         :rtype: :class:`datetime.date`
         """
-        return datetime.date(*time.strptime(s, "%d %b %Y")[0:3])
+        try:
+            day, month, year = s.split()
+            return datetime.date(int(year), _MONTHS[month.lower()], int(day))
+        except (ValueError, KeyError):
+            raise ValueError("Date `{}` does not match FEH date format `01 Jan 1970`.".format(s.strip()))
+
+
+#: Month numbers by lowercase English month abbreviation, e.g. `jan`: 1
+_MONTHS = {name: i for i, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+
+# Ordinal of 1970-01-01, the epoch of `datetime64` arrays
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+class AmaxArrays(namedtuple('AmaxArrays', ['dates', 'water_years', 'flows', 'stages', 'flags'])):
+    """
+    Annual maximum flow records as NumPy arrays, returned by :class:`AmaxParser` with `output='arrays'`.
+
+    - `dates`: dates of maximum flow (`datetime64[D]`)
+    - `water_years`: water years (`int`)
+    - `flows`: flows in m³/s, `nan` if invalid
+    - `stages`: water levels in m, `nan` if not available
+    - `flags`: data quality flags. 0: valid value, 1: invalid value, 2: rejected record. See
+      :attr:`floodestimation.entities.AmaxRecord.flag`.
+    """
+    __slots__ = ()
+
+    def valid_flows(self):
+        """
+        Return flows of valid records (flag 0) only, equivalent to :func:`floodestimation.analysis.valid_flows_array`.
+
+        :rtype: :class:`numpy.ndarray`
+        """
+        return self.flows[self.flags == 0]
+
+    def to_records(self):
+        """
+        Return the records as a list of :class:`floodestimation.entities.AmaxRecord` objects.
+
+        :rtype: list of :class:`floodestimation.entities.AmaxRecord`
+        """
+        result = []
+        for d, flow, stage, flag in zip(self.dates.tolist(), self.flows.tolist(), self.stages.tolist(),
+                                        self.flags.tolist()):
+            result.append(entities.AmaxRecord(d, None if math.isnan(flow) else flow,
+                                              None if math.isnan(stage) else stage, flag))
+        return result
 
 
 class AmaxParser(FehFileParser):
+    """
+    Parser for annual maximum flow (`.AM`) files.
+
+    By default (`output='records'`), :meth:`parse` returns a list of :class:`floodestimation.entities.AmaxRecord`
+    objects. With `output='arrays'`, an :class:`AmaxArrays` object is returned instead without creating an object for
+    each record. Rejected years are then applied to all records, regardless of the position of the `[AM Rejected]`
+    section in the file.
+    """
     #: Class to be returned by :meth:`parse`. In this case a list of :class:`AmaxRecord` objects.
     parsed_class = list
+    output_options = ('records', 'arrays')
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, output='records'):
+        super().__init__(output)
         self.rejected_years = []
 
+    def _start(self):
+        self.rejected_years = []
+        # Rejected periods as (first water year, last water year)
+        self._rejected_periods = []
+        # Columns when parsing to arrays: day numbers (ordinals), flows and stages
+        self._columns = ([], [], [])
+
     def _section_station_number(self, line):
         # Store station number (not used)
         self.station_number = line
 
     def _section_am_values(self, line):
-        # Spit line in columns
-        row = [s.strip() for s in line.split(',')]
+        # Spit line in columns (whitespace around values is ignored when converting them)
+        row = line.split(',')
         # Date in first column
         date = self.parse_feh_date_format(row[0])
 
+        if self.output == 'arrays':
+            days, flows, stages = self._columns
+            days.append(date.toordinal())
+            flows.append(float(row[1]))
+            stages.append(float(row[2]) if len(row) >= 3 else -1)
+            return
+
         # Flow rate in second column
         flow = float(row[1])
         flag = 0
@@ -163,11 +264,49 @@ class AmaxParser(FehFileParser):
     def _section_am_rejected(self, line):
         row = [int(s.strip()) for s in line.split(',')]
         self.rejected_years += list(range(row[0], row[1] + 1))  # Add 1 because AM file interval includes end year
+        self._rejected_periods.append((row[0], row[1]))
+
+    def _finish(self):
+        if self.output != 'arrays':
+            return
+        import numpy as np
+
+        days, flows, stages = (np.array(column, dtype=dtype)
+                               for column, dtype in zip(self._columns, (int, float, float)))
+        dates = (days - _EPOCH_ORDINAL).astype('datetime64[D]')
+        years = dates.astype('datetime64[Y]').astype(int) + 1970
+        months = dates.astype('datetime64[M]').astype(int) % 12 + 1
+        water_years = years - (months < entities.AmaxRecord.WATER_YEAR_FIRST_MONTH)
+
+        flags = np.zeros(len(days), dtype=np.int8)
+        invalid = flows < 0
+        flags[invalid] = 1
+        flows[invalid] = np.nan
+        stages[stages < 0] = np.nan
+        for first_year, last_year in self._rejected_periods:
+            flags[(water_years >= first_year) & (water_years <= last_year)] = 2
+        self.object = AmaxArrays(dates, water_years, flows, stages, flags)
 
 
 class PotParser(FehFileParser):
+    """
+    Parser for peaks-over-threshold (`.PT`) files.
+
+    By default (`output='records'`), :meth:`parse` returns a :class:`floodestimation.entities.PotDataset` with a list of
+    :class:`floodestimation.entities.PotRecord` objects. With `output='arrays'`, the dataset's records are stored as
+    packed arrays instead (see :meth:`floodestimation.entities.PotDataset.pack`) without creating an object for each
+    record. Use :meth:`floodestimation.entities.PotDataset.record_arrays` to obtain the arrays.
+
+    Creating a :class:`floodestimation.entities.PotRecord` object for each record dominates the parsing time. For large
+    files or many files, use `output='arrays'` which is about ten times faster than the default.
+    """
     #: Class to be returned by :meth:`parse`. In this case a :class:`PotDataset` objects.
     parsed_class = entities.PotDataset
+    output_options = ('records', 'arrays')
+
+    def _start(self):
+        # Columns when parsing to arrays: day numbers (ordinals), flows and stages
+        self._columns = ([], [], [])
 
     def _section_station_number(self, line):
         self.object.catchment_id = int(line.strip())
@@ -189,21 +328,40 @@ class PotParser(FehFileParser):
         self.object.pot_data_gaps.append(pot_data_gap)
 
     def _section_pot_values(self, line):
-        row = [s.strip() for s in line.split(',')]
+        row = line.split(',')
         date = self.parse_feh_date_format(row[0])
         flow = float(row[1])
-        if flow < 0:
-            flow = None
         try:
             stage = float(row[2])
-            if stage < 0:
-                stage = None
-        except ValueError:
-            stage = None
+        except (ValueError, IndexError):
+            stage = -1
+
+        if self.output == 'arrays':
+            days, flows, stages = self._columns
+            days.append(date.toordinal())
+            flows.append(flow)
+            stages.append(stage)
+            return
 
-        pot_record = entities.PotRecord(date, flow, stage)
+        pot_record = entities.PotRecord(date, None if flow < 0 else flow, None if stage < 0 else stage)
         self.object.pot_records.append(pot_record)
 
+    def _finish(self):
+        if self.output != 'arrays':
+            return
+        import numpy as np
+
+        days, flows, stages = (np.array(column, dtype=dtype)
+                               for column, dtype in zip(self._columns, (int, float, float)))
+        flows[flows < 0] = np.nan
+        stages[stages < 0] = np.nan
+        order = np.argsort(days, kind='stable')
+        dataset = self.object
+        dataset.pot_records = []
+        dataset.packed_dates = (days[order] - _EPOCH_ORDINAL).astype('<i4').tobytes()
+        dataset.packed_flows = flows[order].astype('<f8').tobytes()
+        dataset.packed_stages = stages[order].astype('<f8').tobytes()
+
 
 class Cd3Parser(FehFileParser):
     #: Class to be returned by :meth:`parse`. In this case :class:`Catchment` objects.
@@ -222,7 +380,7 @@ class Cd3Parser(FehFileParser):
             self.object.area = float(row[1])
         elif row[0].lower() == 'nominal ngr':
             # (E, N) in meters.
-            self.object.point = entities.Point(100*int(row[1]), 100*int(row[2]))
+            self.object.point_x, self.object.point_y = 100*int(row[1]), 100*int(row[2])
 
     def _section_descriptors(self, line):
         row = [s.strip() for s in line.split(',')]
@@ -242,7 +400,9 @@ class Cd3Parser(FehFileParser):
         # Coordinates
         else:
             # (E, N) in meters.
-            setattr(self.object.descriptors, name, entities.Point(int(row[2]), int(row[3])))
+            # Raw columns rather than a `Point` object (change tracking is not required for new objects)
+            setattr(self.object.descriptors, name + '_x', int(row[2]))
+            setattr(self.object.descriptors, name + '_y', int(row[3]))
             # Set country using info provided as part of coordinates.
             country_mapping = {'gb': 'gb',
                                'ireland': 'ni'}
@@ -265,6 +425,9 @@ class XmlCatchmentParser(object):
     Parser for XML catchment files as exported from FEH CD-ROM (v3).
 
     An xml schema is not available.
+
+    Files containing many catchments (multiple `CatchmentDescriptors` elements) can be parsed incrementally using
+    :meth:`iterparse`.
     """
 
     def parse(self, file_name):
@@ -291,21 +454,49 @@ class XmlCatchmentParser(object):
         root = ET.fromstring(s)
         return self._parse(root)
 
+    def iterparse(self, source):
+        """
+        Parse a file incrementally and yield a :class:`Catchment` object for each `CatchmentDescriptors` element.
+
+        Elements are discarded once processed such that memory use does not depend on the number of catchments in the
+        file.
+
+        :param source: File path or file object
+        :type source: str
+        :return: Generator of parsed objects
+        :rtype: generator of :class:`Catchment`
+        """
+        root = None
+        depth = 0
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                # End of a top-level element, e.g. `CatchmentDescriptors`
+                if elem.tag == 'CatchmentDescriptors':
+                    yield self._parse_descriptors(elem)
+                root.clear()  # Discard processed elements
+
     def _parse(self, root):
-        descr_node = root.find('CatchmentDescriptors')
+        return self._parse_descriptors(root.find('CatchmentDescriptors'))
 
+    def _parse_descriptors(self, descr_node):
         catchment = entities.Catchment()
         catchment.id = None
         country = descr_node.get('grid').lower()
         catchment.country = country if country in ['gb', 'ni'] else None
         catchment.area = float(descr_node.find('area').text)
-        catchment.point = entities.Point(int(descr_node.get('x')), int(descr_node.get('y')))
+        catchment.point_x, catchment.point_y = int(descr_node.get('x')), int(descr_node.get('y'))
 
         descr = catchment.descriptors
         descr.dtm_area = catchment.area
-        descr.ihdtm_ngr = catchment.point
+        descr.ihdtm_ngr_x, descr.ihdtm_ngr_y = catchment.point_x, catchment.point_y
         centr_node = descr_node.find('CatchmentCentroid')
-        descr.centroid_ngr = entities.Point(int(centr_node.get('x')), int(centr_node.get('y')))
+        descr.centroid_ngr_x, descr.centroid_ngr_y = int(centr_node.get('x')), int(centr_node.get('y'))
         descr_keys = ['altbar', 'aspbar', 'aspvar', 'bfihost', 'dplbar', 'dpsbar', 'farl', 'fpext', 'ldp', 'propwet',
                       'rmed_1h', 'rmed_1d', 'rmed_2d', 'saar', 'saar4170', 'sprhost', 'urbconc1990', 'urbext1990',
                       'urbloc1990', 'urbconc2000', 'urbext2000', 'urbloc2000']
@@ -319,3 +510,205 @@ class XmlCatchmentParser(object):
                 pass # skip anything that can't be converted to float
 
         return catchment
+
+
+class PeakFlowArrays(namedtuple('PeakFlowArrays',
+                                ['dates', 'stages', 'flows', 'ratings', 'sources', 'comments', 'amax_only'])):
+    """
+    Full peak flow series as NumPy arrays, returned by :class:`CsvSeriesParser`.
+
+    - `dates`: date and time of peak flow (`datetime64[m]`)
+    - `stages`: water levels in m, `nan` if not available
+    - `flows`: flows in m³/s, `nan` if not available
+    - `ratings`: stage-discharge rating used, e.g. `2a` (`str`)
+    - `sources`: data source, e.g. `Digital Archive` (`str`)
+    - `comments`: comments (`str`)
+    - `amax_only`: whether the peak is only included as an annual maximum and not in the peaks-over-threshold series
+      (`bool`)
+    """
+    __slots__ = ()
+
+    @classmethod
+    def concatenate(cls, chunks):
+        """
+        Return a single series from a sequence of series, e.g. chunks returned by
+        :meth:`CsvSeriesParser.iter_chunks`.
+
+        :param chunks: Peak flow series
+        :type chunks: iterable of :class:`PeakFlowArrays`
+        :rtype: :class:`PeakFlowArrays`
+        """
+        import numpy as np
+
+        chunks = list(chunks)
+        if not chunks:
+            return cls.empty()
+        return cls(*(np.concatenate(columns) for columns in zip(*chunks)))
+
+    @classmethod
+    def empty(cls):
+        """
+        Return a series without any records.
+
+        :rtype: :class:`PeakFlowArrays`
+        """
+        import numpy as np
+
+        return cls(np.array([], dtype='datetime64[m]'), np.array([]), np.array([]), np.array([], dtype=str),
+                   np.array([], dtype=str), np.array([], dtype=str), np.array([], dtype=bool))
+
+    def water_years(self):
+        """
+        Return the water year of each peak, see :attr:`floodestimation.entities.AmaxRecord.WATER_YEAR_FIRST_MONTH`.
+
+        :rtype: :class:`numpy.ndarray`
+        """
+        months = self.dates.astype('datetime64[M]').astype(int)
+        return months // 12 + 1970 - (months % 12 + 1 < entities.AmaxRecord.WATER_YEAR_FIRST_MONTH)
+
+    def amax_arrays(self):
+        """
+        Return the annual maximum flow series built from the full peak flow series: the peak with the largest flow in
+        each water year. Peaks without flow are ignored.
+
+        :rtype: :class:`AmaxArrays`
+        """
+        import numpy as np
+
+        valid = ~np.isnan(self.flows)
+        water_years = self.water_years()[valid]
+        flows = self.flows[valid]
+        # Sort by water year, then flow: the last peak of each water year is the annual maximum
+        order = np.lexsort((flows, water_years))
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = water_years[order][1:] != water_years[order][:-1]
+        i = order[last]
+        return AmaxArrays(self.dates[valid][i].astype('datetime64[D]'), water_years[i], flows[i],
+                          self.stages[valid][i], np.zeros(len(i), dtype=np.int8))
+
+    def pot_arrays(self, threshold=None):
+        """
+        Return the peaks-over-threshold series built from the full peak flow series, excluding peaks only included as
+        annual maximum.
+
+        :param threshold: Only include peaks with a flow of at least `threshold` m³/s. Default: `None` (all peaks).
+        :type threshold: float
+        :return: Tuple of arrays of dates (`datetime64[D]`), flows in m³/s and stages in m (`nan` if not available),
+                 consistent with :meth:`floodestimation.entities.PotDataset.record_arrays`.
+        :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`, :class:`numpy.ndarray`)
+        """
+        mask = ~self.amax_only
+        if threshold is not None:
+            mask &= self.flows >= threshold
+        return self.dates[mask].astype('datetime64[D]'), self.flows[mask], self.stages[mask]
+
+
+class CsvSeriesParser(object):
+    """
+    Parser for NRFA peak flow series (`.CSV`) files. These files contain the full series of peak flows (incl. stage,
+    rating, source and comments) from which both the annual maximum and peaks-over-threshold series are derived.
+
+    Files are read in chunks of :attr:`chunk_size` records which are converted to NumPy arrays straight away. Use
+    :meth:`iter_chunks` to process large files chunk by chunk or :meth:`parse` to obtain the complete series.
+
+    Example:
+
+    >>> from floodestimation import parsers
+    >>> parser = parsers.CsvSeriesParser()
+    >>> series = parser.parse("17002.CSV")
+    >>> parser.station_number
+    17002
+    >>> series.amax_arrays().flows[0]
+    35.0
+    """
+
+    def __init__(self, chunk_size=10000):
+        """
+        :param chunk_size: Number of records converted to arrays at a time
+        :type chunk_size: int
+        """
+        #: Number of records converted to arrays at a time
+        self.chunk_size = chunk_size
+        #: Station number of the last parsed file
+        self.station_number = None
+        #: Station name of the last parsed file, e.g. `Leven at Leven`
+        self.name = None
+
+    def parse(self, file_name):
+        """
+        Parse entire file and return the peak flow series.
+
+        :param file_name: File path
+        :type file_name: str
+        :rtype: :class:`PeakFlowArrays`
+        """
+        return PeakFlowArrays.concatenate(self.iter_chunks(file_name))
+
+    def parse_str(self, s):
+        """
+        Parse string and return the peak flow series.
+
+        :param s: String to parse
+        :type s: str
+        :rtype: :class:`PeakFlowArrays`
+        """
+        return PeakFlowArrays.concatenate(self._iter_chunks(io.StringIO(s)))
+
+    def iter_chunks(self, file_name):
+        """
+        Parse a file incrementally and yield the peak flow series in chunks of :attr:`chunk_size` records.
+
+        :param file_name: File path
+        :type file_name: str
+        :rtype: generator of :class:`PeakFlowArrays`
+        """
+        with open(file_name, newline='') as f:
+            yield from self._iter_chunks(f)
+
+    def _iter_chunks(self, f):
+        import csv
+        import itertools
+
+        self.station_number = self.name = None
+        reader = csv.reader(f)
+        # Header rows, up to and including the column names
+        for row in reader:
+            key = row[0].strip().upper() if row else ''
+            if key == 'NAME:':
+                self.name = row[1].strip()
+            elif key == 'NUMBER:':
+                self.station_number = int(row[1])
+            elif key == 'DATE':
+                break
+        rows = self._iter_rows(reader)
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            yield self._to_arrays(chunk)
+
+    @staticmethod
+    def _iter_rows(reader):
+        # Data rows padded to all 7 columns, skipping blank rows
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            if len(row) < 3:
+                raise ValueError("Line {} in peak flow series file has {} columns, expected at least 3 (date, stage "
+                                 "and flow): `{}`.".format(reader.line_num, len(row), ','.join(row)))
+            yield row + [''] * (7 - len(row))
+
+    @staticmethod
+    def _to_arrays(rows):
+        import numpy as np
+
+        def to_float(s):
+            return float(s) if s.strip() else math.nan
+
+        # Dates as `dd/mm/yyyy HH:MM` converted to ISO format
+        dates = np.array(['{}-{}-{}T{}'.format(row[0][6:10], row[0][3:5], row[0][0:2], row[0][11:16] or '00:00')
+                          for row in rows], dtype='datetime64[m]')
+        stages = np.array([to_float(row[1]) for row in rows])
+        flows = np.array([to_float(row[2]) for row in rows])
+        ratings, sources, comments, amax_only = (np.array(column) for column in list(zip(*rows))[3:7])
+        return PeakFlowArrays(dates, stages, flows, ratings, sources, comments, amax_only != '')
@@ -26,7 +26,8 @@ class Config(configparser.ConfigParser):
     Configuration/settings object.
 
     Settings are read from a `config.ini` file within the python package (default values) or from the user's appdata
-    folder. Data is read immediately when object initiated. Data are only written to user file.
+    folder. Data is read immediately when object initiated. Data are only written to user file. Folders are not created
+    until data are actually written to them.
     """
     FILE_NAME = 'config.ini'
     APP_NAME = 'fehdata'
@@ -40,7 +41,6 @@ class Config(configparser.ConfigParser):
         self._app_folders = AppDirs(self.APP_NAME, self.APP_ORG)
         self._default_config_file = os.path.join(here, self.FILE_NAME)
 
-        os.makedirs(self._app_folders.user_config_dir, exist_ok=True)  # Create folder in advance if necessary
         self._user_config_file = os.path.join(self._app_folders.user_config_dir, self.FILE_NAME)
 
         self.read_defaults()
@@ -63,16 +63,10 @@ class Config(configparser.ConfigParser):
         self.read_defaults()
 
     def read_defaults(self):
-        # Setup standard folders
-        data_folder = self._app_folders.user_data_dir
-        os.makedirs(data_folder, exist_ok=True)
-        cache_folder = self._app_folders.user_cache_dir
-        os.makedirs(cache_folder, exist_ok=True)
-
-        # Make them available in the defaults section
+        # Make standard folders available in the defaults section. The folders themselves are created when required.
         self['DEFAULT'] = {
-            'data_folder': data_folder,
-            'cache_folder': cache_folder
+            'data_folder': self._app_folders.user_data_dir,
+            'cache_folder': self._app_folders.user_cache_dir
         }
 
         # Read any other default sections and options from the package's config file
@@ -88,6 +82,7 @@ class Config(configparser.ConfigParser):
         """
         Write data to user config file.
         """
+        os.makedirs(self._app_folders.user_config_dir, exist_ok=True)
         with open(self._user_config_file, 'w', encoding='utf-8') as f:
             self.write(f)
 
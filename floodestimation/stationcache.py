@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2015  Florenz A.P. Hollebrandse <f.a.p.hollebrandse@protonmail.ch>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides a cache of parsed stations such that catchment files (CD3 or xml files and any corresponding AM and
+PT files) which have not changed are not parsed again.
+
+Each station is stored as a compact binary record in an sqlite file, keyed by the location of the catchment file. A
+cached station is used if it was stored by the same version of this package and if the size and modification time of
+all its files are unchanged or, failing that, if the content of the files is unchanged (SHA-256 hash). The content hash
+is only calculated if the size or modification time changed. When a station is parsed, each file is read once only,
+for both the content hash and parsing.
+
+The cache is used by :func:`floodestimation.loaders.userdata_to_db` if enabled in the `[import]` config section::
+
+    [import]
+    folder = path/to/import/folder
+    station_cache = yes
+
+The cache can also be used directly:
+
+>>> from floodestimation.stationcache import StationCache
+>>> cache = StationCache('stations.sqlite')
+>>> catchment = cache.from_file('17002.CD3')  # Parsed
+>>> catchment = cache.from_file('17002.CD3')  # Returned from cache
+
+Cached stations can be removed or re-parsed using the `floodestimation-station-cache` command::
+
+    floodestimation-station-cache invalidate [cd3_file ...]
+    floodestimation-station-cache rebuild [folder]
+
+The cache file uses :mod:`pickle`. Only use cache files created by yourself.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+# Current package imports
+from . import __version__
+from . import instrumentation
+from . import parsers
+from .settings import config
+from .entities import Catchment
+
+#: Record format version, incremented when the stored records change. Records stored by a different format version or
+#: package version are parsed again.
+FORMAT_VERSION = 2
+
+#: Default cache file name, saved in the same folder as the database
+FILE_NAME = 'stationcache.sqlite'
+
+
+def default_file_path():
+    """
+    Return the location of the default station cache file, in the same folder as the database.
+
+    :rtype: str
+    """
+    return os.path.join(config['db']['folder'], FILE_NAME)
+
+
+class StationCache(object):
+    """
+    Cache of parsed stations in an sqlite file. A single cache object can be shared between threads.
+    """
+
+    def __init__(self, file_path=None):
+        """
+        :param file_path: Location of sqlite cache file. Default: see :func:`default_file_path`.
+        :type file_path: str
+        """
+        #: Location of sqlite cache file
+        self.file_path = file_path or default_file_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.file_path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS stations '
+                           '(path TEXT PRIMARY KEY, stat TEXT NOT NULL, content_hash TEXT NOT NULL, '
+                           'value BLOB NOT NULL)')
+        self._conn.commit()
+
+    def from_file(self, file_path, incl_pot=True, pot_output='records'):
+        """
+        Return catchment object from cache or, if not cached or changed, load it using
+        :func:`floodestimation.loaders.from_file` and store it in the cache.
+
+        :param file_path: Location of CD3 or xml file
+        :type file_path: str
+        :param incl_pot: Whether to load the POT (peaks-over-threshold) data. Default: ``True``.
+        :type incl_pot: bool
+        :param pot_output: ``records`` (default) or ``arrays`` to load the POT records as packed arrays
+        :type pot_output: str
+        :return: Catchment object
+        :rtype: :class:`floodestimation.entities.Catchment`
+        """
+        path = os.path.abspath(file_path)
+        files = _station_files(path)
+        stat = json.dumps([_file_stat(f) for f in files])
+        with self._lock:
+            row = self._conn.execute('SELECT stat, content_hash, value FROM stations WHERE path = ?',
+                                     (path, )).fetchone()
+        record = self._record(row[2]) if row is not None else None
+        contents = None
+        if record is not None:
+            if row[0] == stat:
+                instrumentation.count('cache.stations.hit')
+                return Catchment.from_record(record, incl_pot, pot_output)
+            contents = _read_files(files)
+            if row[1] == _content_hash(contents):
+                # Files touched but not changed
+                with self._lock:
+                    self._conn.execute('UPDATE stations SET stat = ? WHERE path = ?', (stat, path))
+                    self._conn.commit()
+                instrumentation.count('cache.stations.hit')
+                return Catchment.from_record(record, incl_pot, pot_output)
+
+        instrumentation.count('cache.stations.miss')
+        if contents is None:
+            contents = _read_files(files)
+        catchment = _parse_station(path, contents)
+        record = tuple(catchment.to_record())
+        value = pickle.dumps((FORMAT_VERSION, __version__, record), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO stations (path, stat, content_hash, value) VALUES (?, ?, ?, ?)',
+                               (path, stat, _content_hash(contents), value))
+            self._conn.commit()
+        return Catchment.from_record(record, incl_pot, pot_output)
+
+    @staticmethod
+    def _record(value):
+        stored = pickle.loads(value)
+        return stored[-1] if tuple(stored[:-1]) == (FORMAT_VERSION, __version__) else None
+
+    def invalidate(self, file_paths=None):
+        """
+        Remove stations from the cache.
+
+        :param file_paths: Locations of CD3 or xml files. Default: `None` (remove all stations).
+        :type file_paths: list of str
+        """
+        with self._lock:
+            if file_paths is None:
+                self._conn.execute('DELETE FROM stations')
+            else:
+                self._conn.executemany('DELETE FROM stations WHERE path = ?',
+                                       [(os.path.abspath(file_path), ) for file_path in file_paths])
+            self._conn.commit()
+
+    def rebuild(self, folder):
+        """
+        Parse all catchment (CD3) files in a folder (incl. sub-folders) and replace any cached stations.
+
+        :param folder: Folder location
+        :type folder: str
+        :return: Number of stations parsed
+        :rtype: int
+        """
+        file_paths = [os.path.join(dp, f) for dp, dn, filenames in os.walk(folder)
+                      for f in filenames if os.path.splitext(f)[1].lower() == '.cd3']
+        self.invalidate(file_paths)
+        for file_path in file_paths:
+            self.from_file(file_path)
+        return len(file_paths)
+
+    def close(self):
+        """
+        Close the cache file.
+        """
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM stations').fetchone()[0]
+
+    def __repr__(self):
+        return "<StationCache: {}>".format(self.file_path)
+
+
+def _station_files(path):
+    # Catchment file and corresponding AM and PT files, see :func:`floodestimation.loaders.from_file`
+    filename, ext = os.path.splitext(path)
+    return [path, filename + '.AM', filename + '.PT']
+
+
+def _file_stat(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_files(file_paths):
+    # Content of each file as bytes or `None` if the file does not exist
+    contents = []
+    for file_path in file_paths:
+        try:
+            with open(file_path, 'rb') as f:
+                contents.append(f.read())
+        except FileNotFoundError:
+            contents.append(None)
+    return contents
+
+
+def _content_hash(contents):
+    h = hashlib.sha256()
+    for content in contents:
+        if content is None:
+            h.update(b'-')
+            continue
+        h.update(str(len(content)).encode('ascii') + b':')
+        h.update(content)
+    return h.hexdigest()
+
+
+def _parse_station(path, contents):
+    # As :func:`floodestimation.loaders.from_file` with POT records as packed arrays, parsing file contents already read
+    catchment_content, am_content, pot_content = contents
+    if catchment_content is None:
+        raise FileNotFoundError("File `{}` does not exist.".format(path))
+    if os.path.splitext(path)[1].lower() == '.xml':
+        catchment = parsers.XmlCatchmentParser().parse(io.BytesIO(catchment_content))
+    else:
+        catchment = parsers.Cd3Parser().parse_str(_decode(catchment_content))
+    catchment.amax_records = parsers.AmaxParser().parse_str(_decode(am_content)) if am_content is not None else []
+    if pot_content is not None:
+        catchment.pot_dataset = parsers.PotParser(output='arrays').parse_str(_decode(pot_content))
+    return catchment
+
+
+def _decode(content):
+    # Same text as read by :meth:`floodestimation.parsers.FehFileParser.parse`, incl. universal newlines
+    return io.TextIOWrapper(io.BytesIO(content), encoding='utf-8').read()
+
+
+def main(argv=None):
+    """
+    Command line entry point (`floodestimation-station-cache`).
+    """
+    parser = argparse.ArgumentParser(prog='floodestimation-station-cache',
+                                     description="Manage the cache of parsed stations.")
+    parser.add_argument('--file', help="cache file (default: {})".format(default_file_path()))
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    invalidate_parser = subparsers.add_parser('invalidate', help="remove stations from the cache")
+    invalidate_parser.add_argument('paths', nargs='*', help="CD3 or xml files (default: all stations)")
+    rebuild_parser = subparsers.add_parser('rebuild', help="parse all stations in a folder again")
+    rebuild_parser.add_argument('folder', nargs='?', help="folder (default: `[import]` `folder` config setting)")
+    args = parser.parse_args(argv)
+
+    cache = StationCache(args.file)
+    try:
+        if args.command == 'invalidate':
+            cache.invalidate(args.paths or None)
+            print("{} stations cached.".format(len(cache)), file=sys.stderr)
+        else:
+            folder = args.folder or config.get('import', 'folder', fallback=None)
+            if not folder:
+                parser.error("No folder provided and no `[import]` `folder` config setting.")
+            n = cache.rebuild(folder)
+            print("{} stations parsed.".format(n), file=sys.stderr)
+    finally:
+        cache.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2015  Florenz A.P. Hollebrandse <f.a.p.hollebrandse@protonmail.ch>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module generates synthetic gauged catchment data for testing how the library scales to large numbers of stations.
+
+Generated stations have catchment descriptors with distributions similar to the stations in the National River Flow
+Archive, annual maximum flow records consistent with the catchment descriptors and, optionally, peaks-over-threshold
+records. Stations are grouped in spatial clusters. The data are fully reproducible for a given `seed`. Each station is
+generated independently, so the first `n` stations are identical whatever the total number of stations.
+
+Example:
+
+>>> from floodestimation.synthetic import SyntheticArchive
+>>> archive = SyntheticArchive(n_stations=10000, seed=1)
+>>> archive.to_folder('synthetic_stations')  # CD3, AM and PT files
+>>> archive.to_sqlite('synthetic.sqlite')    # Ready-made database
+
+"""
+
+import os
+import math
+import random
+from datetime import date
+from sqlalchemy.orm import sessionmaker
+# Current package imports
+from . import db
+from . import loaders
+from .entities import Catchment, Descriptors, AmaxRecord, PotDataset, PotRecord, Point
+
+# Approximate extent of Great Britain in British National Grid coordinates (m)
+_GB_X_RANGE = (140000, 650000)
+_GB_Y_RANGE = (10000, 1000000)
+
+# Relative frequency of annual maximum floods by month (January to December), mostly in winter
+_MONTH_WEIGHTS = [15, 13, 10, 6, 4, 4, 5, 6, 6, 8, 10, 13]
+
+_MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# Order of descriptors in CD3 files
+_CD3_DESCRIPTORS = ['dtm_area', 'altbar', 'aspbar', 'aspvar', 'bfihost', 'dplbar', 'dpsbar', 'farl', 'fpext', 'ldp',
+                    'propwet', 'rmed_1h', 'rmed_1d', 'rmed_2d', 'saar', 'saar4170', 'sprhost', 'urbconc1990',
+                    'urbext1990', 'urbloc1990', 'urbconc2000', 'urbext2000', 'urbloc2000']
+
+
+class SyntheticArchive(object):
+    """
+    Generator of synthetic gauged catchments.
+    """
+
+    def __init__(self, n_stations=1000, seed=0, record_length=(10, 60), pot_fraction=0.5, pot_density=5.0,
+                 n_clusters=25, cluster_spread=30.0, qmed_fraction=0.9, pooling_fraction=0.6, first_id=1000001,
+                 last_year=2014):
+        """
+        :param n_stations: Number of stations to generate
+        :type n_stations: int
+        :param seed: Random seed
+        :type seed: int
+        :param record_length: Minimum and maximum annual maximum flow record length in years
+        :type record_length: tuple
+        :param pot_fraction: Fraction of stations with peaks-over-threshold (POT) records
+        :type pot_fraction: float
+        :param pot_density: Mean number of POT peaks per year
+        :type pot_density: float
+        :param n_clusters: Number of spatial clusters of stations. Use `0` for uniformly distributed stations.
+        :type n_clusters: int
+        :param cluster_spread: Standard deviation of station locations around cluster centres in km
+        :type cluster_spread: float
+        :param qmed_fraction: Fraction of stations suitable for QMED
+        :type qmed_fraction: float
+        :param pooling_fraction: Fraction of stations suitable for pooling
+        :type pooling_fraction: float
+        :param first_id: Station number of the first station, subsequent stations are numbered consecutively
+        :type first_id: int
+        :param last_year: Last possible water year of flow records
+        :type last_year: int
+        """
+        self.n_stations = n_stations
+        self.seed = seed
+        self.record_length = record_length
+        self.pot_fraction = pot_fraction
+        self.pot_density = pot_density
+        self.n_clusters = n_clusters
+        self.cluster_spread = cluster_spread
+        self.qmed_fraction = qmed_fraction
+        self.pooling_fraction = pooling_fraction
+        self.first_id = first_id
+        self.last_year = last_year
+
+        rng = random.Random('{}-clusters'.format(seed))
+        self.cluster_centres = [(rng.uniform(*_GB_X_RANGE), rng.uniform(*_GB_Y_RANGE)) for _ in range(n_clusters)]
+
+    def catchments(self):
+        """
+        Return a generator of all synthetic catchments.
+
+        :rtype: generator of :class:`floodestimation.entities.Catchment`
+        """
+        return (self.catchment(i) for i in range(self.n_stations))
+
+    def catchment(self, i):
+        """
+        Return the `i`-th synthetic catchment including annual maximum flow records and POT data.
+
+        :param i: Station index, starting at `0`
+        :type i: int
+        :rtype: :class:`floodestimation.entities.Catchment`
+        """
+        # Separate random number generator for each station for reproducibility independent of `n_stations`
+        rng = random.Random('{}-{}'.format(self.seed, i))
+
+        catchment = Catchment(location="Station {}".format(i + 1), watercourse="Synthetic River {}".format(i + 1))
+        catchment.id = self.first_id + i
+        catchment.country = 'gb'
+        catchment.is_suitable_for_qmed = rng.random() < self.qmed_fraction
+        catchment.is_suitable_for_pooling = rng.random() < self.pooling_fraction
+        catchment.descriptors = self._descriptors(rng)
+        catchment.area = round(catchment.descriptors.dtm_area * rng.uniform(0.95, 1.05), 2)
+        catchment.point = catchment.descriptors.ihdtm_ngr
+
+        catchment.amax_records = self._amax_records(rng, catchment.descriptors)
+        if rng.random() < self.pot_fraction:
+            catchment.pot_dataset = self._pot_dataset(rng, catchment.amax_records)
+        return catchment
+
+    def _location(self, rng):
+        if self.n_clusters:
+            centre_x, centre_y = rng.choice(self.cluster_centres)
+            x = rng.gauss(centre_x, 1000 * self.cluster_spread)
+            y = rng.gauss(centre_y, 1000 * self.cluster_spread)
+        else:
+            x, y = rng.uniform(*_GB_X_RANGE), rng.uniform(*_GB_Y_RANGE)
+        return (int(min(max(x, _GB_X_RANGE[0]), _GB_X_RANGE[1])),
+                int(min(max(y, _GB_Y_RANGE[0]), _GB_Y_RANGE[1])))
+
+    def _descriptors(self, rng):
+        d = Descriptors()
+        x, y = self._location(rng)
+        d.centroid_ngr = Point(x, y)
+        d.dtm_area = round(min(max(rng.lognormvariate(math.log(150), 1.3), 1.0), 10000.0), 2)
+        # Catchment outlet at some distance from centroid, depending on catchment size
+        angle = rng.uniform(0, 2 * math.pi)
+        outlet_dist = 1000 * 0.6 * math.sqrt(d.dtm_area)
+        d.ihdtm_ngr = Point(max(0, int(x + outlet_dist * math.cos(angle))) // 50 * 50,
+                            max(0, int(y + outlet_dist * math.sin(angle))) // 50 * 50)
+
+        # Wetter in the north and west
+        wetness = 0.6 * (_GB_X_RANGE[1] - x) / (_GB_X_RANGE[1] - _GB_X_RANGE[0]) + 0.4 * y / _GB_Y_RANGE[1]
+        d.saar = round(min(max((550 + 1900 * wetness ** 1.5) * rng.lognormvariate(0, 0.2), 500), 3500))
+        d.saar4170 = round(d.saar * rng.uniform(1.0, 1.1))
+        d.propwet = round(min(max(0.25 + 0.5 * wetness + rng.gauss(0, 0.05), 0.2), 0.8), 2)
+        d.altbar = round(max(20 + 350 * wetness * rng.lognormvariate(0, 0.4), 5))
+        d.aspbar = rng.randrange(360)
+        d.aspvar = round(rng.uniform(0.05, 0.5), 2)
+        d.dpsbar = round(min(max(15 + 250 * wetness * rng.lognormvariate(0, 0.4), 10), 400), 1)
+        d.dplbar = round(1.2 * d.dtm_area ** 0.5 * rng.lognormvariate(0, 0.15), 2)
+        d.ldp = round(d.dplbar * rng.uniform(1.8, 2.2), 2)
+
+        # Soils: permeable catchments have high BFIHOST and low SPRHOST
+        d.bfihost = round(0.17 + 0.8 * rng.betavariate(2.5, 3.5), 3)
+        d.sprhost = round(min(max(58 - 60 * (d.bfihost - 0.17) + rng.gauss(0, 5), 2), 60), 2)
+        d.farl = round(1 - min(rng.expovariate(1 / 0.03), 0.3), 3)
+        d.fpext = round(min(rng.lognormvariate(math.log(0.06), 0.6), 0.5), 4)
+        d.rmed_1d = round(18 + 0.022 * d.saar * rng.lognormvariate(0, 0.1), 1)
+        d.rmed_1h = round(d.rmed_1d * rng.uniform(0.3, 0.45), 1)
+        d.rmed_2d = round(d.rmed_1d * rng.uniform(1.2, 1.4), 1)
+
+        # Most catchments are rural
+        d.urbext2000 = round(min(rng.expovariate(1 / 0.03), 0.7), 4)
+        d.urbext1990 = round(d.urbext2000 * rng.uniform(0.8, 1.0), 4)
+        for year in [1990, 2000]:
+            setattr(d, 'urbconc{}'.format(year), round(rng.uniform(0.4, 0.9), 3))
+            setattr(d, 'urbloc{}'.format(year), round(rng.uniform(0.3, 1.2), 3))
+        return d
+
+    @staticmethod
+    def _qmed(d):
+        """
+        QMED (rural) using a simplified FEH 2008 regression equation.
+        """
+        return 8.3062 * d.dtm_area ** 0.8510 * 0.1536 ** (1000 / d.saar) * d.farl ** 3.4451 * \
+               0.0460 ** (d.bfihost ** 2.0) * (1 + d.urbext2000) ** 1.5
+
+    def _amax_records(self, rng, d):
+        qmed = self._qmed(d)
+        # Generalised logistic distribution (Hosking & Wallis), standardised such that the median equals 1
+        l_cv = min(max(rng.gauss(0.22, 0.05), 0.1), 0.4)
+        l_skew = min(max(rng.gauss(0.15, 0.08), -0.1), 0.4)
+        k = -l_skew
+        if abs(k) < 1e-6:
+            k = 1e-6
+        scale = l_cv * math.sin(k * math.pi) / (k * math.pi)
+
+        def growth(f):
+            return 1 + scale * (1 - ((1 - f) / f) ** k) / k
+
+        n_years = rng.randint(*self.record_length)
+        first_year = self.last_year - n_years + 1 - rng.randint(0, 20)  # Some records have ended
+        records = []
+        for water_year in range(first_year, first_year + n_years):
+            month = rng.choices(range(1, 13), weights=_MONTH_WEIGHTS)[0]
+            year = water_year if month >= 10 else water_year + 1
+            flow = round(max(qmed * growth(rng.uniform(0.001, 0.999)), 0.001), 3)
+            stage = round(0.3 * flow ** 0.4, 3)
+            records.append(AmaxRecord(date(year, month, rng.randint(1, 28)), flow, stage))
+        return records
+
+    def _pot_dataset(self, rng, amax_records):
+        dataset = PotDataset()
+        first_year = amax_records[0].water_year
+        last_year = amax_records[-1].water_year
+        dataset.start_date = date(first_year, 10, 1)
+        dataset.end_date = date(last_year + 1, 9, 30)
+        flows = sorted(record.flow for record in amax_records)
+        dataset.threshold = round(flows[len(flows) // 4] * rng.uniform(0.5, 0.8), 3)
+
+        for amax_record in amax_records:
+            if amax_record.flow <= dataset.threshold:
+                continue
+            peaks = [(amax_record.date, amax_record.flow)]
+            # Poisson distributed number of additional peaks, all smaller than the annual maximum
+            n_peaks = 0
+            limit, p = math.exp(-max(self.pot_density - 1, 0)), rng.random()
+            while p > limit:
+                n_peaks += 1
+                p *= rng.random()
+            for _ in range(n_peaks):
+                month = rng.choices(range(1, 13), weights=_MONTH_WEIGHTS)[0]
+                year = amax_record.water_year if month >= 10 else amax_record.water_year + 1
+                peaks.append((date(year, month, rng.randint(1, 28)),
+                              round(rng.uniform(dataset.threshold, amax_record.flow), 3)))
+            for peak_date, flow in sorted(set(peaks)):
+                dataset.pot_records.append(PotRecord(peak_date, flow, round(0.3 * flow ** 0.4, 3)))
+        return dataset
+
+    def to_folder(self, folder):
+        """
+        Write all synthetic catchments as ``.CD3``, ``.AM`` and ``.PT`` files to a folder.
+
+        :param folder: Folder location, created if it does not exist
+        :type folder: str
+        """
+        os.makedirs(folder, exist_ok=True)
+        for catchment in self.catchments():
+            file_path = os.path.join(folder, str(catchment.id))
+            with open(file_path + '.CD3', 'w', encoding='utf-8') as f:
+                f.write(cd3_str(catchment))
+            with open(file_path + '.AM', 'w', encoding='utf-8') as f:
+                f.write(amax_str(catchment.id, catchment.amax_records))
+            if catchment.pot_dataset:
+                with open(file_path + '.PT', 'w', encoding='utf-8') as f:
+                    f.write(pot_str(catchment.id, catchment.pot_dataset))
+
+    def to_db(self, session, autocommit=False, batch_size=1000):
+        """
+        Load all synthetic catchments into the database.
+
+        :param session: Database session to use, typically `floodestimation.db.Session()`
+        :type session: :class:`sqlalchemy.orm.session.Session`
+        :param autocommit: Whether to commit the database session immediately. Default: ``False``.
+        :type autocommit: bool
+        :param batch_size: Number of catchments to load before flushing the session
+        :type batch_size: int
+        """
+        for i, catchment in enumerate(self.catchments(), start=1):
+            loaders.to_db(catchment, session)
+            if i % batch_size == 0:
+                session.flush()
+                session.expunge_all()  # Limit memory use
+        if autocommit:
+            session.commit()
+
+    def to_sqlite(self, file_path):
+        """
+        Create a new sqlite database file with all synthetic catchments. Any existing file is replaced.
+
+        The database can be used instead of the downloaded NRFA data by setting the `[db]` `folder` and `filename`
+        options in the config file.
+
+        :param file_path: Location of the sqlite database file, e.g. `fehdata.sqlite`
+        :type file_path: str
+        """
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        engine = db.create_sqlite_engine(file_path, journal_mode='delete', synchronous='off')
+        try:
+            db.Base.metadata.create_all(engine)
+            db.migrate_db(engine)
+            session = sessionmaker(bind=engine)()
+            try:
+                self.to_db(session, autocommit=True)
+            finally:
+                session.close()
+        finally:
+            engine.dispose()
+
+
+def _feh_date(d):
+    return '{:02d} {} {}'.format(d.day, _MONTH_NAMES[d.month - 1], d.year)
+
+
+def cd3_str(catchment):
+    """
+    Return a catchment formatted as a ``.CD3`` file.
+
+    :param catchment: Catchment with descriptors
+    :type catchment: :class:`floodestimation.entities.Catchment`
+    :rtype: str
+    """
+    d = catchment.descriptors
+    lines = ['[FILE FORMAT]', 'TYPE,CD3', 'VERSION,3.0', '[END]',
+             '[STATION NUMBER]', ' {}'.format(catchment.id), '[END]',
+             '[CDS DETAILS]',
+             'NAME,{}'.format(catchment.watercourse),
+             'LOCATION,{}'.format(catchment.location),
+             'NOMINAL AREA,{:8.2f}'.format(catchment.area),
+             'NOMINAL NGR,{},{}'.format(catchment.point.x // 100, catchment.point.y // 100),
+             '[END]',
+             '[DESCRIPTORS]',
+             'IHDTM NGR,GB,{},{}'.format(d.ihdtm_ngr.x, d.ihdtm_ngr.y),
+             'CENTROID NGR,GB,{},{}'.format(d.centroid_ngr.x, d.centroid_ngr.y)]
+    for name in _CD3_DESCRIPTORS:
+        value = getattr(d, name)
+        lines.append('{},{}'.format(name.upper().replace('_', ' ' if name == 'dtm_area' else '-'),
+                                    -9.999 if value is None else '{:g}'.format(value)))
+    lines += ['[END]',
+              '[SUITABILITY]',
+              'QMED,{}'.format('YES' if catchment.is_suitable_for_qmed else 'NO'),
+              'POOLING,{}'.format('YES' if catchment.is_suitable_for_pooling else 'NO'),
+              '[END]', '']
+    return '\n'.join(lines)
+
+
+def amax_str(station_id, amax_records):
+    """
+    Return annual maximum flow records formatted as an ``.AM`` file.
+
+    :param station_id: Station number
+    :type station_id: int
+    :param amax_records: Annual maximum flow records
+    :type amax_records: list of :class:`floodestimation.entities.AmaxRecord`
+    :rtype: str
+    """
+    lines = ['[STATION NUMBER]', str(station_id), '[END]',
+             '[AM Details]', 'Year Type,Water Year,Oct', '[End]',
+             '[AM Values]']
+    lines += ['{},{:9.3f},{:9.3f}'.format(_feh_date(record.date), record.flow, record.stage)
+              for record in amax_records]
+    lines += ['[End]', '']
+    return '\n'.join(lines)
+
+
+def pot_str(station_id, pot_dataset):
+    """
+    Return a peaks-over-threshold dataset formatted as a ``.PT`` file.
+
+    :param station_id: Station number
+    :type station_id: int
+    :param pot_dataset: Peaks-over-threshold dataset
+    :type pot_dataset: :class:`floodestimation.entities.PotDataset`
+    :rtype: str
+    """
+    lines = ['[STATION NUMBER]', str(station_id), '[END]',
+             '[POT Details]',
+             'Record Period,{},{}'.format(_feh_date(pot_dataset.start_date), _feh_date(pot_dataset.end_date)),
+             'Threshold,{:9.3f}'.format(pot_dataset.threshold),
+             '[End]',
+             '[POT Gaps]']
+    lines += ['{},{}'.format(_feh_date(gap.start_date), _feh_date(gap.end_date)) for gap in pot_dataset.pot_data_gaps]
+    lines += ['[End]', '[POT Values]']
+    lines += ['{},{:9.3f},{:9.3f}'.format(_feh_date(record.date), record.flow, record.stage)
+              for record in pot_dataset.pot_records]
+    lines += ['[End]', '']
+    return '\n'.join(lines)
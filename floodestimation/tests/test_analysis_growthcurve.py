@@ -10,6 +10,7 @@ from datetime import date
 from urllib.request import pathname2url
 from floodestimation.entities import Catchment, Descriptors, AmaxRecord, Point
 from floodestimation.analysis import GrowthCurveAnalysis
+from floodestimation.loaders import from_file
 from floodestimation import db
 from floodestimation import settings
 from floodestimation.collections import CatchmentCollections
@@ -196,4 +197,41 @@ class TestGrowthCurveAnalysis(unittest.TestCase):
         analysis = GrowthCurveAnalysis(subject)
         result = analysis._similarity_distance(subject, donor)
         expected = 0.1159  # Science Report SC050050, table 6.6, row 2
-        self.assertAlmostEqual(result, expected, places=4)
\ No newline at end of file
+        self.assertAlmostEqual(result, expected, places=4)
+
+    def test_growth_curve_query_count(self):
+        session = db.Session()  # New session without any catchments loaded already
+        try:
+            analysis = GrowthCurveAnalysis(self.catchment, CatchmentCollections(session))
+            # 1 query for donors, 2 lazy loads (descriptors and AMAX records) for each of the 2 donors
+            with db.assert_max_queries(5):
+                analysis.growth_curve()
+        finally:
+            session.close()
+
+    def test_growth_curve_years(self):
+        catchment = from_file('floodestimation/tests/data/170021.CD3')
+        gauged_catchments = CatchmentCollections(self.db_session)
+        years = [1960, 2000, 2100]
+        analysis = GrowthCurveAnalysis(catchment, gauged_catchments, instrument=True)
+        result = analysis.growth_curve(method='pooling_group', years=years)
+        self.assertEqual(1, analysis.instrumentation.to_dict()['growth_curve.donors.calls'])
+        self.assertEqual(3, len(result))
+        for year, gc in zip(years, result):
+            expected = GrowthCurveAnalysis(catchment, gauged_catchments, year=year).growth_curve(method='pooling_group')
+            assert_almost_equal(gc([0.1, 0.01]), expected([0.1, 0.01]))
+
+    def test_growth_curve_years_single_site(self):
+        catchment = from_file('floodestimation/tests/data/17002.CD3')
+        result = GrowthCurveAnalysis(catchment).growth_curve(method='single_site', years=[2000, 2010])
+        self.assertIs(result[0], result[1])  # Does not depend on year, so fitted once only
+
+    def test_growth_curve_query_count_pooling_profile(self):
+        session = db.Session()
+        try:
+            analysis = GrowthCurveAnalysis(self.catchment, CatchmentCollections(session, loading_profile='pooling'))
+            # 1 query for donors incl. descriptors, 1 for AMAX records of all donors
+            with db.assert_max_queries(2):
+                analysis.growth_curve()
+        finally:
+            session.close()
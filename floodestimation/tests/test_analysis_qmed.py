@@ -1,13 +1,16 @@
 import unittest
 import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from numpy.testing import assert_almost_equal, assert_array_almost_equal_nulp
 from urllib.request import pathname2url
 from datetime import date
 from floodestimation.entities import Catchment, AmaxRecord, Descriptors, Point, PotDataset, PotRecord, PotDataGap
 from floodestimation.collections import CatchmentCollections
 from floodestimation import db
+from floodestimation import loaders
 from floodestimation import settings
-from floodestimation.analysis import QmedAnalysis, InsufficientDataError
+from floodestimation.analysis import QmedAnalysis, InsufficientDataError, qmed_from_pot_datasets
 from math import exp
 
 class TestCatchmentQmed(unittest.TestCase):
@@ -222,10 +225,22 @@ class TestCatchmentQmed(unittest.TestCase):
                                              PotRecord(date(1999, 2, 15), 2.0, 0.5),
                                              PotRecord(date(1999, 12, 31), 1.0, 0.5)]
         analysis = QmedAnalysis(catchment)
-        records_by_month = analysis._pot_month_counts(catchment.pot_dataset)
+        result = analysis._pot_month_counts(catchment.pot_dataset)
         expected = [2, 1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2]
-        result = [len(month) for month in records_by_month]
-        self.assertEqual(result, expected)
+        self.assertEqual(result.tolist(), expected)
+
+    def test_pot_records_by_month_with_gap(self):
+        catchment = Catchment("Aberdeen", "River Dee")
+        catchment.pot_dataset = PotDataset(start_date=date(1998, 10, 1), end_date=date(2000, 1, 31))
+        # Gap within February only: February still covered once
+        catchment.pot_dataset.pot_data_gaps = [PotDataGap(start_date=date(1999, 2, 5), end_date=date(1999, 2, 10)),
+                                               PotDataGap(start_date=date(1999, 4, 1), end_date=date(1999, 5, 31))]
+        analysis = QmedAnalysis(catchment)
+        result = analysis._pot_month_counts(catchment.pot_dataset)
+        expected = [2, 1, 1, 0, 0, 1, 1, 1, 1, 2, 2, 2]
+        self.assertEqual(result.tolist(), expected)
+        records, n = analysis._complete_pot_years(catchment.pot_dataset)
+        self.assertEqual(n, 0)
 
     def test_pot_complete_years(self):
         catchment = Catchment("Aberdeen", "River Dee")
@@ -260,6 +275,47 @@ class TestCatchmentQmed(unittest.TestCase):
                     date(2000, 1, 5)]
         self.assertEqual(result, expected)
 
+    def test_pot_insufficient_records(self):
+        catchment = Catchment("Aberdeen", "River Dee")
+        catchment.pot_dataset = PotDataset(start_date=date(1999, 3, 1), end_date=date(1999, 12, 31))
+        catchment.pot_dataset.pot_records = [PotRecord(date(1999, 3, 1), 2.0, 0.5)]
+        self.assertRaises(InsufficientDataError, QmedAnalysis(catchment).qmed, method='pot_records')
+
+    def test_pot_datasets_batch(self):
+        pot_datasets = [PotDataset(start_date=date(1999, 1, 1), end_date=date(1999, 12, 31)),
+                        PotDataset(start_date=date(1999, 3, 1), end_date=date(1999, 12, 31)),
+                        PotDataset(start_date=date(1998, 1, 1), end_date=date(1999, 12, 31)),
+                        PotDataset()]
+        pot_datasets[0].pot_records = [PotRecord(date(1999, 1, 1), 2.0, 0.5),
+                                       PotRecord(date(1999, 12, 31), 1.0, 0.5)]
+        pot_datasets[1].pot_records = [PotRecord(date(1999, 3, 1), 2.0, 0.5)]
+        pot_datasets[2].pot_records = [PotRecord(date(1999, 1, 1), 3.0, 0.5),
+                                       PotRecord(date(1999, 2, 1), 2.0, 0.5),
+                                       PotRecord(date(1999, 12, 31), 1.0, 0.5)]
+        result = qmed_from_pot_datasets(pot_datasets)
+        assert_almost_equal(result, [1.6696, float('nan'), 1.8789, float('nan')], decimal=4)
+
+    def test_descriptors_years(self):
+        catchment = Catchment("Aberdeen", "River Dee")
+        catchment.descriptors = Descriptors(dtm_area=1, bfihost=0.50, sprhost=50, saar=1000, farl=1, urbext2000=0.2)
+        years = [1960, 2000, 2100]
+        analysis = QmedAnalysis(catchment)
+        result = analysis.qmed(method='descriptors', donor_catchments=[], years=years)
+        expected = [QmedAnalysis(catchment, year=year).qmed(method='descriptors', donor_catchments=[])
+                    for year in years]
+        assert_almost_equal(result, expected)
+        self.assertEqual(len(years), len(analysis.results_log['urban_adj_factor']))
+        self.assertEqual(date.today().year, analysis.year)
+
+    def test_amax_years(self):
+        catchment = Catchment("Aberdeen", "River Dee")
+        catchment.amax_records = [AmaxRecord(date(1999, 12, 31), 3.0, 0.5),
+                                  AmaxRecord(date(2000, 12, 31), 2.0, 0.5),
+                                  AmaxRecord(date(2001, 12, 31), 1.0, 0.5)]
+        result = QmedAnalysis(catchment).qmed(years=range(1960, 2101))
+        self.assertEqual((141, ), result.shape)
+        self.assertTrue((result == 2).all())
+
     def test_all(self):
         catchment = Catchment("Aberdeen", "River Dee")
         catchment.channel_width = 1
@@ -392,6 +448,9 @@ class TestQmedDonor(unittest.TestCase):
     def tearDownClass(cls):
         db.empty_db_tables()
 
+    def setUp(self):
+        db._has_centroid_index.clear()  # Query counts include checking for the spatial index once for each engine
+
     def tearDown(self):
         self.db_session.rollback()
 
@@ -547,3 +606,70 @@ class TestQmedDonor(unittest.TestCase):
         # exp(ln(0.61732109) + 0.34379622 * 0.55963062 + 0.00102012 * 0.02991561) =
         # exp(ln(0.61732109) + 0.192429411) = 0.748311028
         self.assertAlmostEqual(result, 0.748311028, places=5)
+
+    def test_qmed_two_donors_results_log(self):
+        analysis = QmedAnalysis(self.catchment, CatchmentCollections(self.db_session), year=2000)
+        donors = analysis.find_donor_catchments()[0:2]  # 17001, 10001
+        analysis.qmed(method='descriptors', donor_catchments=donors)
+
+        result = analysis.results_log['donors']
+        self.assertEqual([17001, 10001], [d.id for d in result])
+        assert_almost_equal([d.weight for d in result], [0.34379622, 0.00102012])
+        self.assertIs(donors[0].catchment, result[0].catchment)
+        self.assertNotIn('weight', vars(result[0].catchment))  # Donor catchment itself not modified
+        self.assertEqual([d.dist for d in donors], [d.dist for d in result])
+        with self.assertRaises(AttributeError):
+            result[0].weight = 1
+
+    def test_qmed_two_donors_threaded(self):
+        record = self.catchment.to_record()  # Plain data, each analysis creates its own subject catchment
+
+        def run():
+            session = db.ScopedSession()
+            try:
+                analysis = QmedAnalysis(record, CatchmentCollections(session), year=2000)
+                return analysis.qmed(method='descriptors_2008', donor_catchments=analysis.find_donor_catchments()[0:2])
+            finally:
+                db.ScopedSession.remove()
+
+        expected = run()  # Also loads gauged catchment data if required
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda _: run(), range(8)))
+        for result in results:
+            self.assertAlmostEqual(result, expected)
+
+    def test_qmed_query_count(self):
+        session = db.Session()  # New session without any catchments loaded already
+        try:
+            analysis = QmedAnalysis(self.catchment, CatchmentCollections(session), year=2000)
+            # 1 query for donors, 2 lazy loads (descriptors and AMAX records) for each of the 3 donors, 1 to check for
+            # the spatial index
+            with db.assert_max_queries(8):
+                analysis.qmed(method='descriptors')
+        finally:
+            session.close()
+
+    def test_qmed_years(self):
+        catchment = loaders.from_file('floodestimation/tests/data/170021.CD3')
+        gauged_catchments = CatchmentCollections(self.db_session)
+        years = np.arange(1960, 2101)
+        analysis = QmedAnalysis(catchment, gauged_catchments, instrument=True)
+        result = analysis.qmed(method='descriptors', years=years)
+        self.assertEqual(1, analysis.instrumentation.to_dict()['qmed.descriptors_2008.donors.calls'])
+        for i in [0, 40, 140]:
+            expected = QmedAnalysis(catchment, gauged_catchments, year=years[i]).qmed(method='descriptors')
+            self.assertAlmostEqual(result[i], expected)
+        self.assertGreater(result[-1], result[0])  # Urbanisation increases QMED
+
+    def test_qmed_query_count_pooling_profile(self):
+        session = db.Session()
+        try:
+            gauged_catchments = CatchmentCollections(session, loading_profile='pooling')
+            analysis = QmedAnalysis(self.catchment, gauged_catchments, year=2000)
+            # 1 query for donors incl. descriptors, 1 for AMAX records of all donors, 1 to check for the spatial index
+            with db.assert_max_queries(3):
+                qmed = analysis.qmed(method='descriptors')
+            self.assertAlmostEqual(qmed, QmedAnalysis(self.catchment, CatchmentCollections(self.db_session),
+                                                      year=2000).qmed(method='descriptors'))
+        finally:
+            session.close()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import io
+import csv
+import json
+import tempfile
+import shutil
+from urllib.request import pathname2url
+from floodestimation import db
+from floodestimation import batch
+from floodestimation import loaders
+from floodestimation import settings
+from floodestimation.entities import Point
+
+
+class TestBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        settings.config['nrfa']['oh_json_url'] = \
+            'file:' + pathname2url(os.path.abspath('./floodestimation/fehdata_test.json'))
+        cls.folder = tempfile.mkdtemp()
+        for file_name in ['37017.CD3', '37017.AM', 'NN 04000 48400.xml']:
+            shutil.copy(os.path.join('floodestimation/tests/data', file_name), cls.folder)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+        db.empty_db_tables()
+
+    def write_csv(self, rows):
+        file_path = os.path.join(self.folder, 'subjects.csv')
+        with open(file_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, sorted(set(key for row in rows for key in row)))
+            writer.writeheader()
+            writer.writerows(rows)
+        self.addCleanup(os.remove, file_path)
+        return file_path
+
+    def test_subject_sources_folder(self):
+        sources = batch.subject_sources(self.folder)
+        self.assertEqual(['37017', 'NN 04000 48400'], [site for site, source in sources])
+
+    def test_subject_sources_invalid(self):
+        with self.assertRaises(ValueError):
+            batch.subject_sources('floodestimation/tests/data/37017.CD3')
+
+    def test_catchment_from_row(self):
+        catchment = batch.catchment_from_row({'id': '1', 'location': 'Dundee', 'dtm_area': '2.345', 'saar': '',
+                                              'centroid_ngr_x': '276125', 'centroid_ngr_y': '688424'})
+        self.assertEqual(1, catchment.id)
+        self.assertEqual('Dundee', catchment.location)
+        self.assertEqual(2.345, catchment.descriptors.dtm_area)
+        self.assertIsNone(catchment.descriptors.saar)
+        self.assertEqual(Point(276125, 688424), catchment.descriptors.centroid_ngr)
+
+    def test_catchment_from_row_invalid_column(self):
+        with self.assertRaises(ValueError):
+            batch.catchment_from_row({'abc': '1'})
+
+    def test_run_folder_csv(self):
+        output = io.StringIO()
+        result = batch.run(self.folder, output, workers=1)
+        self.assertEqual((2, 0), result)
+
+        rows = {row['site']: row for row in csv.DictReader(io.StringIO(output.getvalue()))}
+        self.assertEqual(batch.result_fields(), list(rows['37017'].keys()))
+        self.assertEqual('amax_records', rows['37017']['qmed_method'])
+        self.assertEqual('enhanced_single_site', rows['37017']['gc_method'])
+        self.assertAlmostEqual(float(rows['37017']['qmed']), 13.803, places=3)
+        self.assertAlmostEqual(float(rows['37017']['flow_0.5']), 13.803, places=3)  # Growth curve = 1 for AEP = 0.5
+        self.assertEqual({'loc', 'scale', 'k'}, set(json.loads(rows['37017']['gc_params'])))
+        self.assertEqual('pooling_group', rows['NN 04000 48400']['gc_method'])
+        self.assertEqual('', rows['NN 04000 48400']['error'])
+
+    def test_run_csv_jsonl_failures(self):
+        # Descriptors from `NN 04000 48400.xml`
+        input_path = self.write_csv([{'id': '1', 'dtm_area': '30.09', 'bfihost': '0.394', 'farl': '0.986',
+                                      'fpext': '0.0369', 'saar': '2810', 'sprhost': '53.35', 'urbext2000': '0',
+                                      'centroid_ngr_x': '207378', 'centroid_ngr_y': '751487'},
+                                     {'id': '2'}])  # No descriptors at all
+        output = io.StringIO()
+        result = batch.run(input_path, output, output_format='jsonl', workers=1, aeps=[0.01])
+        self.assertEqual((1, 1), result)
+
+        rows = {row['site']: row for row in map(json.loads, output.getvalue().splitlines())}
+        self.assertEqual('descriptors', rows['1']['qmed_method'])
+        self.assertIn('flow_0.01', rows['1'])
+        self.assertIn('InsufficientDataError', rows['2']['error'])
+
+    def test_run_process_pool(self):
+        expected = io.StringIO()
+        batch.run(self.folder, expected, output_format='jsonl', workers=1)
+
+        for snapshot in [False, True]:
+            output = io.StringIO()
+            result = batch.run(self.folder, output, output_format='jsonl', workers=2, snapshot=snapshot)
+            self.assertEqual((2, 0), result)
+            self.assertEqual(sorted(expected.getvalue().splitlines()), sorted(output.getvalue().splitlines()))
+
+    def test_run_catchment_records(self):
+        expected = io.StringIO()
+        batch.run(self.folder, expected, output_format='jsonl', workers=1)
+
+        catchments = [loaders.from_file(file_path) for site, file_path in batch.subject_sources(self.folder)]
+        sources = batch.catchment_sources(catchments)
+        self.assertEqual(['37017', '2'], [site for site, source in sources])
+        output = io.StringIO()
+        result = batch.run(sources, output, output_format='jsonl', workers=2)
+        self.assertEqual((2, 0), result)
+        expected = {row['id']: row for row in map(json.loads, expected.getvalue().splitlines())}
+        for row in map(json.loads, output.getvalue().splitlines()):
+            del row['site'], expected[row['id']]['site']
+            self.assertEqual(expected[row['id']], row)
+
+    def test_unknown_result_field(self):
+        writer = batch.ResultWriter(io.StringIO())
+        with self.assertRaises(ValueError):
+            writer.write({'site': '1', 'gc_other': 1.0})
+
+    def test_invalid_output_format(self):
+        with self.assertRaises(ValueError):
+            batch.ResultWriter(io.StringIO(), output_format='xls')
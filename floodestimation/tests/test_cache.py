@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from urllib.request import pathname2url
+from numpy.testing import assert_almost_equal
+from floodestimation import db
+from floodestimation import settings
+from floodestimation.cache import ResultCache, result_key
+from floodestimation import loaders
+from floodestimation.collections import CatchmentCollections
+from floodestimation.entities import Catchment
+from floodestimation.analysis import QmedAnalysis, GrowthCurveAnalysis
+from floodestimation.loaders import from_file
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_get_put(self):
+        cache = ResultCache()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(1, cache.get('a', 1))
+        cache.put('a', (1.0, {}))
+        self.assertEqual((1.0, {}), cache.get('a'))
+        self.assertIn('a', cache)
+
+    def test_lru(self):
+        cache = ResultCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')  # `b` is now the least recently used
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertEqual(2, len(cache))
+
+    def test_file(self):
+        file_path = os.path.join(self.folder, 'results.sqlite')
+        cache = ResultCache(maxsize=1, file_path=file_path)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))  # Evicted from memory but not from disk
+        cache.close()
+
+        cache = ResultCache(file_path=file_path)
+        self.assertEqual(2, cache.get('b'))
+        cache.clear()
+        self.assertNotIn('a', cache)
+        cache.close()
+
+
+class TestAnalysisCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        settings.config['nrfa']['oh_json_url'] = \
+            'file:' + pathname2url(os.path.abspath('./floodestimation/fehdata_test.json'))
+        cls.db_session = db.Session()
+        cls.gauged_catchments = CatchmentCollections(cls.db_session)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_session.close()
+        db.empty_db_tables()
+
+    def setUp(self):
+        self.catchment = from_file('floodestimation/tests/data/170021.CD3')
+        self.cache = ResultCache()
+
+    def test_disabled_by_default(self):
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments)
+        analysis.qmed()
+        self.assertIsNone(analysis.cache)
+        self.assertNotIn('cached', analysis.results_log)
+
+    def test_qmed(self):
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments, year=2000, cache=self.cache)
+        expected = analysis.qmed()
+        self.assertFalse(analysis.results_log['cached'])
+
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments, year=2000, cache=self.cache)
+        with db.assert_max_queries(1):  # Data version of gauged catchments
+            result = analysis.qmed()
+        self.assertEqual(expected, result)
+        self.assertTrue(analysis.results_log['cached'])
+        self.assertIn('qmed_descr_rural', analysis.results_log)
+        self.assertNotIn('donors', analysis.results_log)
+
+    def test_qmed_different_year(self):
+        QmedAnalysis(self.catchment, self.gauged_catchments, year=2000, cache=self.cache).qmed()
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments, year=2010, cache=self.cache)
+        analysis.qmed()
+        self.assertFalse(analysis.results_log['cached'])
+
+    def test_qmed_changed_descriptors(self):
+        QmedAnalysis(self.catchment, self.gauged_catchments, year=2000, cache=self.cache).qmed()
+        self.catchment.descriptors.saar += 1
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments, year=2000, cache=self.cache)
+        analysis.qmed()
+        self.assertFalse(analysis.results_log['cached'])
+
+    def test_key(self):
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments, year=2000)
+        key = result_key('qmed', analysis, 'descriptors', {}, ('descriptors', ))
+        self.assertEqual(key, result_key('qmed', analysis, 'descriptors', {}, ('descriptors', )))
+        self.assertNotEqual(key, result_key('qmed', analysis, 'descriptors', {'as_rural': True}, ('descriptors', )))
+        analysis = QmedAnalysis(self.catchment, year=2000)  # No gauged catchments
+        self.assertNotEqual(key, result_key('qmed', analysis, 'descriptors', {}, ('descriptors', )))
+
+    def test_key_donor_data(self):
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments, year=2000)
+        key = result_key('qmed', analysis, 'descriptors', {}, ('descriptors', ))
+        self.assertEqual(key, result_key('qmed', analysis, 'descriptors', {}, ('descriptors', )))
+        try:
+            donor = self.db_session.query(Catchment).filter(Catchment.is_suitable_for_qmed).first()
+            donor.amax_records[0].flow += 1
+            self.db_session.flush()
+            analysis = QmedAnalysis(self.catchment, CatchmentCollections(self.db_session), year=2000)
+            changed_key = result_key('qmed', analysis, 'descriptors', {}, ('descriptors', ))
+            self.assertNotEqual(key, changed_key)
+
+            loaders.to_db(from_file('floodestimation/tests/data/37017.CD3'), self.db_session)
+            analysis = QmedAnalysis(self.catchment, CatchmentCollections(self.db_session), year=2000)
+            self.assertNotIn(result_key('qmed', analysis, 'descriptors', {}, ('descriptors', )), [key, changed_key])
+        finally:
+            self.db_session.rollback()
+        analysis = QmedAnalysis(self.catchment, CatchmentCollections(self.db_session), year=2000)
+        self.assertEqual(key, result_key('qmed', analysis, 'descriptors', {}, ('descriptors', )))
+
+    def test_key_no_donor_method(self):
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments, year=2000)
+        with db.assert_max_queries(0):
+            key = result_key('qmed', analysis, 'amax_records', {}, ('descriptors', ))
+        self.assertEqual(key, result_key('qmed', QmedAnalysis(self.catchment, year=2000), 'amax_records', {}))
+        self.assertNotEqual(key, result_key('qmed', analysis, 'amax_records', {}, ('amax_records', )))
+
+    def test_key_no_data_version(self):
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments, year=2000)
+        with mock.patch.object(CatchmentCollections, 'data_key', return_value=None):
+            self.assertIsNone(result_key('qmed', analysis, 'descriptors', {}, ('descriptors', )))
+            self.assertIsNotNone(result_key('qmed', analysis, 'amax_records', {}, ('descriptors', )))
+
+    def test_qmed_donor_added(self):
+        QmedAnalysis(self.catchment, self.gauged_catchments, year=2000, cache=self.cache).qmed()
+        try:
+            loaders.to_db(from_file('floodestimation/tests/data/37017.CD3'), self.db_session)
+            analysis = QmedAnalysis(self.catchment, CatchmentCollections(self.db_session), year=2000, cache=self.cache)
+            analysis.qmed()
+            self.assertFalse(analysis.results_log['cached'])
+        finally:
+            self.db_session.rollback()
+
+    def test_key_manual_donors(self):
+        analysis = QmedAnalysis(self.catchment, self.gauged_catchments, year=2000)
+        donors = self.gauged_catchments.nearest_qmed_catchments(self.catchment)
+        self.assertIsNone(result_key('qmed', analysis, 'descriptors', {'donor_catchments': donors}))
+        self.assertIsNotNone(result_key('qmed', analysis, 'descriptors', {'donor_catchments': []}))
+
+    def test_growth_curve_file(self):
+        file_path = os.path.join(tempfile.mkdtemp(), 'results.sqlite')
+        try:
+            cache = ResultCache(file_path=file_path)
+            expected = GrowthCurveAnalysis(self.catchment, self.gauged_catchments, year=2000,
+                                           cache=cache).growth_curve()
+            cache.close()
+
+            cache = ResultCache(file_path=file_path)
+            analysis = GrowthCurveAnalysis(self.catchment, self.gauged_catchments, year=2000, cache=cache)
+            result = analysis.growth_curve()
+            cache.close()
+            self.assertTrue(analysis.results_log['cached'])
+            assert_almost_equal(result([0.5, 0.1, 0.01]), expected([0.5, 0.1, 0.01]))
+        finally:
+            shutil.rmtree(os.path.dirname(file_path), ignore_errors=True)
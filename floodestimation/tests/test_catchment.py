@@ -1,7 +1,14 @@
 import unittest
+import copy
+import pickle
 from datetime import date
+from sqlalchemy import inspect
 from floodestimation import db
-from floodestimation.entities import Catchment, AmaxRecord, Point, PotRecord, PotDataGap, PotDataset, PotPeriod
+from floodestimation import loaders
+from floodestimation.analysis import QmedAnalysis
+from floodestimation.collections import CatchmentCollections
+from floodestimation.entities import Catchment, AmaxRecord, Point, Coordinates, PotRecord, PotDataGap, PotDataset, \
+    PotPeriod, CatchmentRecord, distance_matrix
 
 
 class TestCatchmentObject(unittest.TestCase):
@@ -45,6 +52,54 @@ class TestCatchmentObject(unittest.TestCase):
 
         self.assertEqual(catchment_1.distance_to(catchment_2), float('inf'))
 
+    def test_catchment_distance_no_centroid(self):
+        catchment_1 = Catchment("Aberdeen", "River Dee")
+        catchment_1.descriptors.centroid_ngr = Point(0, 0)
+        catchment_2 = Catchment("Dundee", "River Tay")
+        self.assertEqual(catchment_1.distance_to(catchment_2), float('inf'))
+
+    def test_catchment_distance_centroid_changed(self):
+        catchment_1 = Catchment("Aberdeen", "River Dee")
+        catchment_1.descriptors.centroid_ngr = Point(0, 0)
+        catchment_2 = Catchment("Dundee", "River Tay")
+        catchment_2.descriptors.centroid_ngr = Point(0, 4000)
+        catchment_2.descriptors.centroid_ngr.x = 3000
+        self.assertEqual(catchment_1.distance_to(catchment_2), 5)
+
+    def test_distance_matrix(self):
+        catchments = [Catchment() for _ in range(4)]
+        for catchment, country, point in zip(catchments, ['gb', 'gb', 'ni', 'gb'],
+                                             [Point(0, 0), Point(3000, 4000), Point(0, 0), None]):
+            catchment.country = country
+            catchment.descriptors.centroid_ngr = point
+        result = distance_matrix(catchments[0:2], catchments)
+        self.assertEqual((2, 4), result.shape)
+        self.assertEqual([[0, 5, float('inf'), float('inf')], [5, 0, float('inf'), float('inf')]], result.tolist())
+        for i, catchment_a in enumerate(catchments[0:2]):
+            for j, catchment_b in enumerate(catchments):
+                self.assertEqual(catchment_a.distance_to(catchment_b), result[i, j])
+
+    def test_distance_matrix_symmetric(self):
+        catchments = [Catchment() for _ in range(3)]
+        for i, catchment in enumerate(catchments):
+            catchment.descriptors.centroid_ngr = Point(3000 * i, 4000 * i)
+        result = distance_matrix(catchments)
+        self.assertEqual([[0, 5, 10], [5, 0, 5], [10, 5, 0]], result.tolist())
+
+    def test_distance_matrix_empty(self):
+        self.assertEqual((0, 1), distance_matrix([], [Catchment()]).shape)
+
+    def test_centroid_coordinates(self):
+        catchment = Catchment("Aberdeen", "River Dee")
+        self.assertIsNone(catchment.descriptors.centroid_coordinates)
+        catchment.descriptors.centroid_ngr = Point(3000, 4000)
+        coordinates = catchment.descriptors.centroid_coordinates
+        self.assertEqual(Coordinates(3000, 4000), coordinates)
+        self.assertEqual(catchment.descriptors.centroid_ngr, coordinates)
+        self.assertEqual(5000, coordinates.distance_to(Coordinates(0, 0)))
+        with self.assertRaises(AttributeError):
+            coordinates.x = 0
+
     def test_urbext_2000(self):
         catchment = Catchment("Aberdeen", "River Dee")
         catchment.descriptors.urbext2000 = 1.2345
@@ -138,3 +193,69 @@ class TestCatchmentDatabase(unittest.TestCase):
         result = self.db_session.query(Catchment).filter_by(location="Aberdeen", watercourse="River Dee").one()
         self.assertEqual(catchment, result)
         self.assertEqual(catchment.amax_records, result.amax_records)
+
+    def test_record_catchment_from_db(self):
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3', incl_series=True)
+        self.db_session.add(catchment)
+        self.db_session.flush()
+        self.db_session.expire_all()
+        catchment = self.db_session.query(Catchment).get(17002)
+
+        result = Catchment.from_record(pickle.loads(pickle.dumps(catchment.to_record())))
+        self.assertIsNone(inspect(result).session)  # Detached, not bound to any session
+        self.assertEqual(17002, result.id)
+        self.assertEqual(catchment.descriptors.centroid_ngr, result.descriptors.centroid_ngr)
+        self.assertEqual(4, len(result.amax_records))
+        self.assertEqual(146, len(result.pot_dataset.pot_records))
+        self.assertEqual(500, len(result.peak_flow_series))
+
+    def test_pickle_catchment_pooling_profile(self):
+        self.db_session.add(loaders.from_file('floodestimation/tests/data/17002.CD3'))
+        self.db_session.flush()
+        self.db_session.expire_all()
+        collection = CatchmentCollections(self.db_session, load_data='manual', loading_profile='pooling')
+        catchment = collection.catchment_by_number(17002)
+
+        with db.assert_max_queries(0):
+            for result in [pickle.loads(pickle.dumps(catchment)), copy.copy(catchment), copy.deepcopy(catchment)]:
+                self.assertEqual(17002, result.id)
+                self.assertEqual(4, len(result.amax_records))
+                self.assertEqual(catchment.descriptors.centroid_ngr, result.descriptors.centroid_ngr)
+
+
+class TestCatchmentRecord(unittest.TestCase):
+    def setUp(self):
+        self.catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+
+    def test_round_trip(self):
+        catchment = Catchment.from_record(self.catchment.to_record())
+        self.assertEqual(self.catchment.id, catchment.id)
+        self.assertEqual(self.catchment.point, catchment.point)
+        self.assertEqual(self.catchment.descriptors.saar, catchment.descriptors.saar)
+        self.assertEqual([(c.title, c.content) for c in self.catchment.comments],
+                         [(c.title, c.content) for c in catchment.comments])
+        self.assertEqual([(r.date, r.flow, r.stage, r.flag) for r in self.catchment.amax_records],
+                         [(r.date, r.flow, r.stage, r.flag) for r in catchment.amax_records])
+        self.assertEqual([(r.date, r.flow, r.stage) for r in self.catchment.pot_dataset.pot_records],
+                         [(r.date, r.flow, r.stage) for r in catchment.pot_dataset.pot_records])
+        self.assertEqual(self.catchment.pot_dataset.total_gap_length(), catchment.pot_dataset.total_gap_length())
+        self.assertFalse(catchment.pot_dataset.is_packed)
+
+    def test_catchment_not_modified(self):
+        self.catchment.to_record()
+        self.assertFalse(self.catchment.pot_dataset.is_packed)
+
+    def test_pot_options(self):
+        record = self.catchment.to_record()
+        self.assertTrue(Catchment.from_record(record, pot_output='arrays').pot_dataset.is_packed)
+        self.assertIsNone(Catchment.from_record(record, incl_pot=False).pot_dataset)
+
+    def test_pickle(self):
+        record = self.catchment.to_record()
+        self.assertIsInstance(record, CatchmentRecord)
+        self.assertEqual(record, pickle.loads(pickle.dumps(record)))
+
+    def test_analysis(self):
+        expected = QmedAnalysis(self.catchment).qmed_all_methods()
+        result = QmedAnalysis(self.catchment.to_record()).qmed_all_methods()
+        self.assertEqual(expected, result)
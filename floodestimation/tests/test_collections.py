@@ -3,10 +3,13 @@
 import unittest
 import os
 from urllib.request import pathname2url
+from floodestimation import cache
 from floodestimation import db
 from floodestimation import loaders
 from floodestimation import settings
+from floodestimation.analysis import QmedAnalysis
 from floodestimation.collections import CatchmentCollections
+from floodestimation.entities import Catchment
 
 
 class TestCatchmentCollection(unittest.TestCase):
@@ -36,6 +39,67 @@ class TestCatchmentCollection(unittest.TestCase):
         result = CatchmentCollections(self.db_session, load_data='manual').catchment_by_number(99)
         self.assertIsNone(result)
 
+    def test_catchment_by_number_analysis_profile(self):
+        CatchmentCollections(self.db_session)  # Ensures NRFA data is loaded
+        session = db.Session()  # New session without any catchments loaded already
+        try:
+            collections = CatchmentCollections(session)
+            # Catchment and descriptors, AMAX records, POT dataset, POT records, POT gaps
+            with db.assert_max_queries(5):
+                catchment = collections.catchment_by_number(17002, loading_profile='analysis')
+                self.assertEqual(38, len(catchment.amax_records))
+                self.assertEqual(146, len(catchment.pot_dataset.pot_records))
+                self.assertEqual(0.511, catchment.descriptors.bfihost)
+                self.assertEqual([], catchment.comments)
+        finally:
+            session.close()
+
+    def test_catchment_by_number_full_profile(self):
+        CatchmentCollections(self.db_session)
+        session = db.Session()
+        try:
+            catchment = CatchmentCollections(session, loading_profile='full').catchment_by_number(17002)
+            with db.assert_max_queries(0):
+                self.assertEqual(4, len(catchment.comments))
+                self.assertEqual(146, len(catchment.pot_dataset.pot_records))
+        finally:
+            session.close()
+
+    def test_pooling_profile(self):
+        CatchmentCollections(self.db_session)
+        session = db.Session()
+        try:
+            subject_catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+            collections = CatchmentCollections(session, loading_profile='pooling')
+            with db.assert_max_queries(2):  # Catchments and descriptors, AMAX records
+                catchments = collections.most_similar_catchments(subject_catchment, lambda c1, c2: 0,
+                                                                 include_subject_catchment='exclude')
+                self.assertEqual(2, len(catchments))
+                for catchment in catchments:
+                    self.assertIsNotNone(catchment.descriptors.bfihost)
+                    self.assertEqual([], catchment.comments)
+            # POT dataset is not loaded with the catchments, but still available when accessed
+            self.assertIsNotNone(catchments[0].catchment.pot_dataset)
+        finally:
+            session.close()
+
+    def test_pooling_profile_subject_catchment(self):
+        CatchmentCollections(self.db_session)
+        session = db.Session()
+        try:
+            catchment = CatchmentCollections(session, loading_profile='pooling').catchment_by_number(17001)
+            self.assertAlmostEqual(QmedAnalysis(catchment).qmed(), QmedAnalysis(catchment).qmed(method='amax_records'))
+            self.assertIsNotNone(QmedAnalysis(catchment).qmed(method='best'))
+            self.assertIsNotNone(cache._catchment_content(catchment))
+            self.assertIsNotNone(catchment.pot_dataset)
+            result = Catchment.from_record(catchment.to_record())
+            self.assertEqual(len(catchment.pot_dataset.pot_records), len(result.pot_dataset.pot_records))
+        finally:
+            session.close()
+
+    def test_invalid_loading_profile(self):
+        self.assertRaises(ValueError, CatchmentCollections, self.db_session, loading_profile='some')
+
     def test_nearest_catchments(self):
         subject_catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
         catchments = CatchmentCollections(self.db_session).nearest_qmed_catchments(subject_catchment)
@@ -43,6 +107,22 @@ class TestCatchmentCollection(unittest.TestCase):
         expected = [17001, 10001, 10002]
         self.assertEqual(expected, result)
 
+    def test_nearest_catchments_dist_limit(self):
+        subject_catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        catchments = CatchmentCollections(self.db_session).nearest_qmed_catchments(subject_catchment, dist_limit=50)
+        result = [catchment.id for catchment in catchments]
+        self.assertEqual([17001], result)
+
+    def test_nearest_catchments_records(self):
+        subject_catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        catchments = CatchmentCollections(self.db_session).nearest_qmed_catchments(subject_catchment)
+        donor = catchments[0]
+        self.assertEqual(17001, donor.id)  # Catchment attributes accessible through record
+        self.assertAlmostEqual(donor.dist, donor.catchment.distance_to(subject_catchment), places=3)
+        self.assertNotIn('dist', vars(donor.catchment))  # Catchment object itself not modified
+        with self.assertRaises(AttributeError):
+            donor.dist = 0
+
     def test_most_similar_catchments(self):
         subject_catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
         # Dummy similarity distance function
@@ -51,6 +131,7 @@ class TestCatchmentCollection(unittest.TestCase):
         result = [c.id for c in catchments]
         expected = [10001, 10002]
         self.assertEqual(expected, result)
+        self.assertNotIn('similarity_dist', vars(catchments[0].catchment))
 
     def test_most_similar_catchments_excl_rejected_amax(self):
         subject_catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
@@ -93,3 +174,39 @@ class TestCatchmentCollection(unittest.TestCase):
         function = lambda c1, c2: abs(c2.descriptors.altbar - c1.descriptors.altbar)
         self.assertRaises(ValueError, CatchmentCollections(self.db_session).most_similar_catchments,
                           subject_catchment, function, include_subject_catchment='invalid')
+
+
+class TestCatchmentCollectionQueryPlans(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db_session = db.Session()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_session.close()
+
+    def query_plan(self, query):
+        sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+        return '\n'.join(row[-1] for row in self.db_session.execute('EXPLAIN QUERY PLAN ' + sql))
+
+    def test_nearest_catchments_query_plan(self):
+        subject_catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        query = CatchmentCollections(self.db_session, load_data='manual')._nearest_qmed_query(subject_catchment, 500)
+        plan = self.query_plan(query)
+        self.assertIn('USING INDEX ix_catchments_country_qmed', plan)
+        self.assertIn('USING COVERING INDEX ix_amaxrecords_catchment_flag', plan)
+        self.assertNotIn('GROUP BY', plan)
+
+    def test_nearest_catchments_query_plan_spatial_index(self):
+        subject_catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        query = CatchmentCollections(self.db_session, load_data='manual')._nearest_qmed_query(subject_catchment, 500)
+        plan = self.query_plan(query)
+        self.assertIn('SCAN catchment_centroids VIRTUAL TABLE INDEX 2:', plan)
+
+    def test_most_similar_catchments_query_plan(self):
+        subject_catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        query = CatchmentCollections(self.db_session, load_data='manual')._most_similar_query(subject_catchment)
+        plan = self.query_plan(query)
+        self.assertIn('USING INDEX ix_catchments_is_suitable_for_pooling', plan)
+        self.assertIn('USING COVERING INDEX ix_amaxrecords_catchment_flag (catchment_id=? AND flag=?)', plan)
+        self.assertNotIn('GROUP BY', plan)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from urllib.request import pathname2url
+from numpy.testing import assert_almost_equal
+from floodestimation import db
+from floodestimation import settings
+from floodestimation import correlation
+from floodestimation.correlation import DonorCorrelation
+from floodestimation.collections import CatchmentCollections
+from floodestimation.entities import Catchment, Point
+from floodestimation.analysis import QmedAnalysis
+from floodestimation.instrumentation import Instrumentation
+from floodestimation.loaders import from_file
+
+
+class TestDonorCorrelation(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_distance_matrix(self):
+        dist = correlation.distance_matrix(np.array(['gb', 'gb', 'ni', 'gb']),
+                                           np.array([0, 3000, 0, np.nan]), np.array([0, 4000, 0, 0]))
+        assert_almost_equal(dist[0], [0, 5, np.inf, np.inf])
+        assert_almost_equal(dist, dist.T)
+
+    def test_centroid_arrays(self):
+        catchments = [Catchment() for _ in range(3)]
+        catchments[0].descriptors.centroid_ngr = Point(0, 0)
+        catchments[0].country = 'gb'
+        catchments[1].descriptors.centroid_ngr = Point(3000, 4000)
+        catchments[1].country = 'gb'
+        countries, x, y = correlation.centroid_arrays(catchments)
+        self.assertEqual(['gb', 'gb', ''], countries.tolist())
+        assert_almost_equal(x, [0, 3000, np.nan])
+        assert_almost_equal(correlation.distance_matrix(countries, x, y)[0], [0, 5, np.inf])
+
+    def test_from_coordinates(self):
+        matrices = DonorCorrelation.from_coordinates([1, 2], np.array(['gb', 'gb']), np.array([0., 188848.7072]),
+                                                     np.array([0., 0.]))
+        assert_almost_equal(matrices.model_error_corr, [[1, 0.001908936], [0.001908936, 1]])
+        assert_almost_equal(matrices.lnqmed_corr, [[1, 0.133632774], [0.133632774, 1]])
+
+    def test_indices(self):
+        matrices = DonorCorrelation.from_coordinates([10, 20, 30], np.array(['gb'] * 3), np.zeros(3), np.zeros(3))
+        catchments = [Catchment() for _ in range(3)]
+        for catchment, catchment_id in zip(catchments, [30, 10, 40]):
+            catchment.id = catchment_id
+        self.assertEqual([2, 0], matrices.indices(catchments[0:2]).tolist())
+        self.assertIsNone(matrices.indices(catchments))
+
+    def test_save_load(self):
+        file_path = os.path.join(self.folder, 'fehdata.sqlite.correlation.npz')
+        matrices = DonorCorrelation.from_coordinates([10, 20], np.array(['gb'] * 2), np.array([0., 1000.]),
+                                                     np.zeros(2), key='abc')
+        matrices.save(file_path)
+        result = DonorCorrelation.load(file_path, 'abc')
+        self.assertEqual([10, 20], result.ids.tolist())
+        self.assertEqual('abc', result.key)
+        assert_almost_equal(result.model_error_corr, matrices.model_error_corr)
+        assert_almost_equal(result.lnqmed_corr, matrices.lnqmed_corr)
+
+    def test_load_different_key(self):
+        file_path = os.path.join(self.folder, 'fehdata.sqlite.correlation.npz')
+        DonorCorrelation.from_coordinates([10], np.array(['gb']), np.zeros(1), np.zeros(1), key='abc').save(file_path)
+        self.assertIsNone(DonorCorrelation.load(file_path, 'def'))
+
+    def test_load_missing_file(self):
+        self.assertIsNone(DonorCorrelation.load(os.path.join(self.folder, 'missing.npz')))
+
+
+class TestDonorCorrelationDb(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        settings.config['nrfa']['oh_json_url'] = \
+            'file:' + pathname2url(os.path.abspath('./floodestimation/fehdata_test.json'))
+        cls.db_session = db.Session()
+        CatchmentCollections(cls.db_session)  # Load test data
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_session.close()
+        db.empty_db_tables()
+
+    def setUp(self):
+        self.catchment = from_file('floodestimation/tests/data/170021.CD3')
+        self.file_path = correlation.file_path_for(self.db_session)
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+    def test_matrices(self):
+        matrices = correlation.donor_correlation(self.db_session)
+        analysis = QmedAnalysis(self.catchment)
+        catchments = [self.db_session.query(Catchment).get(catchment_id) for catchment_id in matrices.ids.tolist()]
+        self.assertTrue(all(catchment.is_suitable_for_qmed for catchment in catchments))
+        for i, catchment1 in enumerate(catchments):
+            for j, catchment2 in enumerate(catchments):
+                self.assertAlmostEqual(matrices.model_error_corr[i, j],
+                                       analysis._model_error_corr(catchment1, catchment2))
+                self.assertAlmostEqual(matrices.lnqmed_corr[i, j], analysis._lnqmed_corr(catchment1, catchment2))
+
+    def test_file_reused(self):
+        expected = correlation.donor_correlation(self.db_session)
+        self.assertTrue(os.path.exists(self.file_path))
+
+        instrumentation = Instrumentation()
+        with instrumentation.span('test'):
+            result = correlation.donor_correlation(self.db_session)
+        self.assertEqual(1, instrumentation.counters['cache.donor_correlation.hit'])
+        self.assertEqual(expected.key, result.key)
+
+    def test_file_rebuilt_after_data_change(self):
+        expected = correlation.donor_correlation(self.db_session)
+        catchment = self.db_session.query(Catchment).get(int(expected.ids[0]))
+        catchment.descriptors.centroid_ngr_x += 1000
+        self.db_session.flush()
+        try:
+            instrumentation = Instrumentation()
+            with instrumentation.span('test'):
+                result = correlation.donor_correlation(self.db_session)
+            self.assertEqual(1, instrumentation.counters['cache.donor_correlation.miss'])
+            self.assertNotEqual(expected.key, result.key)
+        finally:
+            self.db_session.rollback()
+
+    def test_qmed(self):
+        expected_analysis = QmedAnalysis(self.catchment, CatchmentCollections(self.db_session), year=2000)
+        expected = expected_analysis.qmed(method='descriptors')
+
+        gauged_catchments = CatchmentCollections(self.db_session, donor_correlation=True)
+        analysis = QmedAnalysis(self.catchment, gauged_catchments, year=2000)
+        self.assertAlmostEqual(expected, analysis.qmed(method='descriptors'))
+        donors = analysis.find_donor_catchments()
+        assert_almost_equal(analysis._matrix_omega(donors), expected_analysis._matrix_omega(donors))
+        self.assertIsNotNone(analysis._donor_correlation(donors))
+
+    def test_disabled_by_default(self):
+        analysis = QmedAnalysis(self.catchment, CatchmentCollections(self.db_session), year=2000)
+        self.assertIsNone(analysis._donor_correlation(analysis.find_donor_catchments()))
+
+    def test_donor_not_included(self):
+        analysis = QmedAnalysis(self.catchment, CatchmentCollections(self.db_session, donor_correlation=True))
+        donors = analysis.find_donor_catchments() + [self.catchment]
+        self.assertIsNone(analysis._donor_correlation(donors))
+
+    def test_shared_matrices(self):
+        matrices = correlation.donor_correlation(self.db_session)
+        gauged_catchments = CatchmentCollections(self.db_session, donor_correlation=matrices)
+        with db.assert_max_queries(0):
+            self.assertIs(matrices, gauged_catchments.donor_correlation())
@@ -1,10 +1,25 @@
 import unittest
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import sqlite3
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import DatabaseError, OperationalError
+from sqlalchemy.orm import sessionmaker
 from floodestimation import db
-from floodestimation.entities import Catchment
+from floodestimation import settings
+from floodestimation import loaders
+from floodestimation.collections import CatchmentCollections
+from floodestimation.entities import Catchment, Point
 
 
 class TestDatabaseCreation(unittest.TestCase):
-    all_tables = ['amaxrecords', 'catchments', 'comments', 'descriptors', 'potdatagaps', 'potdatasets', 'potrecords']
+    all_tables = ['amaxrecords', 'catchments', 'comments', 'descriptors', 'peakflowseries', 'potdatagaps',
+                  'potdatasets', 'potrecords']
 
     def test_database_contains_all_tables(self):
         self.assertEqual(self.all_tables,
@@ -36,4 +51,345 @@ class TestDatabaseCreation(unittest.TestCase):
         self.assertEqual(self.all_tables,
                          sorted(list(db.metadata.tables.keys())))
         self.assertEqual(db_session.query(Catchment).count(), 0)
-        db_session.close()
\ No newline at end of file
+        db_session.close()
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_import_has_no_side_effects(self):
+        code = "import sys, floodestimation; " \
+               "print(floodestimation.db._engine is None, 'scipy' in sys.modules, 'lmoments3' in sys.modules)"
+        output = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True)
+        self.assertEqual(output.split(), ['True', 'False', 'False'])
+
+    def test_engine_created_on_first_use(self):
+        self.assertIs(db.engine, db.get_engine())
+        self.assertIsNotNone(db._engine)
+
+
+class TestSqliteEngine(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.folder, 'test.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_pragmas_from_config(self):
+        with db.engine.connect() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(conn.execute('PRAGMA synchronous').scalar(), 1)  # normal
+            self.assertEqual(conn.execute('PRAGMA cache_size').scalar(), -20000)
+
+    def test_pragmas(self):
+        engine = db.create_sqlite_engine(self.file_path, journal_mode='WAL', synchronous='off', cache_size=1000,
+                                         mmap_size=0)
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(conn.execute('PRAGMA synchronous').scalar(), 0)
+            self.assertEqual(conn.execute('PRAGMA cache_size').scalar(), 1000)
+            self.assertEqual(conn.execute('PRAGMA mmap_size').scalar(), 0)
+
+    def test_invalid_journal_mode(self):
+        self.assertRaises(ValueError, db.create_sqlite_engine, self.file_path, journal_mode='fast')
+
+    def test_read_only(self):
+        engine = db.create_sqlite_engine(self.file_path, journal_mode='wal')
+        engine.execute('CREATE TABLE test (id INTEGER)')
+        engine.execute('INSERT INTO test VALUES (1)')
+        engine.dispose()
+
+        engine = db.create_sqlite_engine(self.file_path, journal_mode='wal', read_only=True)
+        self.assertEqual(engine.execute('SELECT count(*) FROM test').scalar(), 1)
+        self.assertRaises(OperationalError, engine.execute, 'INSERT INTO test VALUES (2)')
+        engine.dispose()
+
+    def read_only_session_output(self):
+        code = "from floodestimation import db, settings; " \
+               "from floodestimation.entities import Catchment; " \
+               "settings.config['db']['folder'] = {!r}; " \
+               "settings.config['db']['read_only'] = 'yes'; " \
+               "print(db.Session().query(Catchment).count())".format(self.folder)
+        return subprocess.run([sys.executable, '-c', code], universal_newlines=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE)
+
+    def test_read_only_config(self):
+        file_path = os.path.join(self.folder, settings.config['db']['filename'])
+        engine = db.create_sqlite_engine(file_path)
+        db.Base.metadata.create_all(engine)
+        engine.dispose()
+        result = self.read_only_session_output()
+        self.assertEqual('0', result.stdout.strip(), result.stderr)
+
+    def test_read_only_config_missing_file(self):
+        result = self.read_only_session_output()
+        self.assertNotEqual(0, result.returncode)
+        self.assertIn('FileNotFoundError: Database file', result.stderr)
+        self.assertEqual([], os.listdir(self.folder))
+
+
+class TestMigration(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.engine = db.create_sqlite_engine(os.path.join(self.folder, 'test.sqlite'))
+        # Database file as created by earlier versions, i.e. without composite indexes
+        db.Base.metadata.create_all(self.engine)
+        self.engine.execute('DROP INDEX ix_catchments_country_qmed')
+        self.engine.execute('DROP INDEX ix_amaxrecords_catchment_flag')
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def index_names(self):
+        return [row[0] for row in self.engine.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+
+    def test_migrate_creates_indexes(self):
+        db.migrate_db(self.engine)
+        self.assertIn('ix_catchments_country_qmed', self.index_names())
+        self.assertIn('ix_amaxrecords_catchment_flag', self.index_names())
+        self.assertEqual(self.engine.execute('PRAGMA user_version').scalar(), db.SCHEMA_VERSION)
+
+    def test_migrate_twice(self):
+        db.migrate_db(self.engine)
+        db.migrate_db(self.engine)
+        self.assertEqual(self.engine.execute('PRAGMA user_version').scalar(), db.SCHEMA_VERSION)
+
+    def test_migrate_adds_columns(self):
+        # POT datasets table as created by earlier versions, i.e. without packed POT records
+        self.engine.execute('DROP TABLE potdatasets')
+        self.engine.execute('CREATE TABLE potdatasets (catchment_id INTEGER NOT NULL PRIMARY KEY, start_date DATE, '
+                            'end_date DATE, threshold FLOAT)')
+        self.engine.execute('PRAGMA user_version=2')
+        db.migrate_db(self.engine)
+        columns = [row[1] for row in self.engine.execute('PRAGMA table_info(potdatasets)')]
+        self.assertEqual(columns[-3:], ['packed_dates', 'packed_flows', 'packed_stages'])
+
+
+class TestCentroidIndex(unittest.TestCase):
+    def setUp(self):
+        self.db_session = db.Session()
+
+    def tearDown(self):
+        self.db_session.rollback()
+        self.db_session.close()
+
+    def centroid_index_rows(self):
+        return self.db_session.execute(db.centroid_index.select()).fetchall()
+
+    def test_has_centroid_index(self):
+        self.assertTrue(db.has_centroid_index(db.engine))
+
+    def test_insert_update_delete(self):
+        catchment = Catchment(location="Aberdeen", watercourse="River Dee")
+        catchment.id = 999
+        catchment.descriptors.centroid_ngr = Point(1000, 2000)
+        self.db_session.add(catchment)
+        self.db_session.flush()
+        self.assertEqual(self.centroid_index_rows(), [(999, 1000, 1000, 2000, 2000)])
+
+        catchment.descriptors.centroid_ngr = Point(3000, 4000)
+        self.db_session.flush()
+        self.assertEqual(self.centroid_index_rows(), [(999, 3000, 3000, 4000, 4000)])
+
+        self.db_session.delete(catchment)
+        self.db_session.flush()
+        self.assertEqual(self.centroid_index_rows(), [])
+
+    def test_no_centroid(self):
+        catchment = Catchment(location="Aberdeen", watercourse="River Dee")
+        catchment.id = 999
+        self.db_session.add(catchment)
+        self.db_session.flush()
+        self.assertEqual(self.centroid_index_rows(), [])
+
+
+class TestDataVersion(unittest.TestCase):
+    def setUp(self):
+        self.db_session = db.Session()
+
+    def tearDown(self):
+        self.db_session.rollback()
+        self.db_session.close()
+
+    def test_insert_update_delete(self):
+        versions = [db.data_version(self.db_session)]
+        catchment = Catchment(location="Aberdeen", watercourse="River Dee")
+        catchment.id = 999
+        self.db_session.add(catchment)
+        self.db_session.flush()
+        versions.append(db.data_version(self.db_session))
+
+        catchment.descriptors.saar = 1000
+        self.db_session.flush()
+        versions.append(db.data_version(self.db_session))
+
+        self.db_session.delete(catchment)
+        self.db_session.flush()
+        versions.append(db.data_version(self.db_session))
+        self.assertNotIn(None, versions)
+        self.assertEqual(len(set(versions)), 4)
+
+        self.db_session.rollback()
+        self.assertEqual(db.data_version(self.db_session), versions[0])
+
+    def test_empty_db_tables(self):
+        catchment = Catchment(location="Aberdeen", watercourse="River Dee")
+        catchment.id = 999
+        self.db_session.add(catchment)
+        self.db_session.commit()
+        version = db.data_version(db.engine)
+        db.empty_db_tables()
+        self.assertIsNotNone(db.data_version(db.engine))
+        self.assertNotEqual(db.data_version(db.engine), version)
+
+    def test_unique_for_database_file(self):
+        folder = tempfile.mkdtemp()
+        try:
+            engines = [db.create_sqlite_engine(os.path.join(folder, name)) for name in ['a.sqlite', 'b.sqlite']]
+            for engine in engines:
+                db.Base.metadata.create_all(engine)
+                db.migrate_db(engine)
+            self.assertNotEqual(db.data_version(engines[0]), db.data_version(engines[1]))
+            for engine in engines:
+                engine.dispose()
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def test_not_recorded(self):
+        folder = tempfile.mkdtemp()
+        try:
+            engine = db.create_sqlite_engine(os.path.join(folder, 'test.sqlite'))
+            db.Base.metadata.create_all(engine)
+            self.assertIsNone(db.data_version(engine))
+            engine.execute('PRAGMA user_version=4')
+            db.migrate_db(engine)
+            self.assertIsNotNone(db.data_version(engine))
+            engine.dispose()
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+class TestDamagedCentroidIndex(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.engine = db.create_sqlite_engine(os.path.join(self.folder, 'test.sqlite'))
+        db.Base.metadata.create_all(self.engine)
+        db.migrate_db(self.engine)
+        self.db_session = sessionmaker(bind=self.engine)()
+        for station in ['37017', '37020']:
+            loaders.to_db(loaders.from_file('floodestimation/tests/data/{}.CD3'.format(station)), self.db_session)
+        self.db_session.commit()
+        self.subject = self.db_session.query(Catchment).get(37017)
+        self.assertTrue(db.has_centroid_index(self.engine))
+
+    def tearDown(self):
+        self.db_session.close()
+        self.engine.dispose()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def damage_index(self):
+        # As done by earlier package versions emptying all (reflected) tables
+        for table in ['catchment_centroids_node', 'catchment_centroids_parent', 'catchment_centroids_rowid']:
+            self.engine.execute('DELETE FROM ' + table)
+
+    def nearest_ids(self):
+        collection = CatchmentCollections(self.db_session, load_data='manual')
+        return [donor.id for donor in collection.nearest_qmed_catchments(self.subject)]
+
+    def test_query_fallback(self):
+        expected = self.nearest_ids()
+        self.assertEqual([37020], expected)
+        self.damage_index()
+        self.assertEqual(expected, self.nearest_ids())
+        self.assertFalse(db.has_centroid_index(self.engine))
+
+    def test_transient_error(self):
+        self.damage_index()
+        error = OperationalError('SELECT', (), sqlite3.OperationalError('database is locked'))
+        with mock.patch.object(CatchmentCollections, '_nearest_qmed_rows', side_effect=error):
+            self.assertRaises(OperationalError, self.nearest_ids)
+        self.assertTrue(db.has_centroid_index(self.engine))
+
+    def test_is_corruption_error(self):
+        self.damage_index()
+        self.engine.dispose()  # R-tree is only read again by new connections
+        with self.assertRaises(DatabaseError) as cm:
+            self.engine.execute('SELECT COUNT(*) FROM catchment_centroids')
+        self.assertTrue(db.is_corruption_error(cm.exception))
+        self.assertFalse(db.is_corruption_error(OperationalError('SELECT', (), sqlite3.OperationalError('locked'))))
+
+    def test_rebuild_centroid_index(self):
+        self.damage_index()
+        self.engine.dispose()
+        db.rebuild_centroid_index(self.engine)
+        self.assertEqual([(37017, ), (37020, )],
+                         self.engine.execute('SELECT id FROM catchment_centroids ORDER BY id').fetchall())
+        self.assertEqual('ok', self.engine.execute("SELECT rtreecheck('catchment_centroids')").scalar())
+        self.assertTrue(db.has_centroid_index(self.engine))
+        self.assertEqual([37020], self.nearest_ids())
+
+    def test_migrate_rebuilds_index(self):
+        self.damage_index()
+        self.engine.dispose()
+        self.engine.execute('PRAGMA user_version=3')
+        db.migrate_db(self.engine)
+        self.assertEqual([(37017, ), (37020, )],
+                         self.engine.execute('SELECT id FROM catchment_centroids ORDER BY id').fetchall())
+
+    def test_migrate_incomplete_index(self):
+        self.engine.execute('DELETE FROM catchment_centroids WHERE id = 37020')
+        self.engine.execute('PRAGMA user_version=3')
+        db.migrate_db(self.engine)
+        self.assertEqual(2, self.engine.execute('SELECT COUNT(*) FROM catchment_centroids').scalar())
+
+    def test_migrate_current_version(self):
+        with db.count_queries(self.engine) as counter:
+            db.migrate_db(self.engine)
+        self.assertEqual(1, counter.total)  # `PRAGMA user_version` only
+
+
+class TestCountQueries(unittest.TestCase):
+    def test_statement_template(self):
+        self.assertEqual("SELECT a FROM b WHERE c IN (?, ...)",
+                         db.statement_template("SELECT a\n  FROM b WHERE c IN (?, ?,?)"))
+
+    def test_count_queries(self):
+        engine = db.get_engine()
+        with db.count_queries() as queries:
+            engine.execute('SELECT 1')
+            engine.execute('SELECT 1')
+            engine.execute('SELECT 2')
+        engine.execute('SELECT 3')  # Outside block
+        self.assertEqual(3, queries.total)
+        self.assertEqual(2, queries.statements['SELECT 1'])
+        self.assertTrue(queries.summary().startswith('3 SQL statements\n     2 x SELECT 1'))
+
+    def test_count_queries_other_threads_ignored(self):
+        engine = db.get_engine()
+        with db.count_queries() as queries:
+            thread = threading.Thread(target=lambda: engine.execute('SELECT 1'))
+            thread.start()
+            thread.join()
+        self.assertEqual(0, queries.total)
+
+    def test_count_queries_concurrent_threads(self):
+        engine = db.get_engine()
+
+        def run(n):
+            with db.count_queries(engine) as queries:
+                for _ in range(n):
+                    engine.execute('SELECT 1')
+            return queries.total
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(run, range(1, 17)))
+        self.assertEqual(list(range(1, 17)), results)
+
+    def test_assert_max_queries(self):
+        engine = db.get_engine()
+        with db.assert_max_queries(1):
+            engine.execute('SELECT 1')
+        with self.assertRaises(AssertionError):
+            with db.assert_max_queries(1):
+                engine.execute('SELECT 1')
+                engine.execute('SELECT 2')
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import json
+from urllib.request import pathname2url
+from floodestimation import db
+from floodestimation import settings
+from floodestimation import instrumentation
+from floodestimation.instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from floodestimation.collections import CatchmentCollections
+from floodestimation.analysis import QmedAnalysis, GrowthCurveAnalysis
+from floodestimation.loaders import from_file
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_nested_spans(self):
+        instr = Instrumentation()
+        with instr.span('a'):
+            with instr.span('b'):
+                pass
+            with instr.span('b'):
+                pass
+        result = instr.to_dict()
+        self.assertEqual(1, result['a.calls'])
+        self.assertEqual(2, result['a.b.calls'])
+        self.assertGreaterEqual(result['a.time'], result['a.b.time'])
+
+    def test_counters_only_in_span(self):
+        instr = Instrumentation()
+        instrumentation.count('x')
+        with instr.span('a'):
+            instrumentation.count('x')
+            instrumentation.count('x', 2)
+        self.assertEqual(3, instr.to_dict()['counters.x'])
+
+    def test_sql_statements(self):
+        instr = Instrumentation()
+        engine = db.get_engine()
+        engine.execute('SELECT 1')
+        with instr.span('a'):
+            engine.execute('SELECT 1')
+            engine.execute('SELECT 2')
+        result = instr.to_dict()
+        self.assertEqual(2, result['a.sql'])
+        self.assertEqual(2, result['sql.statements'])
+
+    def test_to_json(self):
+        instr = Instrumentation()
+        with instr.span('a'):
+            pass
+        self.assertEqual(instr.to_dict(), json.loads(instr.to_json()))
+
+    def test_null_instrumentation(self):
+        with NULL_INSTRUMENTATION.span('a'):
+            instrumentation.count('x')
+        self.assertEqual({}, NULL_INSTRUMENTATION.to_dict())
+
+
+class TestAnalysisInstrumentation(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        settings.config['nrfa']['oh_json_url'] = \
+            'file:' + pathname2url(os.path.abspath('./floodestimation/fehdata_test.json'))
+        cls.db_session = db.Session()
+        cls.gauged_catchments = CatchmentCollections(cls.db_session)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_session.close()
+        db.empty_db_tables()
+
+    def test_disabled_by_default(self):
+        analysis = QmedAnalysis(from_file('floodestimation/tests/data/170021.CD3'), self.gauged_catchments)
+        analysis.qmed()
+        self.assertIs(NULL_INSTRUMENTATION, analysis.instrumentation)
+        self.assertNotIn('instrumentation', analysis.results_log)
+
+    def test_qmed(self):
+        analysis = QmedAnalysis(from_file('floodestimation/tests/data/170021.CD3'), self.gauged_catchments,
+                                instrument=True)
+        analysis.qmed()
+        result = analysis.results_log['instrumentation'].to_dict()
+        self.assertEqual(1, result['qmed.calls'])
+        for span in ['donors', 'residuals', 'matrix_solve', 'urban_adjustment']:
+            self.assertEqual(1, result['qmed.descriptors_2008.{}.calls'.format(span)])
+        self.assertGreater(result['qmed.descriptors_2008.donors.sql'], 0)
+        self.assertEqual(result['qmed.sql'], result['sql.statements'])
+
+    def test_growth_curve(self):
+        analysis = GrowthCurveAnalysis(from_file('floodestimation/tests/data/170021.CD3'), self.gauged_catchments,
+                                       instrument=True)
+        analysis.growth_curve()
+        result = analysis.results_log['instrumentation'].to_dict()
+        for span in ['donors', 'l_moments', 'distribution_fit']:
+            self.assertEqual(1, result['growth_curve.{}.calls'.format(span)])
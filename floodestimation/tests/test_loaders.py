@@ -2,12 +2,19 @@
 
 import unittest
 import os
+import shutil
+import tempfile
+import numpy as np
+from datetime import date
 from urllib.request import pathname2url
 from floodestimation import db
 from floodestimation import loaders
+from floodestimation import parsers
 from floodestimation import settings
-from floodestimation.entities import Catchment
+from floodestimation.entities import Catchment, PotDataset, PotRecord, Point
+from floodestimation.analysis import QmedAnalysis
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker, subqueryload
 
 
 class TestLoaders(unittest.TestCase):
@@ -79,3 +86,214 @@ class TestLoaders(unittest.TestCase):
         self.assertEqual(self.session.query(Catchment).count(), 9)
 
         self.session.rollback()
+
+    def test_catchments_to_db(self):
+        def numbered(catchments, first_id):
+            for catchment_id, catchment in enumerate(catchments, first_id):
+                catchment.id = catchment_id
+                yield catchment
+
+        parser = parsers.XmlCatchmentParser()
+        catchments = (parser.parse('floodestimation/tests/data/NN 04000 48400.xml') for _ in range(5))
+        n = loaders.catchments_to_db(numbered(catchments, 900001), self.session, flush_every=2)
+        self.assertEqual(5, n)
+        self.assertEqual([900001, 900002, 900003, 900004, 900005],
+                         [c.id for c in self.session.query(Catchment).order_by(Catchment.id).all()])
+        self.session.rollback()
+
+
+class TestPackedPotStorage(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.engine = db.create_sqlite_engine(os.path.join(self.folder, 'test.sqlite'))
+        db.Base.metadata.create_all(self.engine)
+        db.migrate_db(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        settings.config['db']['pot_storage'] = 'packed'
+
+    def tearDown(self):
+        settings.config['db']['pot_storage'] = 'rows'
+        self.session.close()
+        self.engine.dispose()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_packed_pot_records(self):
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        expected = [(r.date, r.flow, r.stage) for r in catchment.pot_dataset.pot_records]
+        expected_qmed = QmedAnalysis(catchment).qmed(method='pot_records')
+        loaders.to_db(catchment, self.session, autocommit=True)
+        self.session.close()
+
+        self.assertEqual(self.engine.execute('SELECT COUNT(*) FROM potrecords').scalar(), 0)
+        catchment = self.session.query(Catchment).get(17002)
+        pot_dataset = catchment.pot_dataset
+        self.assertTrue(pot_dataset.is_packed)
+        self.assertEqual(pot_dataset.pot_record_rows, [])
+        self.assertEqual([(r.date, r.flow, r.stage) for r in pot_dataset.pot_records], expected)
+        self.assertIs(pot_dataset.pot_records, pot_dataset.pot_records)  # View is only built once
+
+        dates, flows, stages = pot_dataset.record_arrays()
+        self.assertEqual(dates.dtype, 'datetime64[D]')
+        self.assertEqual(len(flows), 146)
+        self.assertAlmostEqual(QmedAnalysis(catchment).qmed(method='pot_records'), expected_qmed)
+
+    def test_unpack(self):
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        loaders.to_db(catchment, self.session, autocommit=True)
+        pot_dataset = catchment.pot_dataset
+        pot_dataset.pot_records = list(pot_dataset.pot_records) + [PotRecord(date(2015, 1, 1), 100.0, None)]
+        self.session.commit()
+
+        self.assertFalse(pot_dataset.is_packed)
+        self.assertIsNone(pot_dataset.packed_flows)
+        self.assertEqual(self.engine.execute('SELECT COUNT(*) FROM potrecords').scalar(), 147)
+
+    def test_pack_stage_not_available(self):
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        catchment.pot_dataset.pot_records[0].stage = None
+        catchment.pot_dataset.pack()
+        self.assertIsNone(catchment.pot_dataset.pot_records[0].stage)
+
+    def test_pot_records_class_level(self):
+        settings.config['db']['pot_storage'] = 'rows'
+        loaders.to_db(loaders.from_file('floodestimation/tests/data/17002.CD3'), self.session, autocommit=True)
+        self.session.close()
+
+        query = self.session.query(PotDataset)
+        self.assertEqual(query.filter(PotDataset.pot_records.any(PotRecord.flow > 100)).count(), 1)
+        self.assertEqual(query.filter(PotDataset.pot_records.any(PotRecord.flow > 200)).count(), 0)
+        self.assertEqual(query.join(PotDataset.pot_records).filter(PotRecord.date == date(1969, 1, 12)).count(), 1)
+        pot_dataset = query.options(subqueryload(PotDataset.pot_records)).one()
+        with db.assert_max_queries(0):
+            self.assertEqual(len(pot_dataset.pot_records), 146)
+
+    def test_invalid_pot_storage(self):
+        settings.config['db']['pot_storage'] = 'columns'
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        self.assertRaises(ValueError, loaders.to_db, catchment, self.session)
+
+
+class TestPeakFlowSeries(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.engine = db.create_sqlite_engine(os.path.join(self.folder, 'test.sqlite'))
+        db.Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_not_loaded_by_default(self):
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        self.assertIsNone(catchment.peak_flow_series)
+
+    def test_no_csv_file(self):
+        catchment = loaders.from_file('floodestimation/tests/data/170021.CD3', incl_series=True)
+        self.assertIsNone(catchment.peak_flow_series)
+
+    def test_to_db(self):
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3', incl_series=True)
+        expected = catchment.peak_flow_series.arrays()
+        loaders.to_db(catchment, self.session, autocommit=True)
+        self.session.close()
+
+        series = self.session.query(Catchment).get(17002).peak_flow_series
+        self.assertEqual(500, len(series))
+        arrays = series.arrays()
+        self.assertIs(arrays, series.arrays())  # Only decoded once
+        for expected_column, column in zip(expected, arrays):
+            np.testing.assert_array_equal(expected_column, column)
+        self.assertEqual(['2a', 'CEH POT', ''], [arrays.ratings[0], arrays.sources[0], arrays.comments[0]])
+
+    def test_folder_to_db(self):
+        loaders.folder_to_db('floodestimation/tests/data', self.session, incl_series=True, autocommit=True)
+        catchment_ids = [row[0] for row in self.engine.execute('SELECT catchment_id FROM peakflowseries '
+                                                               'ORDER BY catchment_id')]
+        self.assertEqual([17002, 37017, 37020, 201002], catchment_ids)
+
+
+class TestBulkUpdate(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.engine = db.create_sqlite_engine(os.path.join(self.folder, 'test.sqlite'))
+        db.Base.metadata.create_all(self.engine)
+        db.migrate_db(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def count(self, table):
+        return self.engine.execute('SELECT COUNT(*) FROM {}'.format(table)).scalar()
+
+    def test_counts(self):
+        counts = loaders.to_db(loaders.from_file('floodestimation/tests/data/17002.CD3'), self.session,
+                               method='update', autocommit=True)
+        self.assertEqual({'catchments': 1, 'descriptors': 1, 'amaxrecords': 4, 'comments': 4, 'potdatasets': 1,
+                          'potdatagaps': 6, 'potrecords': 146, 'peakflowseries': 0}, counts)
+        self.assertEqual(counts, loaders.to_db(loaders.from_file('floodestimation/tests/data/17002.CD3'),
+                                               self.session, autocommit=True, method='update'))
+        for table, n in counts.items():
+            self.assertEqual(n, self.count(table))
+
+    def test_replace_existing(self):
+        loaders.to_db(loaders.from_file('floodestimation/tests/data/17002.CD3'), self.session, autocommit=True)
+        existing = self.session.query(Catchment).get(17002)
+        self.assertEqual(4, len(existing.amax_records))
+
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        catchment.location = "Dundee"
+        catchment.amax_records = catchment.amax_records[0:2]
+        catchment.pot_dataset = None
+        catchment.descriptors.centroid_ngr = Point(1000, 2000)
+        with db.count_queries(self.engine) as counter:
+            loaders.to_db(catchment, self.session, method='update', autocommit=True)
+        self.assertLess(counter.total, 20)  # Not dependent on the number of rows
+
+        self.assertNotIn(existing, self.session)
+        result = self.session.query(Catchment).get(17002)
+        self.assertEqual("Dundee", result.location)
+        self.assertEqual(2, len(result.amax_records))
+        self.assertIsNone(result.pot_dataset)
+        self.assertEqual(0, self.count('potrecords'))
+        self.assertEqual([(17002, 1000, 2000)], self.engine.execute('SELECT id, min_x, min_y '
+                                                                    'FROM catchment_centroids').fetchall())
+
+    def test_update_pending_catchment(self):
+        loaders.to_db(loaders.from_file('floodestimation/tests/data/17002.CD3'), self.session)
+        loaders.to_db(loaders.from_file('floodestimation/tests/data/17002.CD3'), self.session, method='update')
+        self.session.commit()
+        self.assertEqual(1, self.count('catchments'))
+        self.assertEqual(4, self.count('amaxrecords'))
+
+    def test_rollback(self):
+        loaders.to_db(loaders.from_file('floodestimation/tests/data/17002.CD3'), self.session, autocommit=True)
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        catchment.amax_records = []
+        loaders.to_db(catchment, self.session, method='update')
+        self.session.rollback()
+        self.assertEqual(4, self.count('amaxrecords'))
+
+    def test_default_values(self):
+        catchment = loaders.from_file('floodestimation/tests/data/17002.CD3')
+        catchment.is_suitable_for_qmed = None
+        catchment.amax_records[0].flag = None
+        catchment.amax_records[1].flag = 2
+        loaders.to_db(catchment, self.session, method='update', autocommit=True)
+        self.assertEqual([(0, ), (2, ), (0, ), (2, )],
+                         self.engine.execute('SELECT flag FROM amaxrecords ORDER BY date').fetchall())
+        self.assertFalse(self.session.query(Catchment).get(17002).is_suitable_for_qmed)
+
+    def test_packed_pot_storage(self):
+        settings.config['db']['pot_storage'] = 'packed'
+        try:
+            counts = loaders.to_db(loaders.from_file('floodestimation/tests/data/17002.CD3'), self.session,
+                                   method='update', autocommit=True)
+        finally:
+            settings.config['db']['pot_storage'] = 'rows'
+        self.assertEqual(0, counts['potrecords'])
+        self.assertEqual(146, len(self.session.query(Catchment).get(17002).pot_dataset.pot_records))
@@ -1,4 +1,7 @@
 import unittest
+import io
+import numpy as np
+from numpy.testing import assert_almost_equal
 from datetime import date
 from floodestimation import parsers
 from floodestimation.entities import Catchment, Point
@@ -33,6 +36,55 @@ class TestAmax(unittest.TestCase):
         self.assertIsNone(amax_records[0].stage)
 
 
+class TestAmaxArrays(unittest.TestCase):
+    file = 'floodestimation/tests/data/17002.AM'
+
+    def test_arrays(self):
+        amax = parsers.AmaxParser(output='arrays').parse(self.file)
+        self.assertIsInstance(amax, parsers.AmaxArrays)
+        self.assertEqual('datetime64[D]', str(amax.dates.dtype))
+        self.assertEqual(np.datetime64('1969-01-12'), amax.dates[0])
+        self.assertEqual([1968, 1969, 1970, 1971], amax.water_years.tolist())
+        assert_almost_equal(amax.flows, [34.995, 29.050, 40.641, 28.256])
+        assert_almost_equal(amax.stages, [1.040, 0.970, 1.100, 0.960])
+        self.assertEqual([0, 0, 0, 2], amax.flags.tolist())
+        assert_almost_equal(amax.valid_flows(), [34.995, 29.050, 40.641])
+
+    def test_same_as_records(self):
+        records = parsers.AmaxParser().parse(self.file)
+        amax = parsers.AmaxParser(output='arrays').parse(self.file)
+        self.assertEqual([(r.date, r.water_year, r.flow, r.stage, r.flag) for r in records],
+                         [(r.date, r.water_year, r.flow, r.stage, r.flag) for r in amax.to_records()])
+
+    def test_without_stage(self):
+        amax = parsers.AmaxParser(output='arrays').parse('floodestimation/tests/data/17002-nostage.AM')
+        self.assertTrue(np.isnan(amax.stages[0]))
+
+    def test_invalid_and_rejected(self):
+        s = "[AM Values]\n01 Oct 2001, -1.0, -1.0\n01 Sep 2002, 10.0\n01 Oct 2002, 12.0\n[End]\n" \
+            "[AM Rejected]\n2001,2001\n[End]\n"  # Rejected years section after values
+        amax = parsers.AmaxParser(output='arrays').parse_str(s)
+        self.assertEqual([2001, 2001, 2002], amax.water_years.tolist())
+        self.assertEqual([2, 2, 0], amax.flags.tolist())
+        self.assertTrue(np.isnan(amax.flows[0]))
+        self.assertTrue(np.isnan(amax.stages[0]))
+
+    def test_empty(self):
+        amax = parsers.AmaxParser(output='arrays').parse_str("[AM Values]\n[End]\n")
+        self.assertEqual(0, len(amax.flows))
+        self.assertEqual([], amax.to_records())
+
+    def test_invalid_output(self):
+        with self.assertRaises(ValueError):
+            parsers.AmaxParser(output='foo')
+
+    def test_parser_reused(self):
+        parser = parsers.AmaxParser()
+        parser.parse(self.file)
+        parser.parse('floodestimation/tests/data/17002-nostage.AM')
+        self.assertEqual([1971, 2002, 2003], parser.rejected_years)  # Not accumulated
+
+
 class TestPot(unittest.TestCase):
     parser = parsers.PotParser()
     file = 'floodestimation/tests/data/17002.PT'
@@ -61,6 +113,59 @@ class TestPot(unittest.TestCase):
         self.assertAlmostEqual(self.pot_dataset.pot_data_gaps[0].gap_length(), 21/365)
 
 
+class TestFehFileParser(unittest.TestCase):
+    def test_date(self):
+        self.assertEqual(date(1970, 1, 1), parsers.FehFileParser.parse_feh_date_format('01 Jan 1970'))
+        self.assertEqual(date(1970, 12, 5), parsers.FehFileParser.parse_feh_date_format(' 5 DEC  1970 '))
+
+    def test_date_invalid(self):
+        for s in ['01 Foo 1970', '31 Feb 1970', '1970-01-01', '']:
+            with self.assertRaises(ValueError):
+                parsers.FehFileParser.parse_feh_date_format(s)
+
+    def test_parse_str_sections(self):
+        s = "[STATION NUMBER]\r\n17002\r\n[END]\r\n[Unsupported]\r\nfoo\r\n[End]\r\n" \
+            "[AM Values]\r\n\r\n12 Jan 1969,   34.995,    1.040\r\n[End]\r\nignored\r\n"
+        parser = parsers.AmaxParser()
+        amax_records = parser.parse_str(s)
+        self.assertEqual('17002', parser.station_number)
+        self.assertEqual(1, len(amax_records))
+        self.assertEqual(date(1969, 1, 12), amax_records[0].date)
+        self.assertEqual(1.040, amax_records[0].stage)
+
+    def test_parse_str_equals_parse(self):
+        file = 'floodestimation/tests/data/17002.PT'
+        with open(file, encoding='utf-8') as f:
+            pot_dataset = parsers.PotParser().parse_str(f.read())
+        expected = parsers.PotParser().parse(file)
+        self.assertEqual([(r.date, r.flow, r.stage) for r in expected.pot_records],
+                         [(r.date, r.flow, r.stage) for r in pot_dataset.pot_records])
+
+
+class TestPotArrays(unittest.TestCase):
+    file = 'floodestimation/tests/data/17002.PT'
+
+    def test_arrays(self):
+        pot_dataset = parsers.PotParser(output='arrays').parse(self.file)
+        self.assertTrue(pot_dataset.is_packed)
+        self.assertEqual(17002, pot_dataset.catchment_id)
+        self.assertAlmostEqual(pot_dataset.threshold, 23.809)
+        self.assertEqual(6, len(pot_dataset.pot_data_gaps))
+        dates, flows, stages = pot_dataset.record_arrays()
+        self.assertEqual(146, len(dates))
+        self.assertEqual(np.datetime64('1969-01-12'), dates[0])
+        self.assertAlmostEqual(34.995, flows[0])
+        self.assertAlmostEqual(1.040, stages[0])
+
+    def test_same_as_records(self):
+        expected = parsers.PotParser().parse(self.file)
+        expected.pack()
+        pot_dataset = parsers.PotParser(output='arrays').parse(self.file)
+        self.assertEqual(expected.packed_dates, pot_dataset.packed_dates)
+        self.assertEqual(expected.packed_flows, pot_dataset.packed_flows)
+        self.assertEqual(expected.packed_stages, pot_dataset.packed_stages)
+
+
 class TestCd3(unittest.TestCase):
     parser = parsers.Cd3Parser()
     file = 'floodestimation/tests/data/17002.CD3'
@@ -246,3 +351,109 @@ class TestXmlCatchment(unittest.TestCase):
 """
         catchment = self.parser.parse_str(s)
         self.assertEqual(catchment.descriptors.centroid_ngr, Point(207378, 751487))
+
+
+class TestXmlCatchmentIterparse(unittest.TestCase):
+    file = 'floodestimation/tests/data/NN 04000 48400.xml'
+
+    def export(self, n):
+        # XML export with `n` copies of the test catchment, each with a different centroid
+        with open(self.file, encoding='utf-8') as f:
+            s = f.read()
+        start = s.index('   <CatchmentDescriptors')
+        end = s.index('</FEHCDROMExportedDescriptors>')
+        body = s[start:end]
+        bodies = [body.replace('x="207378"', 'x="{}"'.format(207378 + i)) for i in range(n)]
+        return io.BytesIO((s[:start] + ''.join(bodies) + s[end:]).encode('utf-8'))
+
+    def test_single_catchment(self):
+        catchments = list(parsers.XmlCatchmentParser().iterparse(self.file))
+        self.assertEqual(1, len(catchments))
+        expected = parsers.XmlCatchmentParser().parse(self.file)
+        self.assertEqual(expected.descriptors.centroid_ngr, catchments[0].descriptors.centroid_ngr)
+        self.assertEqual(expected.descriptors.saar, catchments[0].descriptors.saar)
+        self.assertEqual(expected.area, catchments[0].area)
+
+    def test_many_catchments(self):
+        catchments = parsers.XmlCatchmentParser().iterparse(self.export(50))
+        self.assertEqual(list(range(207378, 207428)), [c.descriptors.centroid_ngr.x for c in catchments])
+
+    def test_lazy(self):
+        catchments = parsers.XmlCatchmentParser().iterparse(self.export(3))
+        self.assertEqual(207378, next(catchments).descriptors.centroid_ngr.x)
+
+
+class TestCsvSeries(unittest.TestCase):
+    file = 'floodestimation/tests/data/17002.CSV'
+
+    def test_header(self):
+        parser = parsers.CsvSeriesParser()
+        parser.parse(self.file)
+        self.assertEqual(17002, parser.station_number)
+        self.assertEqual('Leven at Leven', parser.name)
+
+    def test_series(self):
+        series = parsers.CsvSeriesParser().parse(self.file)
+        self.assertEqual(500, len(series.dates))
+        self.assertEqual(np.datetime64('1968-12-22T00:00'), series.dates[0])
+        self.assertEqual(0.85, series.stages[0])
+        self.assertEqual(20.39, series.flows[0])
+        self.assertEqual('2a', series.ratings[0])
+        self.assertEqual('CEH POT', series.sources[0])
+        self.assertEqual('', series.comments[0])
+        self.assertEqual(2, series.amax_only.sum())
+        self.assertTrue(series.amax_only[15])
+
+    def test_chunks(self):
+        expected = parsers.CsvSeriesParser().parse(self.file)
+        chunks = list(parsers.CsvSeriesParser(chunk_size=100).iter_chunks(self.file))
+        self.assertEqual([100] * 5, [len(chunk.dates) for chunk in chunks])
+        series = parsers.PeakFlowArrays.concatenate(chunks)
+        for expected_column, column in zip(expected, series):
+            np.testing.assert_array_equal(expected_column, column)
+
+    def test_parse_str(self):
+        series = parsers.CsvSeriesParser().parse_str('"NAME:","Leven at Leven"\n'
+                                                     '"NUMBER:","17002"\n'
+                                                     '"DATE","STAGE (m)","FLOW (m^3/s)","RATING","SOURCE","COMMENT",'
+                                                     '"AMAX ONLY"\n'
+                                                     '30/01/2012 00:30,,39.20,"1a","Peaks","a, b","AMAX ONLY"\n')
+        self.assertEqual(np.datetime64('2012-01-30T00:30'), series.dates[0])
+        self.assertTrue(np.isnan(series.stages[0]))
+        self.assertEqual('a, b', series.comments[0])
+        self.assertEqual([True], series.amax_only.tolist())
+
+    def test_missing_columns(self):
+        series = parsers.CsvSeriesParser().parse_str('"DATE","S","F"\n01/01/2000 00:00,1.0,2.0\n')
+        self.assertEqual([2.0], series.flows.tolist())
+        self.assertEqual([''], series.ratings.tolist())
+        self.assertEqual([False], series.amax_only.tolist())
+
+    def test_too_few_columns(self):
+        with self.assertRaisesRegex(ValueError, 'Line 3 '):
+            parsers.CsvSeriesParser().parse_str('"DATE","S","F"\n01/01/2000 00:00,1.0,2.0\n01/01/2001 00:00,1.0\n')
+
+    def test_blank_rows(self):
+        s = '"DATE","S","F"\n01/01/2000 00:00,1.0,2.0\n\n,,,,,,\n\n01/01/2001 00:00,1.0,3.0\n\n'
+        series = parsers.CsvSeriesParser(chunk_size=1).parse_str(s)  # Blank chunks between records
+        self.assertEqual([2.0, 3.0], series.flows.tolist())
+
+    def test_empty(self):
+        series = parsers.CsvSeriesParser().parse_str('"NUMBER:","17002"\n"DATE","STAGE (m)"\n')
+        self.assertEqual(0, len(series.dates))
+        self.assertEqual(0, len(series.amax_arrays().flows))
+
+    def test_amax_arrays(self):
+        amax = parsers.CsvSeriesParser().parse(self.file).amax_arrays()
+        expected = parsers.AmaxParser(output='arrays').parse('floodestimation/tests/data/17002.AM')
+        self.assertEqual(expected.water_years.tolist(), amax.water_years[:4].tolist())
+        np.testing.assert_array_equal(expected.dates, amax.dates[:4])
+        assert_almost_equal(expected.flows, amax.flows[:4], decimal=2)
+
+    def test_pot_arrays(self):
+        series = parsers.CsvSeriesParser().parse(self.file)
+        dates, flows, stages = series.pot_arrays()
+        self.assertEqual(498, len(flows))
+        self.assertEqual('datetime64[D]', dates.dtype)
+        dates, flows, stages = series.pot_arrays(threshold=100)
+        self.assertTrue(np.all(flows >= 100))
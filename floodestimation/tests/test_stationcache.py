@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from sqlalchemy.orm import sessionmaker
+from floodestimation import db
+from floodestimation import loaders
+from floodestimation import stationcache
+from floodestimation.entities import Catchment
+from floodestimation.stationcache import StationCache, main
+from floodestimation.instrumentation import Instrumentation
+
+DATA_FOLDER = 'floodestimation/tests/data'
+
+
+class TestStationCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for ext in ['.CD3', '.AM', '.PT']:
+            shutil.copy(os.path.join(DATA_FOLDER, '17002' + ext), self.folder)
+        self.file_path = os.path.join(self.folder, '17002.CD3')
+        self.cache = StationCache(os.path.join(self.folder, 'stations.sqlite'))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def load(self, **kwargs):
+        # Return catchment and whether it was returned from the cache
+        instrumentation = Instrumentation()
+        with instrumentation.span('load'):
+            catchment = self.cache.from_file(self.file_path, **kwargs)
+        return catchment, instrumentation.counters['cache.stations.hit'] == 1
+
+    def assert_same_catchment(self, expected, catchment):
+        self.assertEqual(expected.id, catchment.id)
+        self.assertEqual(expected.location, catchment.location)
+        self.assertEqual(expected.country, catchment.country)
+        self.assertEqual(expected.point, catchment.point)
+        self.assertEqual(expected.descriptors.centroid_ngr, catchment.descriptors.centroid_ngr)
+        self.assertEqual(expected.descriptors.saar, catchment.descriptors.saar)
+        self.assertEqual(expected.is_suitable_for_qmed, catchment.is_suitable_for_qmed)
+        self.assertEqual([(c.title, c.content) for c in expected.comments],
+                         [(c.title, c.content) for c in catchment.comments])
+        self.assertEqual([(r.date, r.water_year, r.flow, r.stage, r.flag) for r in expected.amax_records],
+                         [(r.date, r.water_year, r.flow, r.stage, r.flag) for r in catchment.amax_records])
+        self.assertEqual(expected.pot_dataset.threshold, catchment.pot_dataset.threshold)
+        self.assertEqual([(g.start_date, g.end_date) for g in expected.pot_dataset.pot_data_gaps],
+                         [(g.start_date, g.end_date) for g in catchment.pot_dataset.pot_data_gaps])
+        self.assertEqual([(r.date, r.flow, r.stage) for r in expected.pot_dataset.pot_records],
+                         [(r.date, r.flow, r.stage) for r in catchment.pot_dataset.pot_records])
+
+    def test_same_as_parsed(self):
+        expected = loaders.from_file(self.file_path)
+        catchment, cached = self.load()
+        self.assertFalse(cached)
+        self.assert_same_catchment(expected, catchment)
+        self.assertFalse(catchment.pot_dataset.is_packed)
+
+        catchment, cached = self.load()
+        self.assertTrue(cached)
+        self.assert_same_catchment(expected, catchment)
+        self.assertEqual(1, len(self.cache))
+
+    def test_pot_output(self):
+        self.load()
+        catchment, cached = self.load(pot_output='arrays')
+        self.assertTrue(catchment.pot_dataset.is_packed)
+        catchment, cached = self.load(incl_pot=False)
+        self.assertIsNone(catchment.pot_dataset)
+
+    def test_file_changed(self):
+        self.load()
+        with open(os.path.join(self.folder, '17002.AM'), 'a') as f:
+            f.write('[AM Values]\n01 Jan 2010, 50.0, 1.0\n[END]\n')
+        catchment, cached = self.load()
+        self.assertFalse(cached)
+        self.assertEqual(5, len(catchment.amax_records))
+
+    def test_file_touched(self):
+        self.load()
+        st = os.stat(self.file_path)
+        os.utime(self.file_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        catchment, cached = self.load()
+        self.assertTrue(cached)  # Content unchanged
+
+    def test_files_read_once(self):
+        with mock.patch.object(stationcache, '_read_files', wraps=stationcache._read_files) as read_files:
+            self.load()  # Cold miss: files read once for both parsing and content hash
+            self.assertEqual(1, read_files.call_count)
+            self.load()  # Hit: files not read
+            self.assertEqual(1, read_files.call_count)
+
+    def test_package_version_changed(self):
+        self.load()
+        with mock.patch.object(stationcache, '__version__', '0.0.1'):
+            catchment, cached = self.load()
+            self.assertFalse(cached)
+            catchment, cached = self.load()
+            self.assertTrue(cached)
+        catchment, cached = self.load()
+        self.assertFalse(cached)
+
+    def test_file_added(self):
+        os.remove(os.path.join(self.folder, '17002.PT'))
+        catchment, cached = self.load()
+        self.assertIsNone(catchment.pot_dataset)
+        shutil.copy(os.path.join(DATA_FOLDER, '17002.PT'), self.folder)
+        catchment, cached = self.load()
+        self.assertFalse(cached)
+        self.assertEqual(146, len(catchment.pot_dataset.pot_records))
+
+    def test_invalidate(self):
+        self.load()
+        self.cache.invalidate([self.file_path])
+        self.assertEqual(0, len(self.cache))
+        catchment, cached = self.load()
+        self.assertFalse(cached)
+
+    def test_rebuild(self):
+        self.assertEqual(1, self.cache.rebuild(self.folder))
+        catchment, cached = self.load()
+        self.assertTrue(cached)
+
+    def test_command(self):
+        cache_file = os.path.join(self.folder, 'stations.sqlite')
+        self.assertEqual(0, main(['--file', cache_file, 'rebuild', self.folder]))
+        self.assertEqual(1, len(self.cache))
+        self.assertEqual(0, main(['--file', cache_file, 'invalidate']))
+        self.assertEqual(0, len(self.cache))
+
+    def test_folder_to_db(self):
+        engine = db.create_sqlite_engine(os.path.join(self.folder, 'test.sqlite'))
+        db.Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        try:
+            loaders.folder_to_db(self.folder, session, station_cache=self.cache, autocommit=True)
+            catchment, cached = self.load()
+            self.assertTrue(cached)
+
+            loaders.folder_to_db(self.folder, session, method='update', station_cache=self.cache, autocommit=True)
+            catchment = session.query(Catchment).get(17002)
+            self.assertEqual(4, len(catchment.amax_records))
+            self.assertEqual(146, len(catchment.pot_dataset.pot_records))
+        finally:
+            session.close()
+            engine.dispose()
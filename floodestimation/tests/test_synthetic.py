@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tempfile
+import shutil
+from sqlalchemy.orm import sessionmaker
+from floodestimation import db
+from floodestimation import loaders
+from floodestimation.entities import Catchment
+from floodestimation.synthetic import SyntheticArchive
+
+
+class TestSyntheticArchive(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def test_reproducible(self):
+        catchment1 = SyntheticArchive(seed=1).catchment(5)
+        catchment2 = SyntheticArchive(seed=1).catchment(5)
+        self.assertEqual(catchment1.descriptors.saar, catchment2.descriptors.saar)
+        self.assertEqual([r.flow for r in catchment1.amax_records], [r.flow for r in catchment2.amax_records])
+
+    def test_different_seed(self):
+        catchment1 = SyntheticArchive(seed=1).catchment(5)
+        catchment2 = SyntheticArchive(seed=2).catchment(5)
+        self.assertNotEqual([r.flow for r in catchment1.amax_records], [r.flow for r in catchment2.amax_records])
+
+    def test_first_stations_independent_of_n_stations(self):
+        catchments1 = list(SyntheticArchive(n_stations=3, seed=1).catchments())
+        catchments2 = list(SyntheticArchive(n_stations=10, seed=1).catchments())
+        self.assertEqual([c.descriptors.dtm_area for c in catchments1],
+                         [c.descriptors.dtm_area for c in catchments2[0:3]])
+
+    def test_options(self):
+        archive = SyntheticArchive(n_stations=50, seed=1, record_length=(20, 20), pot_fraction=1, pot_density=10,
+                                   n_clusters=0, first_id=101)
+        catchments = list(archive.catchments())
+        self.assertEqual(list(range(101, 151)), [c.id for c in catchments])
+        for catchment in catchments:
+            self.assertEqual(20, catchment.record_length)
+            self.assertAlmostEqual(20, catchment.pot_dataset.record_length, places=1)
+            self.assertTrue(all(record.flow > catchment.pot_dataset.threshold
+                                for record in catchment.pot_dataset.pot_records))
+            self.assertTrue(0.17 <= catchment.descriptors.bfihost <= 0.97)
+            self.assertTrue(500 <= catchment.descriptors.saar <= 3500)
+
+    def test_clustering(self):
+        archive = SyntheticArchive(n_stations=50, seed=1, n_clusters=1, cluster_spread=10)
+        catchments = list(archive.catchments())
+        dists = [catchments[0].distance_to(c) for c in catchments]
+        self.assertLess(max(dists), 100)
+
+    def test_files(self):
+        folder = os.path.join(self.folder, 'stations')
+        archive = SyntheticArchive(n_stations=5, seed=1, pot_fraction=1)
+        archive.to_folder(folder)
+        self.assertEqual(15, len(os.listdir(folder)))
+
+        expected = archive.catchment(0)
+        result = loaders.from_file(os.path.join(folder, '1000001.CD3'))
+        self.assertEqual(expected.id, result.id)
+        self.assertEqual(expected.watercourse, result.watercourse)
+        self.assertEqual(expected.descriptors.centroid_ngr, result.descriptors.centroid_ngr)
+        self.assertEqual(expected.descriptors.ihdtm_ngr, result.descriptors.ihdtm_ngr)
+        for name in ['dtm_area', 'saar', 'bfihost', 'rmed_1h', 'urbext2000']:
+            self.assertAlmostEqual(getattr(expected.descriptors, name), getattr(result.descriptors, name))
+        self.assertEqual([(r.date, r.flow) for r in expected.amax_records],
+                         [(r.date, r.flow) for r in result.amax_records])
+        self.assertEqual(len(expected.pot_dataset.pot_records), len(result.pot_dataset.pot_records))
+        self.assertEqual(expected.pot_dataset.threshold, result.pot_dataset.threshold)
+
+    def test_sqlite(self):
+        file_path = os.path.join(self.folder, 'synthetic.sqlite')
+        SyntheticArchive(n_stations=20, seed=1).to_sqlite(file_path)
+
+        engine = db.create_sqlite_engine(file_path, read_only=True)
+        session = sessionmaker(bind=engine)()
+        try:
+            self.assertEqual(20, session.query(Catchment).count())
+            self.assertTrue(db.has_centroid_index(engine))
+        finally:
+            session.close()
+            engine.dispose()
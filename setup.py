@@ -9,6 +9,16 @@ setup(
         'floodestimation': ['fehdata.json',
                             'config.ini'],
     },
+    entry_points={
+        'console_scripts': ['floodestimation-batch = floodestimation.batch:main',
+                            'floodestimation-station-cache = floodestimation.stationcache:main'],
+    },
+    python_requires='>=3.7',
+    install_requires=['appdirs>=1.4,<1.5',
+                      'sqlalchemy>=1.3,<1.4',
+                      'numpy>=1.17',
+                      'scipy>=0.16',
+                      'lmoments3>=1.0.2'],
     zip_safe=False,
     version=versioneer.get_version(),
     cmdclass=versioneer.get_cmdclass()